@@ -0,0 +1,263 @@
+"""
+Transactional outbox for product activation after a Stripe payment
+The transition to paid and the activation job are written by the same
+single-document update on ``payment_transactions`` (the ``activation``
+sub-document), so a paid transaction always has exactly one job and the
+checkout poll never waits for activation work
+
+Job lifecycle (``activation.state``):
+    pending -> running (leased by one worker) -> done
+                       -> pending again with backoff on error
+                       -> failed after ACTIVATION_MAX_ATTEMPTS (errors or expired leases)
+
+Activation writes are idempotent, keyed by the transaction id, so a job that
+runs twice (expired lease, crash after the write) has no extra effect
+
+Usage:
+    python activation_outbox.py run      # drain due jobs once
+    python activation_outbox.py retry    # requeue failed jobs
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from auth import invalidate_principal
+from background import PeriodicTask
+from database import database
+from payment_models import AnalyticsSubscription, CorporatePlan, CourseEnrollment, PRODUCT_PACKAGES
+
+logger = logging.getLogger(__name__)
+
+ACTIVATION_POLL_SECONDS = float(os.environ.get("ACTIVATION_POLL_SECONDS", "10"))
+ACTIVATION_LEASE_SECONDS = float(os.environ.get("ACTIVATION_LEASE_SECONDS", "60"))
+ACTIVATION_MAX_ATTEMPTS = int(os.environ.get("ACTIVATION_MAX_ATTEMPTS", "8"))
+ACTIVATION_BACKOFF_SECONDS = float(os.environ.get("ACTIVATION_BACKOFF_SECONDS", "5"))
+ACTIVATION_MAX_BACKOFF_SECONDS = float(os.environ.get("ACTIVATION_MAX_BACKOFF_SECONDS", "1800"))
+# Jobs handled per run; the rest waits for the next tick
+ACTIVATION_BATCH_SIZE = int(os.environ.get("ACTIVATION_BATCH_SIZE", "50"))
+
+
+def new_activation_job(now: datetime) -> Dict[str, Any]:
+    """Outbox entry stored together with the paid transition"""
+    return {"state": "pending", "attempts": 0, "next_attempt_at": now, "enqueued_at": now}
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff with full jitter"""
+    ceiling = min(ACTIVATION_MAX_BACKOFF_SECONDS, ACTIVATION_BACKOFF_SECONDS * 2 ** max(0, attempts - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+async def _upsert_by_transaction(collection, transaction_id: str, document: Dict[str, Any]) -> None:
+    # Unique index on payment_transaction_id makes concurrent duplicates fail instead of inserting twice
+    await collection.update_one(
+        {"payment_transaction_id": transaction_id},
+        {"$setOnInsert": document},
+        upsert=True,
+    )
+
+
+async def activate_product(db: AsyncIOMotorDatabase, transaction: Dict[str, Any]) -> None:
+    """Grant what the transaction paid for; safe to run more than once"""
+    product_type = transaction["product_type"]
+    product_id = transaction["product_id"]
+    user_id = transaction["user_id"]
+    # Periods start at payment time, so re-running yields the same dates
+    paid_at = transaction.get("paid_at") or transaction["updated_at"]
+
+    if product_type == "premium_subscription":
+        days = 365 if "annual" in product_id else 30
+        await db.users.update_one(
+            {"id": user_id},
+            {"$set": {
+                "is_premium": True,
+                "subscription_expires": paid_at + timedelta(days=days),
+                "subscription_type": product_id,
+            }}
+        )
+        await invalidate_principal(db, user_id)
+
+    elif product_type == "course":
+        enrollment = CourseEnrollment(
+            user_id=user_id,
+            course_id=product_id,
+            payment_transaction_id=transaction["id"],
+            enrolled_at=paid_at,
+        )
+        await _upsert_by_transaction(db.course_enrollments, transaction["id"], enrollment.dict())
+
+    elif product_type == "corporate":
+        corporate_plan = CorporatePlan(
+            company_name=transaction["metadata"].get("company_name", ""),
+            contact_email=transaction["metadata"].get("contact_email", ""),
+            contact_name=transaction["metadata"].get("contact_name", ""),
+            plan_type=product_id,
+            max_users=PRODUCT_PACKAGES[product_id].max_users,
+            monthly_price=PRODUCT_PACKAGES[product_id].price,
+            features=PRODUCT_PACKAGES[product_id].features,
+            payment_transaction_id=transaction["id"],
+            expires_at=paid_at + timedelta(days=30),
+        )
+        await _upsert_by_transaction(db.corporate_plans, transaction["id"], corporate_plan.dict())
+
+    elif product_type == "analytics":
+        analytics_sub = AnalyticsSubscription(
+            company_name=transaction["metadata"].get("company_name", ""),
+            contact_email=transaction["metadata"].get("contact_email", ""),
+            contact_name=transaction["metadata"].get("contact_name", ""),
+            plan_type=product_id,
+            monthly_price=PRODUCT_PACKAGES[product_id].price,
+            data_access_level="basic" if "basic" in product_id else "advanced" if "professional" in product_id else "full",
+            api_calls_limit=1000 if "basic" in product_id else 5000 if "professional" in product_id else 999999,
+            payment_transaction_id=transaction["id"],
+            expires_at=paid_at + timedelta(days=30),
+        )
+        await _upsert_by_transaction(db.analytics_subscriptions, transaction["id"], analytics_sub.dict())
+
+    else:
+        raise ValueError(f"Unknown product type: {product_type}")
+
+
+class ActivationWorker:
+    """Claims due activation jobs with a lease and applies them"""
+
+    def __init__(self, batch_size: int = ACTIVATION_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.owner = str(uuid.uuid4())
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def fail_abandoned(self, db: AsyncIOMotorDatabase) -> int:
+        """Dead-letter jobs whose lease expired on their last allowed attempt (worker hung or crashed)"""
+        result = await db.payment_transactions.update_many(
+            {
+                "activation.state": "running",
+                "activation.lease_until": {"$lt": datetime.utcnow()},
+                "activation.attempts": {"$gte": ACTIVATION_MAX_ATTEMPTS},
+            },
+            {"$set": {"activation.state": "failed",
+                      "activation.last_error": "Lease expired on the last attempt"},
+             "$unset": {"activation.lease_owner": "", "activation.lease_until": ""}},
+        )
+        if result.modified_count:
+            self.failed += result.modified_count
+            logger.error(f"{result.modified_count} activation jobs failed: lease expired after {ACTIVATION_MAX_ATTEMPTS} attempts")
+        return result.modified_count
+
+    async def claim(self, db: AsyncIOMotorDatabase) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        # attempts counts claims, so a job whose lease keeps expiring still runs out of attempts
+        return await db.payment_transactions.find_one_and_update(
+            {"activation.attempts": {"$lt": ACTIVATION_MAX_ATTEMPTS}, "$or": [
+                {"activation.state": "pending", "activation.next_attempt_at": {"$lte": now}},
+                # A worker died mid-job: its lease expired
+                {"activation.state": "running", "activation.lease_until": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "activation.state": "running",
+                    "activation.lease_owner": self.owner,
+                    "activation.lease_until": now + timedelta(seconds=ACTIVATION_LEASE_SECONDS),
+                },
+                "$inc": {"activation.attempts": 1},
+            },
+            sort=[("activation.next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def process(self, db: AsyncIOMotorDatabase, transaction: Dict[str, Any]) -> None:
+        lease = {"session_id": transaction["session_id"], "activation.lease_owner": self.owner}
+        try:
+            await activate_product(db, transaction)
+        except Exception as e:
+            attempts = transaction["activation"]["attempts"]
+            if attempts >= ACTIVATION_MAX_ATTEMPTS:
+                self.failed += 1
+                state = {"activation.state": "failed"}
+                logger.error(f"Activation for transaction {transaction['id']} failed after {attempts} attempts: {str(e)}")
+            else:
+                self.retried += 1
+                state = {
+                    "activation.state": "pending",
+                    "activation.next_attempt_at": datetime.utcnow() + timedelta(seconds=backoff_seconds(attempts)),
+                }
+                logger.warning(f"Activation for transaction {transaction['id']} failed (attempt {attempts}): {str(e)}")
+            await db.payment_transactions.update_one(
+                lease,
+                {"$set": {**state, "activation.last_error": str(e)},
+                 "$unset": {"activation.lease_owner": "", "activation.lease_until": ""}},
+            )
+            return
+
+        await db.payment_transactions.update_one(
+            lease,
+            {"$set": {"activation.state": "done", "activation.completed_at": datetime.utcnow()},
+             "$unset": {"activation.lease_owner": "", "activation.lease_until": "", "activation.last_error": ""}},
+        )
+        self.completed += 1
+
+    async def run(self, db: Optional[AsyncIOMotorDatabase] = None) -> int:
+        db = db if db is not None else database.get_db()
+        await self.fail_abandoned(db)
+        processed = 0
+        while processed < self.batch_size:
+            transaction = await self.claim(db)
+            if transaction is None:
+                break
+            await self.process(db, transaction)
+            processed += 1
+        if processed == self.batch_size:
+            # More jobs are probably due: run again without waiting for the interval
+            activation_task.wake()
+        return processed
+
+    def stats(self) -> dict:
+        return {
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+activation_worker = ActivationWorker()
+activation_task = PeriodicTask("product_activation", ACTIVATION_POLL_SECONDS, activation_worker.run)
+
+
+async def retry_failed(db: AsyncIOMotorDatabase) -> int:
+    """Requeue dead-lettered jobs (e.g. after fixing the cause)"""
+    result = await db.payment_transactions.update_many(
+        {"activation.state": "failed"},
+        {"$set": {"activation.state": "pending", "activation.attempts": 0,
+                  "activation.next_attempt_at": datetime.utcnow()}},
+    )
+    return result.modified_count
+
+
+async def main(command: str) -> None:
+    db = database.get_db()
+    try:
+        if command == "run":
+            worker = ActivationWorker(batch_size=10**9)
+            processed = await worker.run(db)
+            print(f"✅ {processed} activation jobs processed: {worker.stats()}")
+        elif command == "retry":
+            print(f"✅ {await retry_failed(db)} failed activation jobs requeued")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Product activation outbox")
+    parser.add_argument("command", choices=["run", "retry"])
+    args = parser.parse_args()
+    asyncio.run(main(args.command))
@@ -1,121 +1,190 @@
 from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import os
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
-from bson import ObjectId
-from .auth import get_current_user
-from .models import User
+from typing import List, Dict, Any, Optional
+from database import database, get_database
+from catalog import catalog
+from complaint_stats import most_used_technique, top_complaints
+from rollups import series, totals
+from response_cache import (
+    COMMUNITY_COUNTS_POLICY, COMMUNITY_TRENDS_POLICY, DATA_AVAILABILITY_POLICY, response_cache
+)
 
-router = APIRouter()
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+COMMUNITY_COUNTS_REFRESH_SECONDS = float(os.environ.get("COMMUNITY_COUNTS_REFRESH_SECONDS", "60"))
+ACTIVE_USER_DAYS = 30
+MINIMUM_USERS = 100
+MINIMUM_SESSIONS = 1000
+
+# Contagens da comunidade, recalculadas periodicamente (nunca no caminho da requisição)
+community_counts: Dict[str, Any] = {}
+
+async def refresh_community_counts(db: Optional[AsyncIOMotorDatabase] = None) -> Dict[str, Any]:
+    """
+    Contagens baratas: estimated_document_count (metadados da coleção) e
+    contadores mantidos na escrita (user_stats, rollups, technique_totals)
+    """
+    db = db if db is not None else database.get_db()
+    now = datetime.utcnow()
+    total_users, total_sessions, active_users, session_totals, top_technique = await asyncio.gather(
+        db.users.estimated_document_count(),
+        db.sessions.estimated_document_count(),
+        db.user_stats.count_documents({"last_session_at": {"$gte": now - timedelta(days=ACTIVE_USER_DAYS)}}),
+        totals(db, "sessions", datetime(1970, 1, 1), now),
+        most_used_technique(db)
+    )
+    
+    most_used = None
+    if top_technique:
+        technique = (await catalog.get_snapshot(db)).get(top_technique["_id"])
+        most_used = technique.name if technique else None
+    
+    average_duration = session_totals.get("duration", 0) / session_totals["count"] if session_totals["count"] else 0.0
+    community_counts.update({
+        "totalUsers": total_users,
+        "totalSessions": total_sessions,
+        "activeUsers": active_users,
+        "averageSessionDuration": round(average_duration / 60, 1),  # minutos
+        "mostUsedTechnique": most_used,
+        "lastUpdated": now.isoformat()
+    })
+    return community_counts
+
+async def get_community_counts(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    # Só calcula aqui antes da primeira execução da tarefa periódica
+    if not community_counts:
+        await response_cache.get("analytics:community-counts", lambda: refresh_community_counts(db), COMMUNITY_COUNTS_POLICY)
+    return community_counts
+
+async def compute_community_trends(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    counts, complaints = await asyncio.gather(get_community_counts(db), top_complaints(db, limit=8))
+    
+    result = {
+        "commonComplaints": [
+            {"id": i, "complaint": c["complaint"], "count": c["count"], "trending": c["trending"]}
+            for i, c in enumerate(complaints, start=1)
+        ],
+        "totalUsers": counts["totalUsers"],
+        "isRealData": True,
+        "lastUpdated": datetime.utcnow().isoformat()
+    }
+    if counts["totalUsers"] < MINIMUM_USERS:
+        result["message"] = f"Dados insuficientes. Mínimo de {MINIMUM_USERS} usuários necessário."
+    return result
 
 # Endpoint para obter tendências da comunidade (dados reais)
 @router.get("/community-trends")
-async def get_community_trends():
+async def get_community_trends(db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Retorna tendências da comunidade baseadas em dados reais
-    Será implementado quando houver usuários suficientes
     """
     try:
-        # TODO: Implementar quando houver pelo menos 100 usuários
-        # Por enquanto, retorna estrutura preparada
-        
-        # Simulação de consulta ao banco:
-        # complaints_data = await db.sessions.aggregate([
-        #     {"$group": {"_id": "$complaint", "count": {"$sum": 1}}},
-        #     {"$sort": {"count": -1}},
-        #     {"$limit": 10}
-        # ]).to_list(length=None)
-        
-        return {
-            "commonComplaints": [
-                {"id": 1, "complaint": "Dor de cabeça tensional", "count": 0, "trending": False},
-                {"id": 2, "complaint": "Ansiedade e stress", "count": 0, "trending": False},
-                {"id": 3, "complaint": "Dor nas costas", "count": 0, "trending": False},
-                {"id": 4, "complaint": "Insônia", "count": 0, "trending": False},
-                {"id": 5, "complaint": "Fadiga mental", "count": 0, "trending": False},
-                {"id": 6, "complaint": "Problemas digestivos", "count": 0, "trending": False},
-                {"id": 7, "complaint": "Enxaqueca", "count": 0, "trending": False},
-                {"id": 8, "complaint": "Baixa imunidade", "count": 0, "trending": False}
-            ],
-            "totalUsers": 0,
-            "isRealData": True,
-            "lastUpdated": datetime.utcnow().isoformat(),
-            "message": "Dados insuficientes. Mínimo de 100 usuários necessário."
-        }
+        return await response_cache.get(
+            "analytics:community-trends",
+            lambda: compute_community_trends(db),
+            COMMUNITY_TRENDS_POLICY
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao obter tendências: {str(e)}")
 
 # Endpoint para obter estatísticas gerais de usuários
 @router.get("/user-stats")
-async def get_user_stats():
+async def get_user_stats(db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Retorna estatísticas gerais de usuários
     """
     try:
-        # TODO: Implementar consulta real ao banco
-        # user_count = await db.users.count_documents({})
-        # sessions_count = await db.sessions.count_documents({})
-        # active_users = await db.users.count_documents({
-        #     "last_login": {"$gte": datetime.utcnow() - timedelta(days=30)}
-        # })
-        
-        return {
-            "totalUsers": 0,
-            "totalSessions": 0,
-            "activeUsers": 0,
-            "averageSessionDuration": 0.0,
-            "mostUsedTechnique": None,
-            "lastUpdated": datetime.utcnow().isoformat()
-        }
+        return dict(await get_community_counts(db))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao obter estatísticas: {str(e)}")
 
 # Endpoint para obter estatísticas detalhadas (quando houver dados)
 @router.get("/general-stats")
-async def get_general_stats():
+async def get_general_stats(db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Retorna estatísticas detalhadas para analytics
+    Lidas dos rollups (custo proporcional ao número de buckets, não de eventos)
     """
     try:
-        # TODO: Implementar quando houver dados suficientes
-        # weekly_stats = await db.sessions.aggregate([
-        #     {"$match": {"created_at": {"$gte": datetime.utcnow() - timedelta(days=7)}}},
-        #     {"$group": {"_id": {"$dayOfWeek": "$created_at"}, "count": {"$sum": 1}}}
-        # ]).to_list(length=None)
+        now = datetime.utcnow()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        # Primeiro dia do mês, 11 meses atrás (12 meses incluindo o atual)
+        year_start = (today.replace(day=1) - timedelta(days=330)).replace(day=1)
+        
+        async def period_stats(start: datetime, granularity: str) -> List[Dict[str, Any]]:
+            sessions, reviews, registrations = await asyncio.gather(
+                series(db, "sessions", start, now, granularity),
+                series(db, "reviews", start, now, granularity),
+                series(db, "registrations", start, now, granularity)
+            )
+            return [
+                {
+                    "date": s["period"].strftime("%Y-%m-%d"),
+                    "sessions": s["count"],
+                    "minutesPracticed": round(s.get("duration", 0) / 60, 1),
+                    "reviews": r["count"],
+                    "averageRating": round(r.get("rating", 0) / r["count"], 2) if r["count"] else 0,
+                    "newUsers": u["count"]
+                }
+                for s, r, u in zip(sessions, reviews, registrations)
+            ]
+        
+        daily_stats = await period_stats(today - timedelta(days=29), "day")
+        weekly_stats = await period_stats(today - timedelta(weeks=11), "week")
+        monthly_stats = await period_stats(year_start, "month")
+        
+        # Crescimento de usuários: novos por mês + total acumulado
+        total_users = (await totals(db, "registrations", datetime(1970, 1, 1), year_start))["count"]
+        user_growth = []
+        for month in await series(db, "registrations", year_start, now, "month"):
+            total_users += month["count"]
+            user_growth.append({
+                "date": month["period"].strftime("%Y-%m"),
+                "newUsers": month["count"],
+                "totalUsers": total_users
+            })
         
         return {
-            "dailyStats": [],
-            "weeklyStats": [],
-            "monthlyStats": [],
+            "dailyStats": daily_stats,
+            "weeklyStats": weekly_stats,
+            "monthlyStats": monthly_stats,
             "topTechniques": [],
-            "userGrowth": [],
+            "userGrowth": user_growth,
             "isRealData": True,
-            "lastUpdated": datetime.utcnow().isoformat()
+            "lastUpdated": now.isoformat()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao obter estatísticas gerais: {str(e)}")
 
+async def compute_data_availability(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    counts = await get_community_counts(db)
+    user_count = counts["totalUsers"]
+    session_count = counts["totalSessions"]
+    
+    return {
+        "hasEnoughUsers": user_count >= MINIMUM_USERS,
+        "hasEnoughSessions": session_count >= MINIMUM_SESSIONS,
+        "currentUsers": user_count,
+        "currentSessions": session_count,
+        "minimumUsers": MINIMUM_USERS,
+        "minimumSessions": MINIMUM_SESSIONS,
+        "canShowRealData": user_count >= MINIMUM_USERS and session_count >= MINIMUM_SESSIONS
+    }
+
 # Endpoint para verificar se há dados suficientes
 @router.get("/data-availability")
-async def check_data_availability():
+async def check_data_availability(db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Verifica se há dados suficientes para estatísticas reais
     """
     try:
-        # TODO: Implementar contagem real
-        # user_count = await db.users.count_documents({})
-        # session_count = await db.sessions.count_documents({})
-        
-        user_count = 0
-        session_count = 0
-        
-        return {
-            "hasEnoughUsers": user_count >= 100,
-            "hasEnoughSessions": session_count >= 1000,
-            "currentUsers": user_count,
-            "currentSessions": session_count,
-            "minimumUsers": 100,
-            "minimumSessions": 1000,
-            "canShowRealData": user_count >= 100 and session_count >= 1000
-        }
+        return await response_cache.get(
+            "analytics:data-availability",
+            lambda: compute_data_availability(db),
+            DATA_AVAILABILITY_POLICY
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao verificar disponibilidade: {str(e)}")
\ No newline at end of file
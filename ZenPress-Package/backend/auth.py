@@ -1,12 +1,18 @@
 import os
 import jwt
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
+from bson import ObjectId
 from passlib.context import CryptContext
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from models import User, UserResponse
+from database import get_database
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -15,6 +21,10 @@ load_dotenv()
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Password hashing pool settings
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+
 # JWT settings
 SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
@@ -23,11 +33,161 @@ ACCESS_TOKEN_EXPIRE_HOURS = 24
 # Security scheme
 security = HTTPBearer()
 
-# Get database connection directly
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-db_name = os.environ.get('DB_NAME', 'test_database')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
+# Comma-separated e-mails allowed on admin endpoints (metrics, exports)
+ADMIN_EMAILS = frozenset(
+    email.strip().lower()
+    for email in os.environ.get("ADMIN_EMAILS", "").split(",")
+    if email.strip()
+)
+
+# Principal cache settings
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+# How often each process reads the invalidations published by the others
+PRINCIPAL_SYNC_SECONDS = float(os.environ.get("PRINCIPAL_SYNC_SECONDS", "1"))
+# Invalidations are re-read for this long, since ObjectIds from different
+# processes are not inserted in order within the same second
+PRINCIPAL_SYNC_OVERLAP_SECONDS = 5
+PRINCIPAL_INVALIDATION_RETENTION_SECONDS = 3600
+
+class PrincipalCache:
+    """Bounded LRU cache of authenticated principals with a per-entry TTL.
+
+    Entries are keyed by user id. Anything that changes a user's premium
+    state must call ``invalidate_principal``, which drops the entry here and
+    publishes the user id in ``principal_invalidations``; every process
+    applies those entries in ``sync`` before serving from its cache, so a
+    premium change is visible everywhere within ``sync_interval`` seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, sync_interval: float = PRINCIPAL_SYNC_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+        self.syncs = 0
+        # Bumped on every invalidation so a load that raced with one is not cached
+        self.generation = 0
+        self._synced_at: Optional[float] = None
+        self._sync_from: Optional[datetime] = None
+        self._seen: dict = {}
+        self._sync_lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, user_id: str) -> Optional[UserResponse]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, principal = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return principal
+
+    def set(self, user_id: str, principal: UserResponse, generation: Optional[int] = None) -> None:
+        if not self.enabled:
+            return
+        if generation is not None and generation != self.generation:
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl, principal)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: str) -> None:
+        self.generation += 1
+        if self._entries.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def sync(self, db: AsyncIOMotorDatabase) -> None:
+        """Apply the invalidations other processes published since the last sync"""
+        if not self.enabled or self._is_synced():
+            return
+        async with self._sync_lock:
+            if self._is_synced():
+                return
+            now = datetime.utcnow()
+            since = (self._sync_from or now) - timedelta(seconds=PRINCIPAL_SYNC_OVERLAP_SECONDS)
+            cursor = db.principal_invalidations.find(
+                {"_id": {"$gte": ObjectId.from_datetime(since)}}, {"user_id": 1}
+            )
+            async for entry in cursor:
+                if entry["_id"] in self._seen:
+                    continue
+                self._seen[entry["_id"]] = now
+                self.remote_invalidations += 1
+                self.invalidate(entry["user_id"])
+            self._seen = {
+                entry_id: seen_at for entry_id, seen_at in self._seen.items()
+                if seen_at > since
+            }
+            self._sync_from = now
+            self._synced_at = time.monotonic()
+            self.syncs += 1
+
+    def _is_synced(self) -> bool:
+        return self._synced_at is not None and time.monotonic() - self._synced_at < self.sync_interval
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "sync_seconds": self.sync_interval,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "remote_invalidations": self.remote_invalidations,
+            "syncs": self.syncs,
+        }
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+
+async def invalidate_principal(db: AsyncIOMotorDatabase, *user_ids: str) -> None:
+    """Drop cached principals after their premium state changed, in every process"""
+    if not user_ids:
+        return
+    for user_id in user_ids:
+        principal_cache.invalidate(user_id)
+    now = datetime.utcnow()
+    await db.principal_invalidations.insert_many(
+        [{"user_id": user_id, "created_at": now} for user_id in user_ids]
+    )
+
+async def load_principal(db: AsyncIOMotorDatabase, user_id: str) -> Optional[UserResponse]:
+    """Return the principal for a user id, using the cache when possible"""
+    await principal_cache.sync(db)
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    generation = principal_cache.generation
+    user = await db.users.find_one({"id": user_id})
+    if user is None:
+        return None
+
+    principal = UserResponse(**user)
+    principal_cache.set(user_id, principal, generation)
+    return principal
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -35,6 +195,91 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+def _timed_call(fn, args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, started, time.perf_counter()
+
+class PasswordHashingPool:
+    """Dedicated executor for bcrypt work with a bounded admission queue.
+
+    bcrypt releases the GIL, so hashing on worker threads keeps the event
+    loop responsive. Once ``workers + queue_limit`` calls are in flight new
+    calls are rejected with a 429 instead of piling up behind the pool.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = max(1, workers)
+        self.queue_limit = max(0, queue_limit)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="password-hash"
+        )
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_hash_seconds = 0.0
+        self.max_hash_seconds = 0.0
+        self.total_wait_seconds = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    async def run(self, fn, *args):
+        if self.in_flight >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many authentication requests, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        submitted = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started, finished = await loop.run_in_executor(
+                self._executor, _timed_call, fn, args
+            )
+        finally:
+            self.in_flight -= 1
+
+        hash_seconds = finished - started
+        self.completed += 1
+        self.total_hash_seconds += hash_seconds
+        self.max_hash_seconds = max(self.max_hash_seconds, hash_seconds)
+        self.total_wait_seconds += max(0.0, started - submitted)
+        return result
+
+    def stats(self) -> dict:
+        completed = self.completed or 1
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_in_flight": self.max_in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_hash_ms": round(self.total_hash_seconds / completed * 1000, 2),
+            "max_hash_ms": round(self.max_hash_seconds * 1000, 2),
+            "avg_wait_ms": round(self.total_wait_seconds / completed * 1000, 2),
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+password_hashing_pool = PasswordHashingPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_LIMIT)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hashing_pool.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hashing_pool.run(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     if expires_delta:
@@ -46,7 +291,10 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserResponse:
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+) -> UserResponse:
     try:
         token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -64,7 +312,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = await db.users.find_one({"id": user_id})
+    user = await load_principal(db, user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -72,9 +320,12 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    return UserResponse(**user)
+    return user
 
-async def get_current_user_optional(credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))) -> Optional[UserResponse]:
+async def get_current_user_optional(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+) -> Optional[UserResponse]:
     """Get current user if authenticated, return None if not"""
     if not credentials:
         return None
@@ -88,13 +339,12 @@ async def get_current_user_optional(credentials: Optional[HTTPAuthorizationCrede
     except jwt.PyJWTError:
         return None
     
-    user = await db.users.find_one({"id": user_id})
-    if user is None:
-        return None
-    
-    return UserResponse(**user)
+    return await load_principal(db, user_id)
 
-async def get_premium_user(current_user: UserResponse = Depends(get_current_user)) -> UserResponse:
+async def get_premium_user(
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+) -> UserResponse:
     if not current_user.is_premium:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -108,6 +358,7 @@ async def get_premium_user(current_user: UserResponse = Depends(get_current_user
             {"id": current_user.id},
             {"$set": {"is_premium": False, "subscription_expires": None}}
         )
+        await invalidate_principal(db, current_user.id)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Premium subscription expired"
@@ -115,10 +366,21 @@ async def get_premium_user(current_user: UserResponse = Depends(get_current_user
     
     return current_user
 
-async def authenticate_user(email: str, password: str):
+async def get_admin_user(
+    current_user: UserResponse = Depends(get_current_user)
+) -> UserResponse:
+    """Allow only the accounts listed in ADMIN_EMAILS (nobody when unset)"""
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
+
+async def authenticate_user(db: AsyncIOMotorDatabase, email: str, password: str):
     user = await db.users.find_one({"email": email})
     if not user:
         return False
-    if not verify_password(password, user["password_hash"]):
+    if not await verify_password_async(password, user["password_hash"]):
         return False
     return user
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+Tarefas periódicas em background para ZenPress
+Executadas dentro do lifespan da aplicação (uma instância por worker)
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Executa uma corrotina a cada ``interval`` segundos até ser parada"""
+
+    def __init__(self, name: str, interval: float, func: Callable[[], Awaitable[None]]):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.runs = 0
+        self.failures = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_duration_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    def wake(self) -> None:
+        """Antecipa a próxima execução (ex: logo após enfileirar trabalho)"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self) -> None:
+        started = time.perf_counter()
+        try:
+            await self.func()
+            self.last_error = None
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error(f"Erro na tarefa {self.name}: {str(e)}")
+        finally:
+            self.runs += 1
+            self.last_run_at = datetime.utcnow()
+            self.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    async def _run(self) -> None:
+        while True:
+            await self.run_once()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval,
+            "running": self._task is not None,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_duration_ms": self.last_duration_ms,
+            "last_error": self.last_error,
+        }
+
+
+class BackgroundTasks:
+    """Registro das tarefas periódicas iniciadas/paradas pelo lifespan"""
+
+    def __init__(self):
+        self.tasks: Dict[str, PeriodicTask] = {}
+
+    def register(self, task: PeriodicTask) -> PeriodicTask:
+        self.tasks[task.name] = task
+        return task
+
+    def start_all(self) -> None:
+        for task in self.tasks.values():
+            task.start()
+
+    async def stop_all(self) -> None:
+        for task in self.tasks.values():
+            await task.stop()
+
+    def stats(self) -> dict:
+        return {name: task.stats() for name, task in self.tasks.items()}
+
+
+background_tasks = BackgroundTasks()
@@ -0,0 +1,102 @@
+"""
+Benchmark do dashboard de /reviews/analytics
+Compara a passada única (DeveloperAnalyticsAccumulator) com o algoritmo
+anterior, que filtrava a lista inteira para cada dia e para cada técnica
+
+Uso:
+    python bench_review_analytics.py                      # 10k, 100k e 1M avaliações
+    python bench_review_analytics.py --sizes 10000 --days 90
+    python bench_review_analytics.py --legacy-max 100000  # limite para o algoritmo anterior
+
+Mede apenas o processamento em memória; o tempo de leitura do cursor do
+MongoDB é proporcional ao número de avaliações nos dois casos.
+"""
+
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from reviews_analytics import DeveloperAnalyticsAccumulator, ReviewResponse
+
+TECHNIQUES = [SimpleNamespace(id=str(i), name=f"Técnica {i}") for i in range(1, 41)]
+
+
+def generate_reviews(count: int, days: int, now: datetime) -> List[Dict[str, Any]]:
+    rng = random.Random(count)
+    span = days * 86400
+    reviews = [
+        {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "user_id": f"user-{rng.randrange(count // 10 + 1)}",
+            "technique_id": rng.choice(TECHNIQUES).id,
+            "technique_name": "",
+            "rating": rng.choices((1, 2, 3, 4, 5), weights=(1, 1, 2, 4, 6))[0],
+            "comment": "",
+            "session_duration": 60,
+            "created_at": now - timedelta(seconds=rng.randrange(span)),
+        }
+        for _ in range(count)
+    ]
+    # Mesma ordem entregue pelo cursor (created_at decrescente)
+    reviews.sort(key=lambda r: r["created_at"], reverse=True)
+    return reviews
+
+
+def single_pass(reviews: List[Dict[str, Any]], start_date: datetime, days: int) -> None:
+    accumulator = DeveloperAnalyticsAccumulator(start_date, days)
+    for review in reviews:
+        accumulator.add(review)
+    accumulator.daily_reviews()
+    accumulator.technique_rankings(TECHNIQUES)
+    accumulator.recent_feedback()
+    accumulator.most_common_rating()
+
+
+def legacy(reviews: List[Dict[str, Any]], start_date: datetime, days: int) -> None:
+    for i in range(days):
+        day_start = (start_date + timedelta(days=i)).replace(hour=0, minute=0, second=0, microsecond=0)
+        day_end = day_start + timedelta(days=1)
+        day_reviews = [r for r in reviews if day_start <= r["created_at"] < day_end]
+        len([r for r in day_reviews if r["rating"] >= 4])
+        len([r for r in day_reviews if r["rating"] <= 2])
+    for technique in TECHNIQUES:
+        tech_reviews = [r for r in reviews if r["technique_id"] == technique.id]
+        if tech_reviews:
+            latest = sorted(tech_reviews, key=lambda x: x["created_at"], reverse=True)[:3]
+            [ReviewResponse(**review) for review in latest]
+    [ReviewResponse(**r) for r in sorted(reviews, key=lambda x: x["created_at"], reverse=True)[:10]]
+    ratings = [r["rating"] for r in reviews]
+    max(set(ratings), key=ratings.count)
+
+
+def measure(func, *args) -> float:
+    started = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - started) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de /reviews/analytics")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--legacy-max", type=int, default=100_000,
+                        help="maior volume executado com o algoritmo anterior")
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    start_date = now - timedelta(days=args.days)
+
+    print(f"{'avaliações':>12} {'passada única (ms)':>20} {'anterior (ms)':>15}")
+    for size in args.sizes:
+        reviews = generate_reviews(size, args.days, now)
+        current = measure(single_pass, reviews, start_date, args.days)
+        previous = f"{measure(legacy, reviews, start_date, args.days):.1f}" if size <= args.legacy_max else "-"
+        print(f"{size:>12,} {current:>20.1f} {previous:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Catálogo de técnicas em memória para ZenPress
+Snapshot versionado, particionado por categoria/premium e indexado por id
+
+O seeder (ou uma atualização administrativa) incrementa a versão em
+``catalog_meta``; cada worker verifica a versão periodicamente e recarrega o
+snapshot apenas quando ela muda. Leituras do catálogo não acessam o MongoDB
+enquanto o snapshot estiver dentro do limite de desatualização.
+
+Os resumos de avaliações por técnica (``technique_review_summaries``) são
+relidos a cada verificação e incorporados ao snapshot; quando mudam, um novo
+snapshot (e novos ETags) é montado sem recarregar as técnicas.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from models import RatingSummary, Technique
+from http_cache import CachedBody, encode_body
+from review_counters import get_rating_summaries
+
+logger = logging.getLogger(__name__)
+
+CATALOG_POLL_SECONDS = float(os.environ.get("CATALOG_POLL_SECONDS", "10"))
+CATALOG_MAX_STALENESS_SECONDS = float(os.environ.get("CATALOG_MAX_STALENESS_SECONDS", "60"))
+CATALOG_META_ID = "techniques"
+EMPTY_BODY = encode_body([])
+
+
+class CatalogSnapshot:
+    """Visão imutável do catálogo em uma determinada versão"""
+
+    def __init__(
+        self,
+        version: int,
+        techniques: List[Technique],
+        summaries: Optional[Dict[str, Dict[str, Any]]] = None,
+    ):
+        self.version = version
+        self.summaries = summaries or {}
+        self.base_techniques = techniques
+        # Resumo de avaliações embutido em cada técnica avaliada
+        self.techniques = [
+            technique.model_copy(update={"rating_summary": RatingSummary(**self.summaries[technique.id])})
+            if technique.id in self.summaries else technique
+            for technique in techniques
+        ]
+        self.by_id: Dict[str, Technique] = {t.id: t for t in self.techniques}
+
+        # Partições (categoria ou None para todas, inclui premium?)
+        self.partitions: Dict[Tuple[Optional[str], bool], List[Technique]] = {}
+        for include_premium in (False, True):
+            visible = [t for t in self.techniques if include_premium or not t.is_premium]
+            self.partitions[(None, include_premium)] = visible
+            for technique in visible:
+                self.partitions.setdefault((technique.category, include_premium), []).append(technique)
+
+        self._encoded: Dict[Tuple[Optional[str], bool], CachedBody] = {}
+
+    def list(self, category: Optional[str] = None, include_premium: bool = False) -> List[Technique]:
+        return self.partitions.get((category, include_premium), [])
+
+    def encoded(self, category: Optional[str] = None, include_premium: bool = False) -> CachedBody:
+        """Corpo JSON + ETag da partição, calculados uma vez por versão"""
+        key = (category, include_premium)
+        if key not in self.partitions:
+            # Categoria inexistente (valor livre da query string): não entra no cache
+            return EMPTY_BODY
+        if key not in self._encoded:
+            self._encoded[key] = encode_body(self.list(category, include_premium))
+        return self._encoded[key]
+
+    def get(self, technique_id: str) -> Optional[Technique]:
+        return self.by_id.get(technique_id)
+
+
+class TechniqueCatalog:
+    """Mantém o snapshot atual e o recarrega quando a versão muda"""
+
+    def __init__(self, max_staleness: float):
+        self.max_staleness = max_staleness
+        self.snapshot: Optional[CatalogSnapshot] = None
+        self.checked_at = 0.0
+        self.reloads = 0
+        self.version_checks = 0
+        self.summary_updates = 0
+        self._lock = asyncio.Lock()
+
+    async def refresh(self, db: AsyncIOMotorDatabase, force: bool = False) -> CatalogSnapshot:
+        async with self._lock:
+            meta = await db.catalog_meta.find_one({"_id": CATALOG_META_ID})
+            version = meta.get("version", 0) if meta else 0
+            summaries = await get_rating_summaries(db)
+            self.version_checks += 1
+
+            if force or self.snapshot is None or self.snapshot.version != version:
+                documents = await db.techniques.find({}, {"_id": 0}).to_list(None)
+                self.snapshot = CatalogSnapshot(version, [Technique(**doc) for doc in documents], summaries)
+                self.reloads += 1
+                logger.info(f"Catálogo recarregado: versão {version}, {len(documents)} técnicas")
+            elif self.snapshot.summaries != summaries:
+                self.snapshot = CatalogSnapshot(version, self.snapshot.base_techniques, summaries)
+                self.summary_updates += 1
+
+            self.checked_at = time.monotonic()
+            return self.snapshot
+
+    async def get_snapshot(self, db: AsyncIOMotorDatabase) -> CatalogSnapshot:
+        # O poller mantém o snapshot atualizado; só recarrega aqui se ele parou
+        if self.snapshot is None or time.monotonic() - self.checked_at > self.max_staleness:
+            return await self.refresh(db)
+        return self.snapshot
+
+    def stats(self) -> dict:
+        return {
+            "version": self.snapshot.version if self.snapshot else None,
+            "techniques": len(self.snapshot.techniques) if self.snapshot else 0,
+            "age_seconds": round(time.monotonic() - self.checked_at, 1) if self.snapshot else None,
+            "max_staleness_seconds": self.max_staleness,
+            "reloads": self.reloads,
+            "version_checks": self.version_checks,
+            "summary_updates": self.summary_updates,
+        }
+
+
+catalog = TechniqueCatalog(CATALOG_MAX_STALENESS_SECONDS)
+
+
+async def bump_catalog_version(db: AsyncIOMotorDatabase) -> int:
+    """Incrementa a versão do catálogo para que todos os workers recarreguem"""
+    meta = await db.catalog_meta.find_one_and_update(
+        {"_id": CATALOG_META_ID},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return meta["version"]
@@ -0,0 +1,335 @@
+"""
+Verificação on-chain de pagamentos crypto para ZenPress
+Uma tarefa periódica coleta em lotes os pagamentos ``user_confirmed`` com
+``tx_hash``, consulta um indexador de blockchain plugável com concorrência
+limitada e aplica os resultados com um único ``bulk_write``; pagamentos
+verificados ativam o premium do usuário
+
+PIX não tem transação on-chain e continua dependendo da verificação manual
+(``/api/crypto/admin/verify-payment``)
+
+Indexadores (``CHAIN_INDEXER``):
+- "" (padrão): verificação automática desativada
+- "local": ``LocalChainIndexer``, em memória, para testes e desenvolvimento
+
+Uso:
+    python chain_verification.py run    # processa todos os pagamentos elegíveis
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from auth import invalidate_principal
+from crypto_payments import SUBSCRIPTION_PRICES, WALLET_ADDRESSES, subscription_expiry
+from database import database
+from rollups import record_events
+
+logger = logging.getLogger(__name__)
+
+CHAIN_INDEXER = os.environ.get("CHAIN_INDEXER", "")
+CHAIN_VERIFY_SECONDS = float(os.environ.get("CHAIN_VERIFY_SECONDS", "120"))
+CHAIN_VERIFY_BATCH_SIZE = int(os.environ.get("CHAIN_VERIFY_BATCH_SIZE", "100"))
+CHAIN_VERIFY_CONCURRENCY = int(os.environ.get("CHAIN_VERIFY_CONCURRENCY", "8"))
+CHAIN_MIN_CONFIRMATIONS = int(os.environ.get("CHAIN_MIN_CONFIRMATIONS", "3"))
+# Intervalo mínimo entre duas consultas da mesma transação ainda não confirmada
+CHAIN_RECHECK_SECONDS = float(os.environ.get("CHAIN_RECHECK_SECONDS", "600"))
+# Tolerância para variação de câmbio/taxas no valor recebido
+CHAIN_AMOUNT_TOLERANCE = float(os.environ.get("CHAIN_AMOUNT_TOLERANCE", "0.02"))
+# Tolerância para o relógio dos blocos (o timestamp de um bloco pode atrasar alguns minutos)
+CHAIN_BLOCK_TIME_TOLERANCE_SECONDS = float(os.environ.get("CHAIN_BLOCK_TIME_TOLERANCE_SECONDS", "300"))
+# Prazo, a partir da confirmação do usuário, para o hash aparecer no indexador
+CHAIN_NOT_FOUND_DEADLINE_SECONDS = float(os.environ.get("CHAIN_NOT_FOUND_DEADLINE_SECONDS", "86400"))
+
+
+class ChainTransaction(NamedTuple):
+    """Transação encontrada pelo indexador (valor já convertido para USD, horário do bloco em UTC)"""
+    tx_hash: str
+    to_address: str
+    amount_usd: float
+    confirmations: int
+    block_time: datetime
+
+
+class ChainIndexer(ABC):
+    """Interface dos indexadores de blockchain"""
+
+    name = "base"
+
+    @abstractmethod
+    async def get_transaction(self, crypto_currency: str, tx_hash: str) -> Optional[ChainTransaction]:
+        """Transação ``tx_hash`` na rede da moeda, ou None se não existir"""
+
+
+class LocalChainIndexer(ChainIndexer):
+    """Indexador em memória: transações registradas com ``add_transaction``"""
+
+    name = "local"
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.transactions: Dict[Tuple[str, str], ChainTransaction] = {}
+        self.lookups = 0
+
+    def add_transaction(
+        self,
+        crypto_currency: str,
+        tx_hash: str,
+        to_address: str,
+        amount_usd: float,
+        confirmations: int = CHAIN_MIN_CONFIRMATIONS,
+        block_time: Optional[datetime] = None,
+    ) -> ChainTransaction:
+        transaction = ChainTransaction(
+            tx_hash, to_address, amount_usd, confirmations, block_time or datetime.utcnow()
+        )
+        self.transactions[(crypto_currency, tx_hash)] = transaction
+        return transaction
+
+    async def get_transaction(self, crypto_currency: str, tx_hash: str) -> Optional[ChainTransaction]:
+        self.lookups += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.transactions.get((crypto_currency, tx_hash))
+
+
+CHAIN_INDEXERS = {"local": LocalChainIndexer}
+
+
+def create_indexer(name: str = CHAIN_INDEXER) -> Optional[ChainIndexer]:
+    if not name:
+        return None
+    if name not in CHAIN_INDEXERS:
+        raise ValueError(f"Indexador de blockchain desconhecido: {name}")
+    return CHAIN_INDEXERS[name]()
+
+
+def hash_claimed(payment: Dict[str, Any], claims: List[Dict[str, Any]]) -> bool:
+    """
+    ``tx_hash`` já pertence a outro pagamento: um verificado ou um confirmado
+    antes deste (o primeiro a informar o hash fica com ele)
+    """
+    own = (payment.get("user_confirmed_at") or datetime.max, payment["transaction_id"])
+    for other in claims:
+        if other["transaction_id"] == payment["transaction_id"]:
+            continue
+        if other["status"] == "verified":
+            return True
+        if (other.get("user_confirmed_at") or datetime.max, other["transaction_id"]) < own:
+            return True
+    return False
+
+
+def evaluate(
+    payment: Dict[str, Any],
+    transaction: Optional[ChainTransaction],
+    claimed: bool = False,
+    now: Optional[datetime] = None,
+) -> Tuple[str, str]:
+    """
+    Resultado da verificação: ("verified" | "failed" | "waiting", motivo)
+    "waiting" mantém o pagamento em user_confirmed para a próxima rodada; um
+    hash que não aparece até CHAIN_NOT_FOUND_DEADLINE_SECONDS após a
+    confirmação do usuário falha em vez de ser consultado para sempre
+
+    Os endereços das carteiras são fixos e públicos: sem as verificações de
+    hash já utilizado e de horário, qualquer transferência antiga vista num
+    explorador de blocos serviria de comprovante
+    """
+    if claimed:
+        return "failed", "Hash de transação já utilizado por outro pagamento"
+    if transaction is None:
+        confirmed_at = payment.get("user_confirmed_at") or payment["created_at"]
+        deadline = confirmed_at + timedelta(seconds=CHAIN_NOT_FOUND_DEADLINE_SECONDS)
+        if (now or datetime.utcnow()) >= deadline:
+            return "failed", "Transação não encontrada dentro do prazo"
+        return "waiting", "Transação não encontrada"
+    if transaction.to_address != WALLET_ADDRESSES.get(payment["crypto_currency"]):
+        return "failed", "Transação enviada para outro endereço"
+    earliest = payment["created_at"] - timedelta(seconds=CHAIN_BLOCK_TIME_TOLERANCE_SECONDS)
+    if transaction.block_time < earliest:
+        return "failed", "Transação anterior à criação do pagamento"
+    expected = SUBSCRIPTION_PRICES[payment["subscription_type"]]["usd"]
+    if transaction.amount_usd < expected * (1 - CHAIN_AMOUNT_TOLERANCE):
+        return "failed", f"Valor insuficiente: ${transaction.amount_usd:.2f} de ${expected:.2f}"
+    if transaction.confirmations < CHAIN_MIN_CONFIRMATIONS:
+        return "waiting", f"{transaction.confirmations}/{CHAIN_MIN_CONFIRMATIONS} confirmações"
+    return "verified", f"{transaction.confirmations} confirmações"
+
+
+class ChainVerifier:
+    """Executado pela tarefa periódica; acumula totais para /api/metrics"""
+
+    def __init__(
+        self,
+        indexer: Optional[ChainIndexer],
+        batch_size: int = CHAIN_VERIFY_BATCH_SIZE,
+        concurrency: int = CHAIN_VERIFY_CONCURRENCY,
+    ):
+        self.indexer = indexer
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
+        self.checked = 0
+        self.verified = 0
+        self.failed = 0
+        self.lookup_errors = 0
+
+    async def _lookup(
+        self, semaphore: asyncio.Semaphore, payment: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], Optional[ChainTransaction], Optional[Exception]]:
+        async with semaphore:
+            try:
+                return payment, await self.indexer.get_transaction(payment["crypto_currency"], payment["tx_hash"]), None
+            except Exception as e:
+                return payment, None, e
+
+    async def run_batch(self, db: AsyncIOMotorDatabase) -> int:
+        """Verifica um lote; retorna quantos pagamentos foram consultados"""
+        now = datetime.utcnow()
+        run_id = str(uuid.uuid4())
+        payments = await db.crypto_payments.find(
+            {
+                "status": "user_confirmed",
+                "crypto_currency": {"$ne": "PIX"},
+                "tx_hash": {"$nin": [None, ""]},
+                "$or": [
+                    {"chain_checked_at": {"$exists": False}},
+                    {"chain_checked_at": {"$lt": now - timedelta(seconds=CHAIN_RECHECK_SECONDS)}},
+                ],
+            },
+            {"_id": 0, "transaction_id": 1, "user_id": 1, "crypto_currency": 1, "subscription_type": 1,
+             "tx_hash": 1, "amount_brl": 1, "created_at": 1, "user_confirmed_at": 1},
+        ).sort("user_confirmed_at", 1).limit(self.batch_size).to_list(self.batch_size)
+        if not payments:
+            return 0
+
+        # Outros pagamentos com os mesmos hashes (o índice único pode não existir em bases antigas)
+        claims: Dict[str, List[Dict[str, Any]]] = {}
+        async for other in db.crypto_payments.find(
+            {"tx_hash": {"$in": [p["tx_hash"] for p in payments]}, "status": {"$in": ["user_confirmed", "verified"]}},
+            {"_id": 0, "transaction_id": 1, "tx_hash": 1, "status": 1, "user_confirmed_at": 1},
+        ):
+            claims.setdefault(other["tx_hash"], []).append(other)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._lookup(semaphore, payment) for payment in payments))
+
+        operations = []
+        verified: List[Dict[str, Any]] = []
+        for payment, transaction, error in results:
+            if error is not None:
+                # Falha do indexador não decide nada: tenta de novo após CHAIN_RECHECK_SECONDS
+                self.lookup_errors += 1
+                outcome, reason = "waiting", f"Erro no indexador: {str(error)}"
+            else:
+                outcome, reason = evaluate(
+                    payment, transaction, hash_claimed(payment, claims.get(payment["tx_hash"], [])), now
+                )
+
+            fields = {"chain_checked_at": now, "chain_status": reason}
+            if outcome == "verified":
+                fields.update({"status": "verified", "verified_at": now, "verified_by": "chain", "chain_run_id": run_id})
+                verified.append(payment)
+            elif outcome == "failed":
+                fields.update({"status": "failed", "failed_at": now})
+                self.failed += 1
+            # O filtro de status impede sobrescrever uma decisão manual concorrente
+            operations.append(UpdateOne(
+                {"transaction_id": payment["transaction_id"], "status": "user_confirmed"},
+                {"$set": fields},
+            ))
+        await db.crypto_payments.bulk_write(operations, ordered=False)
+        self.checked += len(payments)
+
+        if verified:
+            await self._activate(db, verified, now, run_id)
+        return len(payments)
+
+    async def _activate(
+        self, db: AsyncIOMotorDatabase, verified: List[Dict[str, Any]], now: datetime, run_id: str
+    ) -> None:
+        # Apenas os pagamentos que esta rodada de fato verificou
+        applied = {
+            payment["transaction_id"]
+            async for payment in db.crypto_payments.find(
+                {"transaction_id": {"$in": [p["transaction_id"] for p in verified]},
+                 "chain_run_id": run_id},
+                {"_id": 0, "transaction_id": 1},
+            )
+        }
+        payments = [p for p in verified if p["transaction_id"] in applied]
+        if not payments:
+            return
+
+        await db.users.bulk_write([
+            UpdateOne(
+                {"id": payment["user_id"]},
+                {"$set": {
+                    "is_premium": True,
+                    "premium_expires_at": subscription_expiry(payment["subscription_type"], now),
+                    "premium_activated_at": now,
+                }},
+            )
+            for payment in payments
+        ], ordered=False)
+        await invalidate_principal(db, *(payment["user_id"] for payment in payments))
+        await record_events(
+            db, "crypto_payments", [(now, {"amount": payment.get("amount_brl") or 0}) for payment in payments]
+        )
+        self.verified += len(payments)
+        logger.info(f"Verificação on-chain: {len(payments)} pagamentos verificados e assinaturas ativadas")
+
+    async def run(self, db: Optional[AsyncIOMotorDatabase] = None, max_batches: int = 10) -> int:
+        if self.indexer is None:
+            return 0
+        db = db if db is not None else database.get_db()
+        checked = 0
+        for _ in range(max_batches):
+            count = await self.run_batch(db)
+            checked += count
+            if count < self.batch_size:
+                break
+        return checked
+
+    def stats(self) -> dict:
+        return {
+            "indexer": self.indexer.name if self.indexer else None,
+            "batch_size": self.batch_size,
+            "concurrency": self.concurrency,
+            "checked": self.checked,
+            "verified": self.verified,
+            "failed": self.failed,
+            "lookup_errors": self.lookup_errors,
+        }
+
+
+chain_verifier = ChainVerifier(create_indexer())
+
+
+async def main(command: str) -> None:
+    db = database.get_db()
+    try:
+        if command == "run":
+            if chain_verifier.indexer is None:
+                print("⚠️  CHAIN_INDEXER não configurado")
+                return
+            checked = await chain_verifier.run(db, max_batches=10**9)
+            print(f"✅ {checked} pagamentos consultados, {chain_verifier.verified} verificados, "
+                  f"{chain_verifier.failed} rejeitados")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verificação on-chain de pagamentos crypto")
+    parser.add_argument("command", choices=["run"])
+    args = parser.parse_args()
+    asyncio.run(main(args.command))
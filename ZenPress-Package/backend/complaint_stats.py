@@ -0,0 +1,272 @@
+"""
+Estatísticas materializadas de queixas para ZenPress
+Contadores por queixa (total e por hora/dia) e por técnica atualizados a cada
+sessão criada
+
+Uso:
+    python complaint_stats.py backfill    # reconstrói os contadores a partir de ``sessions``
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import DESCENDING, UpdateOne
+
+from database import database
+
+logger = logging.getLogger(__name__)
+
+# Janela recente comparada com a taxa diária de referência
+TRENDING_RECENT_HOURS = int(os.environ.get("TRENDING_RECENT_HOURS", "24"))
+TRENDING_BASELINE_DAYS = int(os.environ.get("TRENDING_BASELINE_DAYS", "7"))
+TRENDING_RATIO = float(os.environ.get("TRENDING_RATIO", "1.5"))
+TRENDING_MIN_COUNT = int(os.environ.get("TRENDING_MIN_COUNT", "5"))
+
+# Retenção dos buckets (removidos pelo índice TTL em expires_at)
+HOUR_BUCKET_RETENTION = timedelta(days=3)
+DAY_BUCKET_RETENTION = timedelta(days=60)
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _counter_updates(counts: Dict[Tuple[str, datetime], int]) -> Tuple[List[UpdateOne], List[UpdateOne]]:
+    """Gera os upserts de total, bucket horário e bucket diário"""
+    totals: Dict[str, int] = {}
+    buckets: Dict[Tuple[str, str, datetime], int] = {}
+    for (complaint, hour), count in counts.items():
+        totals[complaint] = totals.get(complaint, 0) + count
+        for granularity, bucket in (("hour", hour), ("day", day_bucket(hour))):
+            key = (complaint, granularity, bucket)
+            buckets[key] = buckets.get(key, 0) + count
+
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {"_id": complaint},
+            {"$inc": {"count": count}, "$set": {"updated_at": now}},
+            upsert=True,
+        )
+        for complaint, count in totals.items()
+    ]
+    bucket_operations = []
+    for (complaint, granularity, bucket), count in buckets.items():
+        retention = HOUR_BUCKET_RETENTION if granularity == "hour" else DAY_BUCKET_RETENTION
+        bucket_operations.append(UpdateOne(
+            {"granularity": granularity, "complaint": complaint, "bucket": bucket},
+            {"$inc": {"count": count}, "$setOnInsert": {"expires_at": bucket + retention}},
+            upsert=True,
+        ))
+    return operations, bucket_operations
+
+
+async def record_complaints(db: AsyncIOMotorDatabase, sessions: Iterable[Dict[str, Any]]) -> None:
+    """Incrementa os contadores para as sessões recém-inseridas"""
+    counts: Dict[Tuple[str, datetime], int] = {}
+    for session in sessions:
+        key = (session.get("complaint") or "", hour_bucket(session["date"]))
+        counts[key] = counts.get(key, 0) + 1
+    if not counts:
+        return
+
+    total_operations, bucket_operations = _counter_updates(counts)
+    await db.complaint_totals.bulk_write(total_operations, ordered=False)
+    await db.complaint_buckets.bulk_write(bucket_operations, ordered=False)
+
+
+async def record_technique_usage(db: AsyncIOMotorDatabase, sessions: Iterable[Dict[str, Any]]) -> None:
+    """Incrementa o total de sessões por técnica"""
+    counts: Dict[str, int] = {}
+    for session in sessions:
+        counts[session["technique_id"]] = counts.get(session["technique_id"], 0) + 1
+    if not counts:
+        return
+
+    now = datetime.utcnow()
+    await db.technique_totals.bulk_write([
+        UpdateOne({"_id": technique_id}, {"$inc": {"count": count}, "$set": {"updated_at": now}}, upsert=True)
+        for technique_id, count in counts.items()
+    ], ordered=False)
+
+
+async def most_used_technique(db: AsyncIOMotorDatabase) -> Optional[Dict[str, Any]]:
+    return await db.technique_totals.find_one({}, {"count": 1}, sort=[("count", DESCENDING)])
+
+
+def is_trending(recent: int, baseline_total: int) -> bool:
+    """Compara a janela recente com a taxa média diária do período de referência"""
+    if recent < TRENDING_MIN_COUNT:
+        return False
+    baseline_rate = baseline_total / TRENDING_BASELINE_DAYS * (TRENDING_RECENT_HOURS / 24)
+    return recent >= TRENDING_RATIO * baseline_rate
+
+
+async def top_complaints(db: AsyncIOMotorDatabase, limit: int = 10) -> List[Dict[str, Any]]:
+    """Top-N queixas com a flag de tendência, lidas apenas da visão materializada"""
+    totals = await db.complaint_totals.find({}, {"count": 1}).sort("count", DESCENDING).limit(limit).to_list(limit)
+    if not totals:
+        return []
+
+    names = [total["_id"] for total in totals]
+    now = datetime.utcnow()
+    recent_start = hour_bucket(now) - timedelta(hours=TRENDING_RECENT_HOURS - 1)
+    baseline_end = day_bucket(recent_start)
+    baseline_start = baseline_end - timedelta(days=TRENDING_BASELINE_DAYS)
+
+    recent: Dict[str, int] = {}
+    async for bucket in db.complaint_buckets.find(
+        {"granularity": "hour", "complaint": {"$in": names}, "bucket": {"$gte": recent_start}},
+        {"complaint": 1, "count": 1},
+    ):
+        recent[bucket["complaint"]] = recent.get(bucket["complaint"], 0) + bucket["count"]
+
+    baseline: Dict[str, int] = {}
+    async for bucket in db.complaint_buckets.find(
+        {"granularity": "day", "complaint": {"$in": names}, "bucket": {"$gte": baseline_start, "$lt": baseline_end}},
+        {"complaint": 1, "count": 1},
+    ):
+        baseline[bucket["complaint"]] = baseline.get(bucket["complaint"], 0) + bucket["count"]
+
+    return [
+        {
+            "complaint": total["_id"],
+            "count": total["count"],
+            "trending": is_trending(recent.get(total["_id"], 0), baseline.get(total["_id"], 0)),
+        }
+        for total in totals
+    ]
+
+
+async def _replace_counters(
+    collection, operations: List[UpdateOne], rebuild_id: str, stale: Dict[str, Any]
+) -> None:
+    """Grava os valores recalculados e remove os documentos que o recálculo não tocou"""
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
+    await collection.delete_many({"rebuild_id": {"$ne": rebuild_id}, **stale})
+
+
+async def backfill(db: AsyncIOMotorDatabase) -> int:
+    """
+    Reconstrói totais e buckets a partir de ``sessions``
+    Os buckets só cobrem o período ainda retido (DAY_BUCKET_RETENTION)
+
+    Cada documento é sobrescrito no lugar (upsert com o valor absoluto), então
+    os leitores nunca veem as coleções vazias; depois saem apenas os documentos
+    que não existem mais. Contadores criados por sessões gravadas durante o
+    recálculo (updated_at ou bucket posteriores ao início) são preservados.
+    Usa apenas operadores do MongoDB 3.6+ ($dateFromParts)
+    """
+    started = datetime.utcnow()
+    rebuild_id = str(uuid.uuid4())
+    since = day_bucket(started) - DAY_BUCKET_RETENTION
+    pipeline = [
+        {"$group": {
+            "_id": {
+                "complaint": "$complaint",
+                "hour": {"$cond": [
+                    {"$gte": ["$date", since]},
+                    {"$dateFromParts": {
+                        "year": {"$year": "$date"},
+                        "month": {"$month": "$date"},
+                        "day": {"$dayOfMonth": "$date"},
+                        "hour": {"$hour": "$date"},
+                    }},
+                    None,
+                ]},
+            },
+            "count": {"$sum": 1},
+        }},
+    ]
+
+    totals: Dict[str, int] = {}
+    counts: Dict[Tuple[str, datetime], int] = {}
+    async for group in db.sessions.aggregate(pipeline, allowDiskUse=True):
+        complaint = group["_id"].get("complaint") or ""
+        totals[complaint] = totals.get(complaint, 0) + group["count"]
+        if group["_id"].get("hour") is not None:
+            counts[(complaint, group["_id"]["hour"])] = group["count"]
+
+    now = datetime.utcnow()
+    await _replace_counters(
+        db.complaint_totals,
+        [
+            UpdateOne(
+                {"_id": complaint},
+                {"$set": {"count": count, "updated_at": now, "rebuild_id": rebuild_id}},
+                upsert=True,
+            )
+            for complaint, count in totals.items()
+        ],
+        rebuild_id,
+        {"updated_at": {"$not": {"$gte": started}}},
+    )
+
+    buckets: Dict[Tuple[str, str, datetime], int] = {}
+    for (complaint, hour), count in counts.items():
+        buckets[(complaint, "hour", hour)] = count
+        key = (complaint, "day", day_bucket(hour))
+        buckets[key] = buckets.get(key, 0) + count
+    bucket_operations = []
+    for (complaint, granularity, bucket), count in buckets.items():
+        retention = HOUR_BUCKET_RETENTION if granularity == "hour" else DAY_BUCKET_RETENTION
+        bucket_operations.append(UpdateOne(
+            {"granularity": granularity, "complaint": complaint, "bucket": bucket},
+            {"$set": {"count": count, "expires_at": bucket + retention, "rebuild_id": rebuild_id}},
+            upsert=True,
+        ))
+    await _replace_counters(
+        db.complaint_buckets,
+        bucket_operations,
+        rebuild_id,
+        {"$or": [
+            {"granularity": "hour", "bucket": {"$lt": hour_bucket(started)}},
+            {"granularity": "day", "bucket": {"$lt": day_bucket(started)}},
+        ]},
+    )
+
+    await _replace_counters(
+        db.technique_totals,
+        [
+            UpdateOne(
+                {"_id": group["_id"]},
+                {"$set": {"count": group["count"], "updated_at": now, "rebuild_id": rebuild_id}},
+                upsert=True,
+            )
+            async for group in db.sessions.aggregate(
+                [{"$group": {"_id": "$technique_id", "count": {"$sum": 1}}}], allowDiskUse=True
+            )
+            if group["_id"]
+        ],
+        rebuild_id,
+        {"updated_at": {"$not": {"$gte": started}}},
+    )
+    return len(totals)
+
+
+async def main(command: str) -> None:
+    db = database.get_db()
+    try:
+        if command == "backfill":
+            rebuilt = await backfill(db)
+            print(f"✅ Contadores reconstruídos para {rebuilt} queixas")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estatísticas materializadas de queixas")
+    parser.add_argument("command", choices=["backfill"])
+    args = parser.parse_args()
+    asyncio.run(main(args.command))
@@ -0,0 +1,147 @@
+"""
+Expiração de pagamentos crypto/PIX pendentes para ZenPress
+Uma tarefa periódica marca como ``expired`` os pagamentos ``pending`` cujo
+``expires_at`` já passou, em lotes limitados de ``update_many`` (índice
+``status_expires_at``), para que consultas de status e listagens não carreguem
+registros pendentes vencidos
+
+Arquivamento opcional: com ``CRYPTO_ARCHIVE_AFTER_DAYS`` > 0, pagamentos expirados
+há mais desse prazo são movidos para ``crypto_payments_archive``
+
+Uso:
+    python crypto_expiry.py sweep    # executa uma varredura completa
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError
+
+from database import database
+
+logger = logging.getLogger(__name__)
+
+CRYPTO_EXPIRY_SWEEP_SECONDS = float(os.environ.get("CRYPTO_EXPIRY_SWEEP_SECONDS", "300"))
+CRYPTO_EXPIRY_BATCH_SIZE = int(os.environ.get("CRYPTO_EXPIRY_BATCH_SIZE", "500"))
+# Limite de lotes por varredura: o restante fica para a próxima execução
+CRYPTO_EXPIRY_MAX_BATCHES = int(os.environ.get("CRYPTO_EXPIRY_MAX_BATCHES", "20"))
+CRYPTO_ARCHIVE_AFTER_DAYS = int(os.environ.get("CRYPTO_ARCHIVE_AFTER_DAYS", "0"))
+
+
+def is_overdue(payment: dict, now: Optional[datetime] = None) -> bool:
+    """Pagamento pendente vencido que a varredura ainda não marcou"""
+    return payment.get("status") == "pending" and (now or datetime.utcnow()) > payment["expires_at"]
+
+
+async def expire_overdue(
+    db: AsyncIOMotorDatabase,
+    batch_size: int = CRYPTO_EXPIRY_BATCH_SIZE,
+    max_batches: int = CRYPTO_EXPIRY_MAX_BATCHES,
+) -> int:
+    """Marca pendentes vencidos como expirados; retorna quantos foram alterados"""
+    now = datetime.utcnow()
+    expired = 0
+    for _ in range(max_batches):
+        ids = await db.crypto_payments.find(
+            {"status": "pending", "expires_at": {"$lt": now}}, {"_id": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not ids:
+            break
+        # O filtro repete o status: confirmações concorrentes não são sobrescritas
+        result = await db.crypto_payments.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in ids]}, "status": "pending"},
+            {"$set": {"status": "expired", "expired_at": now}},
+        )
+        expired += result.modified_count
+        if len(ids) < batch_size:
+            break
+    return expired
+
+
+async def archive_expired(
+    db: AsyncIOMotorDatabase,
+    after_days: int = CRYPTO_ARCHIVE_AFTER_DAYS,
+    batch_size: int = CRYPTO_EXPIRY_BATCH_SIZE,
+    max_batches: int = CRYPTO_EXPIRY_MAX_BATCHES,
+) -> int:
+    """Move pagamentos expirados há mais de ``after_days`` dias para o arquivo"""
+    if after_days <= 0:
+        return 0
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=after_days)
+    archived = 0
+    for _ in range(max_batches):
+        payments = await db.crypto_payments.find(
+            {"status": "expired", "expires_at": {"$lt": cutoff}}
+        ).limit(batch_size).to_list(batch_size)
+        if not payments:
+            break
+        for payment in payments:
+            payment["archived_at"] = now
+        try:
+            await db.crypto_payments_archive.insert_many(payments, ordered=False)
+        except BulkWriteError as e:
+            # Já arquivados por uma execução interrompida antes da remoção
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        result = await db.crypto_payments.delete_many(
+            {"_id": {"$in": [payment["_id"] for payment in payments]}, "status": "expired"}
+        )
+        archived += result.deleted_count
+        if len(payments) < batch_size:
+            break
+    return archived
+
+
+class CryptoExpirySweeper:
+    """Executada pela tarefa periódica; acumula totais para /api/metrics"""
+
+    def __init__(self):
+        self.expired = 0
+        self.archived = 0
+
+    async def sweep(self, db: Optional[AsyncIOMotorDatabase] = None) -> dict:
+        db = db if db is not None else database.get_db()
+        expired = await expire_overdue(db)
+        archived = await archive_expired(db)
+        self.expired += expired
+        self.archived += archived
+        if expired or archived:
+            logger.info(f"Pagamentos crypto: {expired} expirados, {archived} arquivados")
+        return {"expired": expired, "archived": archived}
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": CRYPTO_EXPIRY_SWEEP_SECONDS,
+            "batch_size": CRYPTO_EXPIRY_BATCH_SIZE,
+            "archive_after_days": CRYPTO_ARCHIVE_AFTER_DAYS,
+            "expired": self.expired,
+            "archived": self.archived,
+        }
+
+
+crypto_expiry_sweeper = CryptoExpirySweeper()
+
+
+async def main(command: str) -> None:
+    db = database.get_db()
+    try:
+        if command == "sweep":
+            # Sem limite de lotes: processa todo o acúmulo
+            expired = await expire_overdue(db, max_batches=10**9)
+            archived = await archive_expired(db, max_batches=10**9)
+            print(f"✅ {expired} pagamentos expirados, {archived} arquivados")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expiração de pagamentos crypto")
+    parser.add_argument("command", choices=["sweep"])
+    args = parser.parse_args()
+    asyncio.run(main(args.command))
@@ -3,19 +3,23 @@ Sistema de Pagamento Crypto Simplificado para ZenPress
 Gerencia pagamentos Bitcoin e USDT via endereços de wallet
 """
 
-from fastapi import APIRouter, HTTPException, Depends, status
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 import uuid
 import os
-import qrcode
-import base64
-from io import BytesIO
 import logging
 
 from models import UserResponse
-from auth import get_current_user, get_premium_user
+from database import get_database
+from http_cache import STATIC_CACHE_CONTROL, conditional_response, encode_body
+from pagination import PageParams, paginate
+from rollups import record_event
+from crypto_expiry import is_overdue
+from qr_codes import MEDIA_TYPES, QR_FORMATS, data_uri, qr_render_pool, static_qr_code
+from auth import get_admin_user, get_current_user, invalidate_principal
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -24,43 +28,47 @@ logger = logging.getLogger(__name__)
 # Router para pagamentos crypto
 crypto_router = APIRouter(prefix="/crypto", tags=["crypto_payments"])
 
+# Moedas/métodos de pagamento disponíveis
+AVAILABLE_CURRENCIES = {
+    "BTC": {
+        "name": "Bitcoin",
+        "symbol": "BTC",
+        "type": "cryptocurrency",
+        "network": "Bitcoin Network",
+        "description": "Pagamento via Bitcoin"
+    },
+    "USDT_TRC20": {
+        "name": "USDT (TRC20)",
+        "symbol": "USDT",
+        "type": "cryptocurrency", 
+        "network": "TRON Network",
+        "description": "Tether via rede TRON"
+    },
+    "USDT_ERC20": {
+        "name": "USDT (ERC20)",
+        "symbol": "USDT",
+        "type": "cryptocurrency",
+        "network": "Ethereum Network", 
+        "description": "Tether via rede Ethereum"
+    },
+    "PIX": {
+        "name": "PIX",
+        "symbol": "PIX",
+        "type": "bank_transfer",
+        "network": "Sistema de Pagamentos Instantâneos",
+        "description": "Pagamento instantâneo via PIX",
+        "country": "Brasil"
+    }
+}
+
+_currencies_body = encode_body(AVAILABLE_CURRENCIES)
+
 @crypto_router.get("/currencies")
-async def get_available_currencies():
+async def get_available_currencies(request: Request):
     """
     Lista as moedas/métodos de pagamento disponíveis
     """
-    currencies = {
-        "BTC": {
-            "name": "Bitcoin",
-            "symbol": "BTC",
-            "type": "cryptocurrency",
-            "network": "Bitcoin Network",
-            "description": "Pagamento via Bitcoin"
-        },
-        "USDT_TRC20": {
-            "name": "USDT (TRC20)",
-            "symbol": "USDT",
-            "type": "cryptocurrency", 
-            "network": "TRON Network",
-            "description": "Tether via rede TRON"
-        },
-        "USDT_ERC20": {
-            "name": "USDT (ERC20)",
-            "symbol": "USDT",
-            "type": "cryptocurrency",
-            "network": "Ethereum Network", 
-            "description": "Tether via rede Ethereum"
-        },
-        "PIX": {
-            "name": "PIX",
-            "symbol": "PIX",
-            "type": "bank_transfer",
-            "network": "Sistema de Pagamentos Instantâneos",
-            "description": "Pagamento instantâneo via PIX",
-            "country": "Brasil"
-        }
-    }
-    return currencies
+    return conditional_response(request, _currencies_body, STATIC_CACHE_CONTROL)
 
 # Configuração de endereços de wallet (configurar no .env)
 WALLET_ADDRESSES = {
@@ -76,45 +84,57 @@ SUBSCRIPTION_PRICES = {
     "premium_yearly": {"brl": 299.90, "usd": 59.99}
 }
 
-def generate_qr_code(data: str) -> str:
-    """Gera QR Code em base64 para o endereço de pagamento"""
-    try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_M,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(data)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Converter para base64
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        
-        return f"data:image/png;base64,{img_str}"
-        
-    except Exception as e:
-        logger.error(f"Erro ao gerar QR Code: {str(e)}")
-        return ""
+def subscription_expiry(subscription_type: str, start: datetime) -> datetime:
+    """Fim do período premium pago por uma assinatura"""
+    return start + timedelta(days=30 if "monthly" in subscription_type else 365)
+
+def normalize_tx_hash(crypto_currency: str, tx_hash: str) -> str:
+    """Forma canônica do hash, para que variações de caixa ou prefixo não burlem o índice único"""
+    tx_hash = (tx_hash or "").strip()
+    if crypto_currency == "PIX" or not tx_hash:
+        return tx_hash
+    tx_hash = tx_hash.lower()
+    if tx_hash.startswith("0x"):
+        tx_hash = tx_hash[2:]
+    return f"0x{tx_hash}" if crypto_currency == "USDT_ERC20" else tx_hash
+
+def pix_payload(pix_key: str, amount: float, transaction_id: str) -> str:
+    """Dados estruturados do QR Code PIX"""
+    # Formato básico PIX para QR Code (simplificado para teste)
+    return f"PIX:{pix_key}:BRL:{amount:.2f}:ID:{transaction_id}"
+
+def precompute_static_qr_codes() -> None:
+    """QR Codes dos endereços fixos: renderizados uma única vez por endereço (na inicialização)"""
+    for currency, address in WALLET_ADDRESSES.items():
+        if currency != "PIX":
+            for image_format in MEDIA_TYPES:
+                static_qr_code(address, image_format)
 
-def generate_pix_qr_code(pix_key: str, amount: float, transaction_id: str) -> str:
-    """Gera QR Code PIX com dados estruturados"""
+QR_CODE_CACHE_CONTROL = "public, max-age=86400"
+PAYMENT_QR_CODE_CACHE_CONTROL = "private, max-age=86400"
+
+async def build_qr_code(crypto_currency: str, wallet_address: str, transaction_id: str, payload: str, qr_format: str) -> str:
+    """QR Code no formato pedido: data URI (png/svg) ou URL da imagem"""
+    if crypto_currency != "PIX":
+        if qr_format == "url":
+            return f"/api/crypto/qr/address/{crypto_currency}.png"
+        return static_qr_code(wallet_address, qr_format)[1]
+    
+    if qr_format == "url":
+        return f"/api/crypto/qr/payment/{transaction_id}.png"
     try:
-        # Formato básico PIX para QR Code (simplificado para teste)
-        pix_data = f"PIX:{pix_key}:BRL:{amount:.2f}:ID:{transaction_id}"
-        return generate_qr_code(pix_data)
+        return data_uri(await qr_render_pool.render(payload, qr_format), qr_format)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao gerar QR Code PIX: {str(e)}")
-        return generate_qr_code(pix_key)  # Fallback para chave simples
+        return static_qr_code(wallet_address, qr_format)[1]  # Fallback para chave simples
 
 @crypto_router.post("/create-payment")
 async def create_crypto_payment(
     payment_data: Dict[str, Any],
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Cria uma solicitação de pagamento crypto
@@ -135,10 +155,14 @@ async def create_crypto_payment(
             detail="Criptomoeda não suportada"
         )
     
+    qr_format = payment_data.get("qr_format", "png")
+    if qr_format not in QR_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail="Formato de QR Code inválido (png, svg ou url)"
+        )
+    
     try:
-        # Obter conexão MongoDB
-        from server import db
-        
         # Gerar ID único para a transação
         transaction_id = str(uuid.uuid4())
         
@@ -149,11 +173,9 @@ async def create_crypto_payment(
         # Endereço de pagamento
         wallet_address = WALLET_ADDRESSES[crypto_currency]
         
-        # Gerar QR Code (específico para PIX ou genérico)
-        if crypto_currency == "PIX":
-            qr_code = generate_pix_qr_code(wallet_address, price_brl, transaction_id)
-        else:
-            qr_code = generate_qr_code(wallet_address)
+        # Gerar QR Code (específico para PIX ou memorizado para o endereço)
+        payload = pix_payload(wallet_address, price_brl, transaction_id) if crypto_currency == "PIX" else wallet_address
+        qr_code = await build_qr_code(crypto_currency, wallet_address, transaction_id, payload, qr_format)
         
         # Criar registro de pagamento
         payment_record = {
@@ -162,6 +184,7 @@ async def create_crypto_payment(
             "subscription_type": subscription_type,
             "crypto_currency": crypto_currency,
             "wallet_address": wallet_address,
+            "qr_payload": payload,
             "amount_usd": price_usd,
             "amount_brl": price_brl,
             "status": "pending",
@@ -199,6 +222,8 @@ async def create_crypto_payment(
             "instructions": instructions
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao criar pagamento crypto: {str(e)}")
         raise HTTPException(
@@ -206,18 +231,60 @@ async def create_crypto_payment(
             detail="Erro interno do servidor"
         )
 
+@crypto_router.get("/qr/address/{crypto_currency}.{image_format}")
+async def get_address_qr_code(crypto_currency: str, image_format: str):
+    """
+    Imagem do QR Code de um endereço fixo (memorizada)
+    """
+    if crypto_currency not in WALLET_ADDRESSES or crypto_currency == "PIX" or image_format not in MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="QR Code não encontrado")
+    
+    image, _ = static_qr_code(WALLET_ADDRESSES[crypto_currency], image_format)
+    return Response(
+        content=image,
+        media_type=MEDIA_TYPES[image_format],
+        headers={"Cache-Control": QR_CODE_CACHE_CONTROL}
+    )
+
+@crypto_router.get("/qr/payment/{transaction_id}.{image_format}")
+async def get_payment_qr_code(
+    transaction_id: str,
+    image_format: str,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """
+    Imagem do QR Code de uma transação (o conteúdo nunca muda, então é cacheável)
+    O id da transação é um UUID aleatório, o que permite usar a URL em <img>
+    """
+    if image_format not in MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="QR Code não encontrado")
+    
+    payment = await db.crypto_payments.find_one(
+        {"transaction_id": transaction_id},
+        {"_id": 0, "qr_payload": 1, "wallet_address": 1}
+    )
+    if not payment:
+        raise HTTPException(status_code=404, detail="QR Code não encontrado")
+    
+    payload = payment.get("qr_payload") or payment["wallet_address"]
+    image = await qr_render_pool.render(payload, image_format)
+    return Response(
+        content=image,
+        media_type=MEDIA_TYPES[image_format],
+        headers={"Cache-Control": PAYMENT_QR_CODE_CACHE_CONTROL}
+    )
+
 @crypto_router.post("/confirm-payment/{transaction_id}")
 async def confirm_crypto_payment(
     transaction_id: str,
     confirmation_data: Dict[str, Any],
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Confirma um pagamento crypto (usuário reporta que fez o pagamento)
     """
     try:
-        from server import db
-        
         # Buscar pagamento
         payment = await db.crypto_payments.find_one({
             "transaction_id": transaction_id,
@@ -236,28 +303,47 @@ async def confirm_crypto_payment(
                 detail="Pagamento já foi processado"
             )
         
-        # Verificar se não expirou
-        if datetime.utcnow() > payment["expires_at"]:
+        # Verificar se não expirou (a varredura periódica pode ainda não ter marcado)
+        if is_overdue(payment):
+            await db.crypto_payments.update_one(
+                {"transaction_id": transaction_id, "status": "pending"},
+                {"$set": {"status": "expired", "expired_at": datetime.utcnow()}}
+            )
             raise HTTPException(
                 status_code=400,
                 detail="Pagamento expirou"
             )
         
         # Atualizar status para "user_confirmed"
-        tx_hash = confirmation_data.get("tx_hash", "")
+        tx_hash = normalize_tx_hash(payment["crypto_currency"], str(confirmation_data.get("tx_hash") or ""))
         confirmation_message = confirmation_data.get("message", "")
         
-        await db.crypto_payments.update_one(
-            {"transaction_id": transaction_id},
-            {
-                "$set": {
-                    "status": "user_confirmed",
-                    "user_confirmed_at": datetime.utcnow(),
-                    "tx_hash": tx_hash,
-                    "confirmation_message": confirmation_message
+        # Um hash comprova um único pagamento (o índice único cobre a corrida entre duas confirmações)
+        if tx_hash and await db.crypto_payments.find_one(
+            {"tx_hash": tx_hash, "transaction_id": {"$ne": transaction_id}}, {"_id": 1}
+        ):
+            raise HTTPException(
+                status_code=400,
+                detail="Hash de transação já utilizado em outro pagamento"
+            )
+        
+        try:
+            await db.crypto_payments.update_one(
+                {"transaction_id": transaction_id},
+                {
+                    "$set": {
+                        "status": "user_confirmed",
+                        "user_confirmed_at": datetime.utcnow(),
+                        "tx_hash": tx_hash,
+                        "confirmation_message": confirmation_message
+                    }
                 }
-            }
-        )
+            )
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=400,
+                detail="Hash de transação já utilizado em outro pagamento"
+            )
         
         logger.info(f"Pagamento confirmado pelo usuário: {transaction_id}")
         
@@ -267,6 +353,8 @@ async def confirm_crypto_payment(
             "verification_time": "2 horas"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao confirmar pagamento: {str(e)}")
         raise HTTPException(
@@ -277,14 +365,13 @@ async def confirm_crypto_payment(
 @crypto_router.get("/payment-status/{transaction_id}")
 async def get_payment_status(
     transaction_id: str,
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Verifica o status de um pagamento crypto
     """
     try:
-        from server import db
-        
         payment = await db.crypto_payments.find_one({
             "transaction_id": transaction_id,
             "user_id": current_user.id
@@ -304,10 +391,13 @@ async def get_payment_status(
             "failed": "Pagamento falhou"
         }
         
+        # Entre uma varredura e outra, pendentes vencidos já são reportados como expirados
+        payment_status = "expired" if is_overdue(payment) else payment["status"]
+        
         return {
             "transaction_id": transaction_id,
-            "status": payment["status"],
-            "status_message": status_messages.get(payment["status"], "Status desconhecido"),
+            "status": payment_status,
+            "status_message": status_messages.get(payment_status, "Status desconhecido"),
             "created_at": payment["created_at"],
             "expires_at": payment["expires_at"],
             "confirmed_at": payment.get("confirmed_at"),
@@ -315,6 +405,8 @@ async def get_payment_status(
             "amount_usd": payment["amount_usd"]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar status do pagamento: {str(e)}")
         raise HTTPException(
@@ -324,17 +416,17 @@ async def get_payment_status(
 
 @crypto_router.get("/my-payments")
 async def get_user_crypto_payments(
-    current_user: UserResponse = Depends(get_current_user)
+    page: PageParams = Depends(),
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
-    Lista todos os pagamentos crypto do usuário
+    Lista os pagamentos crypto do usuário (paginados; próxima página em next_cursor)
     """
     try:
-        from server import db
-        
-        payments = await db.crypto_payments.find({
-            "user_id": current_user.id
-        }).sort("created_at", -1).to_list(100)
+        payments, next_cursor = await paginate(
+            db.crypto_payments, {"user_id": current_user.id}, [("created_at", -1)], page
+        )
         
         # Convert MongoDB documents to JSON-serializable format
         serializable_payments = []
@@ -342,13 +434,18 @@ async def get_user_crypto_payments(
             # Remove MongoDB ObjectId
             if "_id" in payment:
                 del payment["_id"]
+            if is_overdue(payment):
+                payment["status"] = "expired"
             serializable_payments.append(payment)
         
         return {
             "payments": serializable_payments,
-            "total": len(serializable_payments)
+            "total": len(serializable_payments),
+            "next_cursor": next_cursor
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar pagamentos do usuário: {str(e)}")
         raise HTTPException(
@@ -361,14 +458,13 @@ async def get_user_crypto_payments(
 async def admin_verify_payment(
     transaction_id: str,
     verification_data: Dict[str, Any],
-    current_user: UserResponse = Depends(get_premium_user)  # Apenas admin
+    current_user: UserResponse = Depends(get_admin_user),  # Apenas admin (ADMIN_EMAILS)
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Endpoint administrativo para verificar e aprovar pagamentos
     """
     try:
-        from server import db
-        
         # Buscar pagamento
         payment = await db.crypto_payments.find_one({
             "transaction_id": transaction_id
@@ -385,19 +481,28 @@ async def admin_verify_payment(
         
         if verification_status == "verified":
             # Aprovar pagamento e ativar assinatura
-            await db.crypto_payments.update_one(
-                {"transaction_id": transaction_id},
+            verified_at = datetime.utcnow()
+            result = await db.crypto_payments.update_one(
+                {"transaction_id": transaction_id, "status": {"$ne": "verified"}},
                 {
                     "$set": {
                         "status": "verified",
-                        "verified_at": datetime.utcnow(),
+                        "verified_at": verified_at,
                         "admin_notes": admin_notes
                     }
                 }
             )
+            if result.modified_count:
+                # Conta o pagamento nos rollups apenas na primeira verificação
+                await record_event(db, "crypto_payments", verified_at, {"amount": payment.get("amount_brl") or 0})
+            else:
+                await db.crypto_payments.update_one(
+                    {"transaction_id": transaction_id},
+                    {"$set": {"admin_notes": admin_notes}}
+                )
             
             # Ativar assinatura premium do usuário
-            expiry_date = datetime.utcnow() + timedelta(days=30 if "monthly" in payment["subscription_type"] else 365)
+            expiry_date = subscription_expiry(payment["subscription_type"], datetime.utcnow())
             
             await db.users.update_one(
                 {"id": payment["user_id"]},
@@ -409,6 +514,7 @@ async def admin_verify_payment(
                     }
                 }
             )
+            await invalidate_principal(db, payment["user_id"])
             
             logger.info(f"Pagamento verificado e assinatura ativada: {transaction_id}")
             
@@ -438,6 +544,8 @@ async def admin_verify_payment(
                 "notes": admin_notes
             }
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro na verificação administrativa: {str(e)}")
         raise HTTPException(
@@ -0,0 +1,143 @@
+"""
+Shared MongoDB connection provider for the ZenPress API
+One Motor client (and connection pool) per worker, managed by the app lifespan
+"""
+
+import os
+import logging
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# MongoDB connection settings
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'test_database')
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '20000'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Collects connection pool counters from PyMongo's CMAP events"""
+
+    def __init__(self):
+        self.open_connections = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.connections_created += 1
+        self.open_connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.connections_closed += 1
+        self.open_connections = max(0, self.open_connections - 1)
+
+    def connection_check_out_started(self, event):
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def connection_check_out_failed(self, event):
+        self.waiting = max(0, self.waiting - 1)
+        self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        self.waiting = max(0, self.waiting - 1)
+        self.checkouts += 1
+        self.checked_out += 1
+        self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def connection_checked_in(self, event):
+        self.checked_out = max(0, self.checked_out - 1)
+
+
+class DatabaseProvider:
+    """Owns the process-wide Motor client and hands out the database handle"""
+
+    def __init__(self):
+        self.client: Optional[AsyncIOMotorClient] = None
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self.pool_listener = PoolStatsListener()
+
+    def connect(self) -> AsyncIOMotorDatabase:
+        if self.client is None:
+            self.client = AsyncIOMotorClient(
+                MONGO_URL,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                event_listeners=[self.pool_listener],
+            )
+            self.db = self.client[DB_NAME]
+            logger.info(
+                f"MongoDB pool criado (maxPoolSize={MONGO_MAX_POOL_SIZE}, minPoolSize={MONGO_MIN_POOL_SIZE})"
+            )
+        return self.db
+
+    def close(self) -> None:
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+            self.db = None
+
+    def get_db(self) -> AsyncIOMotorDatabase:
+        # Connect lazily so scripts that skip the app lifespan still work
+        return self.db if self.db is not None else self.connect()
+
+    def pool_stats(self) -> dict:
+        listener = self.pool_listener
+        return {
+            "connected": self.client is not None,
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "open_connections": listener.open_connections,
+            "checked_out": listener.checked_out,
+            "max_checked_out": listener.max_checked_out,
+            "utilisation": round(listener.checked_out / MONGO_MAX_POOL_SIZE, 4) if MONGO_MAX_POOL_SIZE else 0.0,
+            "waiting": listener.waiting,
+            "max_waiting": listener.max_waiting,
+            "connections_created": listener.connections_created,
+            "connections_closed": listener.connections_closed,
+            "checkouts": listener.checkouts,
+            "checkout_failures": listener.checkout_failures,
+            "pool_clears": listener.pool_clears,
+        }
+
+
+database = DatabaseProvider()
+
+
+async def get_database() -> AsyncIOMotorDatabase:
+    """FastAPI dependency returning the shared database handle"""
+    return database.get_db()
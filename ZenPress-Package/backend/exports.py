@@ -0,0 +1,104 @@
+"""
+Exportação em streaming (NDJSON ou CSV) para dados administrativos
+Os documentos são lidos do cursor Motor em lotes e enviados em blocos por um
+StreamingResponse: o próximo lote só é lido depois que o bloco anterior foi
+entregue ao cliente (backpressure), então a memória do worker é limitada ao
+tamanho do lote, qualquer que seja o tamanho da coleção
+"""
+
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, Sequence
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+# Tamanho aproximado de cada bloco enviado ao cliente
+EXPORT_CHUNK_BYTES = int(os.environ.get("EXPORT_CHUNK_BYTES", "65536"))
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _ndjson_line(document: Dict[str, Any]) -> str:
+    return json.dumps(jsonable_encoder(document), ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+# Células de texto que planilhas interpretariam como fórmula
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        value = json.dumps(jsonable_encoder(value), ensure_ascii=False, separators=(",", ":"))
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        # Texto escrito por usuários (comentários, metadados): o apóstrofo impede a execução
+        return "'" + value
+    return "" if value is None else value
+
+
+async def _stream(cursor, export_format: str, fields: Sequence[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == "csv" else None
+    if writer is not None:
+        writer.writerow(fields)
+    try:
+        async for document in cursor:
+            if writer is not None:
+                writer.writerow([_csv_value(document.get(field)) for field in fields])
+            else:
+                buffer.write(_ndjson_line(document))
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+    finally:
+        # Cliente desconectado no meio da exportação: libera o cursor no servidor
+        await cursor.close()
+
+
+def date_range(field: str, since: Optional[datetime], until: Optional[datetime]) -> Dict[str, Any]:
+    if since is None and until is None:
+        return {}
+    bounds = {}
+    if since is not None:
+        bounds["$gte"] = since
+    if until is not None:
+        bounds["$lt"] = until
+    return {field: bounds}
+
+
+def export_response(
+    collection: AsyncIOMotorCollection,
+    query: Dict[str, Any],
+    fields: Sequence[str],
+    export_format: str,
+    filename: str,
+    sort_field: str = "created_at",
+) -> StreamingResponse:
+    """Exporta ``fields`` dos documentos de ``query`` em ordem de ``sort_field`` (indexado)"""
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Formato inválido (ndjson ou csv)")
+
+    projection = {"_id": 0, **{field: 1 for field in fields}}
+    cursor = collection.find(query, projection).sort(sort_field, 1).batch_size(EXPORT_BATCH_SIZE)
+    return StreamingResponse(
+        _stream(cursor, export_format, fields),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{export_format}"',
+            "Cache-Control": "no-store",
+        },
+    )
@@ -0,0 +1,62 @@
+"""
+Respostas condicionais (ETag / If-None-Match) para endpoints de catálogo
+O corpo JSON e seu ETag são calculados uma vez por versão do conteúdo
+"""
+
+import hashlib
+import json
+from typing import Any, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+CATALOG_CACHE_CONTROL = "public, max-age=60"
+PRIVATE_CATALOG_CACHE_CONTROL = "private, max-age=60"
+STATIC_CACHE_CONTROL = "public, max-age=3600"
+
+
+class CachedBody:
+    """Corpo JSON pré-serializado com o ETag derivado do seu conteúdo"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def encode_body(data: Any) -> CachedBody:
+    # Mesmo formato de serialização usado pelo JSONResponse do FastAPI
+    body = json.dumps(
+        jsonable_encoder(data),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return CachedBody(body)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Comparação fraca (RFC 9110): ignora o prefixo W/
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def conditional_response(
+    request: Request,
+    cached: CachedBody,
+    cache_control: str,
+    vary: Optional[str] = None,
+) -> Response:
+    """Retorna 304 quando o cliente já possui esta versão, senão o corpo completo"""
+    headers = {"ETag": cached.etag, "Cache-Control": cache_control}
+    if vary:
+        headers["Vary"] = vary
+
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=cached.body, media_type="application/json", headers=headers)
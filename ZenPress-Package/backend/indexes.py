@@ -0,0 +1,256 @@
+"""
+Gerenciamento de índices MongoDB para ZenPress
+Declara os índices usados pelas consultas da API e os cria de forma idempotente
+
+Favoritos, sessões sincronizadas e ativações de produtos dependem apenas dos
+índices únicos para não duplicar documentos: sem eles o servidor não sobe
+(``MONGO_REQUIRE_UNIQUE_INDEXES``). Duplicatas antigas impedem a criação do
+índice e precisam ser removidas antes do deploy (ver README, "Índices únicos")
+
+Uso:
+    python indexes.py            # cria índices ausentes e mostra o relatório
+    python indexes.py --check    # apenas relata índices ausentes/extras
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from auth import PRINCIPAL_INVALIDATION_RETENTION_SECONDS
+from database import database
+from stripe_webhooks import STRIPE_EVENT_RETENTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Sem algum índice único declarado o servidor não inicia (false: apenas registra o erro)
+MONGO_REQUIRE_UNIQUE_INDEXES = os.environ.get("MONGO_REQUIRE_UNIQUE_INDEXES", "true").lower() != "false"
+
+# Índices declarados por coleção (nomes explícitos para o relatório)
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "sessions": [
+        IndexModel([("user_id", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)], name="user_id_date_id"),
+        IndexModel(
+            [("user_id", ASCENDING), ("client_id", ASCENDING)],
+            name="user_id_client_id_unique",
+            unique=True,
+            partialFilterExpression={"client_id": {"$type": "string"}},
+        ),
+    ],
+    "favorites": [
+        IndexModel(
+            [("user_id", ASCENDING), ("technique_id", ASCENDING)],
+            name="user_id_technique_id_unique",
+            unique=True,
+        ),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_id_created_at_id"),
+    ],
+    "reviews": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("technique_id", ASCENDING), ("created_at", DESCENDING)], name="technique_id_created_at"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_id_created_at_id"),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+    ],
+    "crypto_payments": [
+        IndexModel([("transaction_id", ASCENDING)], name="transaction_id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_id_created_at_id"),
+        IndexModel([("status", ASCENDING), ("expires_at", ASCENDING)], name="status_expires_at"),
+        IndexModel([("status", ASCENDING), ("user_confirmed_at", ASCENDING)], name="status_user_confirmed_at"),
+        # Um hash de transação comprova um único pagamento
+        IndexModel(
+            [("tx_hash", ASCENDING)],
+            name="tx_hash_unique",
+            unique=True,
+            partialFilterExpression={"tx_hash": {"$gt": ""}},
+        ),
+    ],
+    "crypto_payments_archive": [
+        IndexModel([("transaction_id", ASCENDING)], name="transaction_id"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_created_at"),
+    ],
+    "payment_transactions": [
+        IndexModel([("session_id", ASCENDING)], name="session_id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_id_created_at_id"),
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id"),
+        IndexModel(
+            [("activation.state", ASCENDING), ("activation.next_attempt_at", ASCENDING)],
+            name="activation_state_next_attempt_at",
+            partialFilterExpression={"activation.state": {"$exists": True}},
+        ),
+    ],
+    "course_enrollments": [
+        IndexModel([("payment_transaction_id", ASCENDING)], name="payment_transaction_id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "corporate_plans": [
+        IndexModel([("payment_transaction_id", ASCENDING)], name="payment_transaction_id_unique", unique=True),
+    ],
+    "analytics_subscriptions": [
+        IndexModel([("payment_transaction_id", ASCENDING)], name="payment_transaction_id_unique", unique=True),
+    ],
+    "principal_invalidations": [
+        IndexModel(
+            [("created_at", ASCENDING)],
+            name="created_at_ttl",
+            expireAfterSeconds=PRINCIPAL_INVALIDATION_RETENTION_SECONDS,
+        ),
+    ],
+    "stripe_events": [
+        IndexModel([("received_at", ASCENDING)], name="received_at_ttl", expireAfterSeconds=STRIPE_EVENT_RETENTION_SECONDS),
+    ],
+    "complaint_totals": [
+        IndexModel([("count", DESCENDING)], name="count"),
+    ],
+    "technique_totals": [
+        IndexModel([("count", DESCENDING)], name="count"),
+    ],
+    "user_stats": [
+        IndexModel([("last_session_at", DESCENDING)], name="last_session_at"),
+    ],
+    "complaint_buckets": [
+        IndexModel(
+            [("granularity", ASCENDING), ("complaint", ASCENDING), ("bucket", ASCENDING)],
+            name="granularity_complaint_bucket_unique",
+            unique=True,
+        ),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "rollups": [
+        IndexModel(
+            [("metric", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)],
+            name="metric_granularity_bucket_unique",
+            unique=True,
+        ),
+    ],
+    "techniques": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("category", ASCENDING), ("is_premium", ASCENDING)], name="category_is_premium"),
+        IndexModel([("is_premium", ASCENDING)], name="is_premium"),
+    ],
+}
+
+
+# Índices substituídos por versões que terminam em _id (desempate da paginação
+# por cursor); removidos depois que os novos existem
+RETIRED_INDEXES: Dict[str, List[str]] = {
+    "sessions": ["user_id_date"],
+    "favorites": ["user_id_created_at"],
+    "reviews": ["user_id_created_at"],
+    "crypto_payments": ["user_id_created_at"],
+    "payment_transactions": ["user_id_created_at", "created_at"],
+}
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> Dict[str, List[str]]:
+    """
+    Cria os índices declarados (operação idempotente) e remove os aposentados
+    Falhas em uma coleção (ex: duplicatas impedindo um índice único) não
+    interrompem as demais
+    """
+    created = {}
+    for collection, models in INDEXES.items():
+        try:
+            created[collection] = await db[collection].create_indexes(models)
+            existing = await db[collection].index_information()
+            for name in RETIRED_INDEXES.get(collection, []):
+                if name in existing:
+                    await db[collection].drop_index(name)
+                    logger.info(f"Índice aposentado removido: {collection}.{name}")
+        except OperationFailure as e:
+            logger.error(f"Erro ao criar índices em {collection}: {str(e)}")
+            created[collection] = []
+    return created
+
+
+async def missing_unique_indexes(db: AsyncIOMotorDatabase) -> List[str]:
+    """Índices únicos declarados que não existem no banco (ou existem sem ``unique``)"""
+    missing = []
+    for collection, models in INDEXES.items():
+        existing = await db[collection].index_information()
+        for model in models:
+            document = model.document
+            if document.get("unique") and not existing.get(document["name"], {}).get("unique"):
+                missing.append(f"{collection}.{document['name']}")
+    return missing
+
+
+class IndexHealth:
+    """Resultado da última verificação dos índices únicos (exposto em /api/metrics)"""
+
+    def __init__(self):
+        self.missing_unique: List[str] = []
+        self.checked_at: Optional[datetime] = None
+
+    async def check(self, db: AsyncIOMotorDatabase) -> List[str]:
+        self.missing_unique = await missing_unique_indexes(db)
+        self.checked_at = datetime.utcnow()
+        for name in self.missing_unique:
+            logger.error(f"Índice único ausente: {name} (remova as duplicatas e rode python indexes.py)")
+        return self.missing_unique
+
+    def stats(self) -> dict:
+        return {
+            "healthy": self.checked_at is not None and not self.missing_unique,
+            "missing_unique": self.missing_unique,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+        }
+
+
+index_health = IndexHealth()
+
+
+async def report_indexes(db: AsyncIOMotorDatabase) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Compara os índices existentes com os declarados
+    Retorna, por coleção, os índices ausentes e os extras (não declarados)
+    """
+    report = {}
+    for collection, models in INDEXES.items():
+        declared = {model.document["name"] for model in models}
+        existing = set(await db[collection].index_information()) - {"_id_"}
+        report[collection] = {
+            "missing": sorted(declared - existing),
+            "extra": sorted(existing - declared),
+        }
+    return report
+
+
+def _print_report(report: Dict[str, Dict[str, List[str]]]) -> bool:
+    healthy = True
+    for collection, result in report.items():
+        if result["missing"]:
+            healthy = False
+        if result["missing"] or result["extra"]:
+            print(f"⚠️ {collection}: ausentes={result['missing']} extras={result['extra']}")
+        else:
+            print(f"✅ {collection}: ok")
+    return healthy
+
+
+async def main(check_only: bool = False) -> bool:
+    db = database.get_db()
+    try:
+        if not check_only:
+            created = await ensure_indexes(db)
+            for collection, names in created.items():
+                print(f"📝 {collection}: {', '.join(names) if names else 'nenhum índice criado'}")
+        return _print_report(await report_indexes(db))
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gerencia os índices MongoDB do ZenPress")
+    parser.add_argument("--check", action="store_true", help="apenas relata índices ausentes/extras")
+    args = parser.parse_args()
+    raise SystemExit(0 if asyncio.run(main(check_only=args.check)) else 1)
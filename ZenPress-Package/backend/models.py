@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 import uuid
 
@@ -8,6 +8,7 @@ class UserCreate(BaseModel):
     name: str
     email: EmailStr
     password: str
+    timezone: str = "UTC"  # IANA name, used to bucket practice days
 
 class UserLogin(BaseModel):
     email: EmailStr
@@ -21,6 +22,7 @@ class User(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_premium: bool = False
     subscription_expires: Optional[datetime] = None
+    timezone: str = "UTC"
 
 class UserResponse(BaseModel):
     id: str
@@ -28,8 +30,14 @@ class UserResponse(BaseModel):
     email: str
     is_premium: bool
     subscription_expires: Optional[datetime] = None
+    timezone: str = "UTC"
 
 # Technique Models
+class RatingSummary(BaseModel):
+    total_reviews: int = 0
+    average_rating: float = 0.0
+    histogram: Dict[str, int] = Field(default_factory=dict)  # "1".."5" -> count
+
 class Technique(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -43,6 +51,7 @@ class Technique(BaseModel):
     warnings: List[str]
     is_premium: bool = False
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    rating_summary: Optional[RatingSummary] = None
 
 class TechniqueCreate(BaseModel):
     name: str
@@ -72,6 +81,29 @@ class Session(BaseModel):
     duration: int
     rating: Optional[int] = None
     date: datetime = Field(default_factory=datetime.utcnow)
+    client_id: Optional[str] = None  # idempotency key for offline sync
+
+# Offline Session Sync Models
+SESSION_SYNC_MAX_BATCH = 500
+
+class SessionSyncItem(SessionCreate):
+    client_id: str  # generated on the device, unique per user
+    date: Optional[datetime] = None  # when the session was recorded offline
+
+class SessionSyncRequest(BaseModel):
+    sessions: List[SessionSyncItem] = Field(..., max_length=SESSION_SYNC_MAX_BATCH)
+
+class SessionSyncResult(BaseModel):
+    client_id: str
+    status: str  # 'created', 'duplicate', 'invalid' or 'error'
+    session_id: Optional[str] = None
+    error: Optional[str] = None
+
+class SessionSyncResponse(BaseModel):
+    created: int
+    duplicates: int
+    invalid: int
+    results: List[SessionSyncResult]
 
 # Favorites Models
 class FavoriteCreate(BaseModel):
@@ -90,6 +122,7 @@ class UserStats(BaseModel):
     most_used_complaint: str
     total_time_practiced: int
     streak_days: int
+    longest_streak_days: int = 0
     favorite_techniques: List[str]
 
 class ComplaintStats(BaseModel):
@@ -0,0 +1,118 @@
+"""
+Paginação por cursor (keyset) para endpoints de listagem
+Cada página é uma consulta ``campo < último valor`` sobre uma chave de ordenação
+indexada, com ``_id`` como desempate: o custo por página não cresce com a
+posição na coleção (ao contrário de skip) e nenhuma listagem é truncada
+
+O cursor é opaco para o cliente: base64url dos valores de ordenação do último
+item da página. A próxima página é indicada no cabeçalho ``X-Next-Cursor`` (ou
+no campo ``next_cursor`` de respostas em objeto) e termina quando ausente
+"""
+
+import base64
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from bson import json_util
+from fastapi import HTTPException, Query, Response
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import DESCENDING
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "500"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+Sort = Sequence[Tuple[str, int]]
+
+
+class PageParams:
+    """Dependência com os parâmetros ``cursor`` e ``limit`` da query string"""
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description="Cursor retornado pela página anterior"),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+
+
+def encode_cursor(values: List[Any]) -> str:
+    # json_util preserva datetime e ObjectId
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    # O cursor vem do cliente: qualquer falha de decodificação (base64, JSON,
+    # $oid/$date malformados) é um 400, nunca um 500
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    # Só valores escalares: um documento viraria parte do filtro da consulta
+    if (
+        not isinstance(values, list)
+        or len(values) != size
+        or any(isinstance(value, (dict, list)) for value in values)
+    ):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return values
+
+
+def _with_tiebreak(sort: Sort) -> List[Tuple[str, int]]:
+    keys = list(sort)
+    if not keys or keys[-1][0] != "_id":
+        keys.append(("_id", keys[-1][1] if keys else DESCENDING))
+    return keys
+
+
+def _after(sort: Sort, values: List[Any]) -> Dict[str, Any]:
+    """Filtro dos itens depois de ``values`` na ordem ``sort``"""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prefix: value for (prefix, _), value in zip(sort[:i], values[:i])}
+        clause[field] = {"$lt" if direction == DESCENDING else "$gt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def _sort_values(document: Dict[str, Any], sort: Sort) -> List[Any]:
+    values = []
+    for field, _ in sort:
+        value: Any = document
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        values.append(value)
+    return values
+
+
+async def paginate(
+    collection: AsyncIOMotorCollection,
+    query: Dict[str, Any],
+    sort: Sort,
+    page: PageParams,
+    projection: Optional[Dict[str, Any]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Uma página de ``collection`` e o cursor da próxima (None na última)
+    ``sort`` deve corresponder a um índice que comece pelos campos de igualdade de
+    ``query`` e termine em ``_id``, senão cada página ordena em memória tudo o que casa com o filtro
+    """
+    sort = _with_tiebreak(sort)
+    if projection and any(value for key, value in projection.items() if key != "_id"):
+        # Projeção de inclusão: os campos de ordenação são necessários para o cursor
+        projection = {**projection, **{field: 1 for field, _ in sort}}
+    if page.cursor:
+        query = {"$and": [query, _after(sort, decode_cursor(page.cursor, len(sort)))]}
+
+    # Um item a mais indica se existe próxima página
+    documents = await collection.find(query, projection).sort(sort).limit(page.limit + 1).to_list(page.limit + 1)
+    if len(documents) <= page.limit:
+        return documents, None
+    documents = documents[:page.limit]
+    return documents, encode_cursor(_sort_values(documents[-1], sort))
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -1,24 +1,31 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
+from stripe_gateway import CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest, create_stripe_checkout
 from payment_models import *
-from auth import get_current_user
+from auth import get_admin_user, get_current_user, invalidate_principal
+from database import get_database
+from http_cache import STATIC_CACHE_CONTROL, conditional_response, encode_body
+from pagination import PageParams, paginate, set_next_cursor
+from exports import date_range, export_response
+from rollups import record_event
+from activation_outbox import activation_task, new_activation_job
+from stripe_webhooks import STRIPE_WEBHOOK_SECRET, SignatureVerificationError, checkout_update, construct_event
 from models import UserResponse
 import os
+import logging
 from datetime import datetime, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 
-# MongoDB connection (same as server.py)
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-db_name = os.environ.get('DB_NAME', 'test_database')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
+logger = logging.getLogger(__name__)
 
-# Initialize Stripe
+# Initialize Stripe (pooled async client, closed by the app lifespan)
 stripe_api_key = os.environ.get("STRIPE_API_KEY")
-if not stripe_api_key:
-    raise ValueError("STRIPE_API_KEY environment variable is required")
+stripe_checkout = create_stripe_checkout(stripe_api_key)
 
-stripe_checkout = StripeCheckout(api_key=stripe_api_key)
+# Without webhook events the status endpoint keeps asking Stripe on every poll
+STRIPE_STATUS_FALLBACK_SECONDS = int(os.environ.get("STRIPE_STATUS_FALLBACK_SECONDS", "30"))
+FINAL_PAYMENT_STATUSES = {"paid", "failed", "expired"}
 
 # Create router
 payments_router = APIRouter(prefix="/api/payments/v1", tags=["payments"])
@@ -26,7 +33,8 @@ payments_router = APIRouter(prefix="/api/payments/v1", tags=["payments"])
 @payments_router.post("/checkout/session", response_model=CheckoutSessionResponse)
 async def create_checkout_session(
     checkout_request: CheckoutRequest,
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Create a Stripe checkout session for payment"""
     
@@ -62,7 +70,8 @@ async def create_checkout_session(
             currency="brl",
             success_url=success_url,
             cancel_url=cancel_url,
-            metadata=metadata
+            metadata=metadata,
+            product_name=product.name
         )
         
         # Create checkout session with Stripe
@@ -94,14 +103,12 @@ async def create_checkout_session(
 @payments_router.get("/checkout/status/{session_id}", response_model=CheckoutStatusResponse)
 async def get_checkout_status(
     session_id: str,
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get checkout session status and update payment transaction"""
+    """Get checkout session status, from webhook-fed state when available"""
     
     try:
-        # Get status from Stripe
-        checkout_status = await stripe_checkout.get_checkout_status(session_id)
-        
         # Find existing payment transaction
         transaction = await db.payment_transactions.find_one({"session_id": session_id})
         if not transaction:
@@ -110,111 +117,144 @@ async def get_checkout_status(
                 detail="Transação de pagamento não encontrada"
             )
         
-        # Update transaction status if not already processed
-        if transaction["payment_status"] != "paid":
-            update_data = {
-                "payment_status": checkout_status.payment_status,
-                "status": checkout_status.status,
-                "updated_at": datetime.utcnow()
-            }
-            
-            await db.payment_transactions.update_one(
-                {"session_id": session_id},
-                {"$set": update_data}
-            )
-            
-            # If payment is successful, activate the purchased product
-            if checkout_status.payment_status == "paid":
-                await activate_purchased_product(transaction)
+        if served_locally(transaction):
+            return stored_checkout_status(transaction)
+        
+        # Fallback: no webhook yet for this session, ask Stripe directly
+        checkout_status = await stripe_checkout.get_checkout_status(session_id)
+        await apply_checkout_update(db, transaction, checkout_status.payment_status, checkout_status.status)
         
         return checkout_status
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao verificar status do pagamento: {str(e)}"
         )
 
-async def activate_purchased_product(transaction: dict):
-    """Activate the purchased product based on transaction data"""
+def served_locally(transaction: dict) -> bool:
+    """Whether the stored transaction state is authoritative enough to skip Stripe"""
+    if not STRIPE_WEBHOOK_SECRET:
+        return False
+    if transaction["payment_status"] in FINAL_PAYMENT_STATUSES or transaction.get("webhook_received_at"):
+        return True
+    # Webhooks usually land within seconds; only poll Stripe once they look late
+    return datetime.utcnow() - transaction["created_at"] < timedelta(seconds=STRIPE_STATUS_FALLBACK_SECONDS)
+
+def stored_checkout_status(transaction: dict) -> CheckoutStatusResponse:
+    return CheckoutStatusResponse(
+        status="open" if transaction["status"] == "initiated" else transaction["status"],
+        payment_status=transaction["payment_status"],
+        amount_total=int(round(transaction["amount"] * 100)),
+        currency=transaction.get("currency", "brl"),
+        metadata=transaction.get("metadata") or {}
+    )
+
+async def apply_checkout_update(
+    db: AsyncIOMotorDatabase,
+    transaction: dict,
+    payment_status: str,
+    checkout_status: str,
+    extra: Optional[dict] = None
+) -> bool:
+    """Store a checkout status change; returns True if it performed the transition to paid"""
     
-    product_type = transaction["product_type"]
-    product_id = transaction["product_id"]
-    user_id = transaction["user_id"]
+    # Final states only move to paid (a late success after failed/expired);
+    # paid itself is never downgraded by later or out-of-order updates
+    if payment_status == "paid":
+        previous_status = {"$ne": "paid"}
+    else:
+        previous_status = {"$nin": sorted(FINAL_PAYMENT_STATUSES)}
+    current = transaction["payment_status"]
+    if current == "paid" or (current in FINAL_PAYMENT_STATUSES and payment_status != "paid"):
+        return False
     
+    now = datetime.utcnow()
+    update_data = {
+        "payment_status": payment_status,
+        "status": checkout_status,
+        "updated_at": now,
+        **(extra or {})
+    }
+    if payment_status == "paid":
+        # Outbox: the activation job is written atomically with the paid transition
+        update_data["paid_at"] = now
+        update_data["activation"] = new_activation_job(now)
+    
+    # Only the request that performs the transition to paid enqueues/records it
+    result = await db.payment_transactions.update_one(
+        {"session_id": transaction["session_id"], "payment_status": previous_status},
+        {"$set": update_data}
+    )
+    
+    if payment_status == "paid" and result.modified_count:
+        await record_event(db, "stripe_payments", now, {"amount": transaction["amount"]})
+        activation_task.wake()
+        return True
+    return False
+
+@payments_router.post("/webhook/stripe")
+async def stripe_webhook(request: Request, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Receive Stripe events; each event id is applied at most once"""
+    if not STRIPE_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Webhook do Stripe não configurado")
+    
+    payload = await request.body()
     try:
-        if product_type == "premium_subscription":
-            # Activate premium subscription
-            if "monthly" in product_id:
-                expires_at = datetime.utcnow() + timedelta(days=30)
-            elif "annual" in product_id:
-                expires_at = datetime.utcnow() + timedelta(days=365)
-            else:
-                expires_at = datetime.utcnow() + timedelta(days=30)
-            
-            # Update user to premium
-            await db.users.update_one(
-                {"id": user_id},
-                {"$set": {
-                    "is_premium": True,
-                    "subscription_expires": expires_at,
-                    "subscription_type": product_id
-                }}
-            )
-            
-        elif product_type == "course":
-            # Enroll user in course
-            enrollment = CourseEnrollment(
-                user_id=user_id,
-                course_id=product_id,
-                payment_transaction_id=transaction["id"]
-            )
-            await db.course_enrollments.insert_one(enrollment.dict())
-            
-        elif product_type == "corporate":
-            # Create corporate plan (requires additional setup)
-            corporate_plan = CorporatePlan(
-                company_name=transaction["metadata"].get("company_name", ""),
-                contact_email=transaction["metadata"].get("contact_email", ""),
-                contact_name=transaction["metadata"].get("contact_name", ""),
-                plan_type=product_id,
-                max_users=PRODUCT_PACKAGES[product_id].max_users,
-                monthly_price=PRODUCT_PACKAGES[product_id].price,
-                features=PRODUCT_PACKAGES[product_id].features,
-                payment_transaction_id=transaction["id"],
-                expires_at=datetime.utcnow() + timedelta(days=30)
-            )
-            await db.corporate_plans.insert_one(corporate_plan.dict())
-            
-        elif product_type == "analytics":
-            # Create analytics subscription
-            analytics_sub = AnalyticsSubscription(
-                company_name=transaction["metadata"].get("company_name", ""),
-                contact_email=transaction["metadata"].get("contact_email", ""),
-                contact_name=transaction["metadata"].get("contact_name", ""),
-                plan_type=product_id,
-                monthly_price=PRODUCT_PACKAGES[product_id].price,
-                data_access_level="basic" if "basic" in product_id else "advanced" if "professional" in product_id else "full",
-                api_calls_limit=1000 if "basic" in product_id else 5000 if "professional" in product_id else 999999,
-                payment_transaction_id=transaction["id"],
-                expires_at=datetime.utcnow() + timedelta(days=30)
+        event = construct_event(payload, request.headers.get("stripe-signature"), STRIPE_WEBHOOK_SECRET)
+    except SignatureVerificationError as e:
+        logger.warning(f"Rejected Stripe webhook: {str(e)}")
+        raise HTTPException(status_code=400, detail="Assinatura do webhook inválida")
+    
+    if await db.stripe_events.find_one({"_id": event["id"]}, {"_id": 1}):
+        return {"received": True, "duplicate": True}
+    
+    update = checkout_update(event)
+    session_id = update[0] if update else None
+    if update and session_id:
+        transaction = await db.payment_transactions.find_one({"session_id": session_id})
+        if transaction:
+            _, payment_status, checkout_status = update
+            await apply_checkout_update(
+                db, transaction, payment_status, checkout_status,
+                {"webhook_received_at": datetime.utcnow(), "last_event_id": event["id"]}
             )
-            await db.analytics_subscriptions.insert_one(analytics_sub.dict())
-            
-    except Exception as e:
-        print(f"Erro ao ativar produto: {str(e)}")
-        # Log error but don't fail the payment verification
+        else:
+            logger.warning(f"Stripe event {event['id']} for unknown session {session_id}")
+    
+    # Recorded after processing: a failure above makes Stripe retry the delivery,
+    # and concurrent duplicates are harmless because the paid transition is conditional
+    try:
+        await db.stripe_events.insert_one({
+            "_id": event["id"],
+            "type": event["type"],
+            "session_id": session_id,
+            "received_at": datetime.utcnow()
+        })
+    except DuplicateKeyError:
+        return {"received": True, "duplicate": True}
+    
+    return {"received": True}
+
+# Pre-serialized catalog bodies (the catalogs are fixed at import time)
+_product_bodies = {None: encode_body(list(PRODUCT_PACKAGES.values()))}
+for _product_type in {p.type for p in PRODUCT_PACKAGES.values()}:
+    _product_bodies[_product_type] = encode_body(
+        [p for p in PRODUCT_PACKAGES.values() if p.type == _product_type]
+    )
+_courses_body = encode_body(list(COURSE_CATALOG.values()))
 
 # Product listing endpoints
 @payments_router.get("/products", response_model=List[ProductPackage])
-async def get_products(product_type: Optional[str] = None):
+async def get_products(request: Request, product_type: Optional[str] = None):
     """Get available product packages"""
-    products = list(PRODUCT_PACKAGES.values())
-    
-    if product_type:
-        products = [p for p in products if p.type == product_type]
+    cached = _product_bodies.get(product_type or None)
+    if cached is None:
+        cached = encode_body([])
     
-    return products
+    return conditional_response(request, cached, STATIC_CACHE_CONTROL)
 
 @payments_router.get("/products/{product_id}", response_model=ProductPackage)
 async def get_product(product_id: str):
@@ -229,9 +269,9 @@ async def get_product(product_id: str):
 
 # Course endpoints
 @payments_router.get("/courses", response_model=List[Course])
-async def get_courses():
+async def get_courses(request: Request):
     """Get available courses"""
-    return list(COURSE_CATALOG.values())
+    return conditional_response(request, _courses_body, STATIC_CACHE_CONTROL)
 
 @payments_router.get("/courses/{course_id}", response_model=Course)
 async def get_course(course_id: str):
@@ -245,7 +285,10 @@ async def get_course(course_id: str):
     return COURSE_CATALOG[course_id]
 
 @payments_router.get("/my-courses", response_model=List[Course])
-async def get_my_courses(current_user: UserResponse = Depends(get_current_user)):
+async def get_my_courses(
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
     """Get user's enrolled courses"""
     enrollments = await db.course_enrollments.find({"user_id": current_user.id}).to_list(100)
     course_ids = [e["course_id"] for e in enrollments]
@@ -257,29 +300,62 @@ async def get_my_courses(current_user: UserResponse = Depends(get_current_user))
     
     return courses
 
-# Transaction history
+# Transaction history (outbox bookkeeping is not part of the API model)
+TRANSACTION_PROJECTION = {"activation": 0}
+
 @payments_router.get("/transactions", response_model=List[PaymentTransaction])
-async def get_user_transactions(current_user: UserResponse = Depends(get_current_user)):
-    """Get user's payment transaction history"""
-    transactions = await db.payment_transactions.find(
-        {"user_id": current_user.id}
-    ).sort("created_at", -1).to_list(100)
+async def get_user_transactions(
+    response: Response,
+    page: PageParams = Depends(),
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get user's payment transaction history (one page, next page in X-Next-Cursor)"""
+    transactions, next_cursor = await paginate(
+        db.payment_transactions, {"user_id": current_user.id}, [("created_at", -1)], page, TRANSACTION_PROJECTION
+    )
+    set_next_cursor(response, next_cursor)
     
     return [PaymentTransaction(**transaction) for transaction in transactions]
 
-# Admin endpoints (could be protected with admin role)
+# Admin endpoints (accounts listed in ADMIN_EMAILS)
 @payments_router.get("/admin/transactions", response_model=List[PaymentTransaction])
-async def get_all_transactions(current_user: UserResponse = Depends(get_current_user)):
-    """Get all payment transactions (admin only)"""
-    # TODO: Add admin role check
-    transactions = await db.payment_transactions.find().sort("created_at", -1).to_list(1000)
+async def get_all_transactions(
+    response: Response,
+    page: PageParams = Depends(),
+    current_user: UserResponse = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get all payment transactions (admin only), one page at a time"""
+    transactions, next_cursor = await paginate(
+        db.payment_transactions, {}, [("created_at", -1)], page, TRANSACTION_PROJECTION
+    )
+    set_next_cursor(response, next_cursor)
     return [PaymentTransaction(**transaction) for transaction in transactions]
 
+@payments_router.get("/admin/export/transactions")
+async def export_transactions(
+    format: str = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: UserResponse = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Stream the full transaction ledger as NDJSON or CSV (admin only)"""
+    return export_response(
+        db.payment_transactions,
+        date_range("created_at", since, until),
+        list(PaymentTransaction.model_fields),
+        format,
+        "transactions"
+    )
+
 @payments_router.get("/admin/revenue")
-async def get_revenue_stats(current_user: UserResponse = Depends(get_current_user)):
+async def get_revenue_stats(
+    current_user: UserResponse = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
     """Get revenue statistics (admin only)"""
-    # TODO: Add admin role check
-    
     # Calculate revenue by product type
     pipeline = [
         {"$match": {"payment_status": "paid"}},
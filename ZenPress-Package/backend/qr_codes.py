@@ -0,0 +1,166 @@
+"""
+Renderização de QR Codes para pagamentos crypto/PIX
+Endereços fixos são renderizados uma única vez e memorizados; QR Codes por
+transação (PIX) são renderizados fora do event loop, em um pool de threads com
+fila limitada
+
+Formatos: "png" (data URI base64, padrão), "svg" (data URI SVG compacto) e
+"url" (URL de imagem cacheável servida por /api/crypto/qr/...)
+"""
+
+import asyncio
+import base64
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from typing import Tuple
+from urllib.parse import quote
+
+import qrcode
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+QR_RENDER_WORKERS = int(os.environ.get("QR_RENDER_WORKERS", "2"))
+QR_RENDER_QUEUE_LIMIT = int(os.environ.get("QR_RENDER_QUEUE_LIMIT", "16"))
+
+QR_FORMATS = ("png", "svg", "url")
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+SVG_URI_SAFE = " ='/:."
+
+
+def _build(data: str) -> qrcode.QRCode:
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def _svg(qr: qrcode.QRCode) -> bytes:
+    """
+    SVG compacto: grade de 1 unidade por módulo e um traço por sequência
+    horizontal de módulos escuros (em vez de um retângulo por módulo)
+    """
+    matrix = qr.get_matrix()
+    size = len(matrix)
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        end = None  # fim da sequência anterior na linha (para movimentos relativos)
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            runs.append(f"M{start} {y}.5h{x - start}" if end is None else f"m{start - end} 0h{x - start}")
+            end = x
+    return (
+        f"<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 {size} {size}' shape-rendering='crispEdges'>"
+        f"<path fill='#fff' d='M0 0h{size}v{size}H0z'/>"
+        f"<path stroke='#000' d='{''.join(runs)}'/></svg>"
+    ).encode()
+
+
+def render(data: str, image_format: str = "png") -> bytes:
+    """Renderiza o QR Code como PNG ou SVG (bytes)"""
+    qr = _build(data)
+    if image_format == "svg":
+        return _svg(qr)
+    buffer = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def data_uri(image: bytes, image_format: str = "png") -> str:
+    if image_format == "svg":
+        # Apenas os caracteres problemáticos em URIs (<, >, #) são escapados
+        return "data:image/svg+xml;utf8," + quote(image.decode(), safe=SVG_URI_SAFE)
+    return f"data:image/png;base64,{base64.b64encode(image).decode()}"
+
+
+@lru_cache(maxsize=64)
+def static_qr_code(data: str, image_format: str = "png") -> Tuple[bytes, str]:
+    """
+    QR Code de um endereço fixo: (imagem, data URI), renderizado uma vez por
+    endereço e formato
+    """
+    image = render(data, image_format)
+    return image, data_uri(image, image_format)
+
+
+def _timed_render(data: str, image_format: str):
+    started = time.perf_counter()
+    image = render(data, image_format)
+    return image, started, time.perf_counter()
+
+
+class QRCodeRenderPool:
+    """
+    Executor dedicado para QR Codes por transação com admissão limitada
+    Com ``workers + queue_limit`` renderizações em andamento, novas chamadas
+    recebem 429 em vez de se acumular atrás do pool
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = max(1, workers)
+        self.queue_limit = max(0, queue_limit)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="qr-render")
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_render_seconds = 0.0
+        self.total_wait_seconds = 0.0
+
+    async def render(self, data: str, image_format: str = "png") -> bytes:
+        if self.in_flight >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Muitas solicitações de QR Code, tente novamente em instantes",
+                headers={"Retry-After": "1"},
+            )
+
+        self.in_flight += 1
+        submitted = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            image, started, finished = await loop.run_in_executor(
+                self._executor, _timed_render, data, image_format
+            )
+        finally:
+            self.in_flight -= 1
+
+        self.completed += 1
+        self.total_render_seconds += finished - started
+        self.total_wait_seconds += max(0.0, started - submitted)
+        return image
+
+    def stats(self) -> dict:
+        completed = self.completed or 1
+        cache = static_qr_code.cache_info()
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_render_ms": round(self.total_render_seconds / completed * 1000, 2),
+            "avg_wait_ms": round(self.total_wait_seconds / completed * 1000, 2),
+            "static_cache": {"entries": cache.currsize, "hits": cache.hits, "misses": cache.misses},
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+qr_render_pool = QRCodeRenderPool(QR_RENDER_WORKERS, QR_RENDER_QUEUE_LIMIT)
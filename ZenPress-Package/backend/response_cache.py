@@ -0,0 +1,148 @@
+"""
+Cache de respostas em memória para endpoints públicos de analytics
+TTL por rota, stale-while-revalidate e single-flight: N requisições concorrentes
+para a mesma chave expirada disparam um único recálculo
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() != "false"
+
+
+class CachePolicy:
+    """``ttl``: segundos em que o valor é fresco; ``stale``: segundos extras servindo o valor antigo"""
+
+    def __init__(self, ttl: float, stale: float = 0.0):
+        self.ttl = ttl
+        self.stale = stale
+
+
+# Políticas por rota
+REVIEW_STATS_POLICY = CachePolicy(ttl=30, stale=300)
+COMPLAINT_STATS_POLICY = CachePolicy(ttl=60, stale=600)
+COMMUNITY_TRENDS_POLICY = CachePolicy(ttl=60, stale=600)
+DATA_AVAILABILITY_POLICY = CachePolicy(ttl=60, stale=600)
+COMMUNITY_COUNTS_POLICY = CachePolicy(ttl=60)
+
+
+class _Entry:
+    def __init__(self):
+        self.value: Any = None
+        self.has_value = False
+        self.fresh_until = 0.0
+        self.stale_until = 0.0
+        self.inflight: Optional[asyncio.Task] = None
+        # Estatísticas
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.computations = 0
+        self.compute_ms_total = 0.0
+        self.last_compute_ms = 0.0
+
+    def stats(self) -> dict:
+        requests = self.hits + self.stale_hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "hit_rate": round((self.hits + self.stale_hits) / requests, 3) if requests else 0.0,
+            "computations": self.computations,
+            "last_compute_ms": self.last_compute_ms,
+            "avg_compute_ms": round(self.compute_ms_total / self.computations, 2) if self.computations else 0.0,
+        }
+
+
+class ResponseCache:
+    """Valores calculados por chave, com recálculo único por chave em andamento"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._entries: Dict[str, _Entry] = {}
+        self._tasks: Set[asyncio.Task] = set()  # mantém referências às tarefas em andamento
+
+    async def get(self, key: str, compute: Callable[[], Awaitable[Any]], policy: CachePolicy) -> Any:
+        if not self.enabled:
+            return await compute()
+
+        entry = self._entries.setdefault(key, _Entry())
+        now = time.monotonic()
+
+        if entry.has_value and now < entry.fresh_until:
+            entry.hits += 1
+            return entry.value
+
+        if entry.has_value and now < entry.stale_until:
+            # Serve o valor antigo e recalcula em background (uma vez)
+            entry.stale_hits += 1
+            if entry.inflight is None:
+                self._start(key, entry, compute, policy)
+            return entry.value
+
+        if entry.inflight is not None:
+            entry.coalesced += 1
+        else:
+            entry.misses += 1
+            self._start(key, entry, compute, policy)
+        # shield: o cancelamento de uma requisição não interrompe o recálculo compartilhado
+        return await asyncio.shield(entry.inflight)
+
+    def _start(self, key: str, entry: _Entry, compute: Callable[[], Awaitable[Any]], policy: CachePolicy) -> None:
+        task = asyncio.create_task(self._compute(entry, compute, policy), name=f"response_cache:{key}")
+        entry.inflight = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda t: self._finished(key, entry, t))
+
+    async def _compute(self, entry: _Entry, compute: Callable[[], Awaitable[Any]], policy: CachePolicy) -> Any:
+        started = time.perf_counter()
+        value = await compute()
+        elapsed = (time.perf_counter() - started) * 1000
+        entry.computations += 1
+        entry.compute_ms_total += elapsed
+        entry.last_compute_ms = round(elapsed, 2)
+
+        now = time.monotonic()
+        entry.value = value
+        entry.has_value = True
+        entry.fresh_until = now + policy.ttl
+        entry.stale_until = entry.fresh_until + policy.stale
+        return value
+
+    def _finished(self, key: str, entry: _Entry, task: asyncio.Task) -> None:
+        if entry.inflight is task:
+            entry.inflight = None
+        if not task.cancelled() and task.exception() is not None:
+            # Em recálculos em background o valor antigo continua valendo até stale_until
+            entry.errors += 1
+            logger.error(f"Erro ao calcular resposta em cache {key}: {str(task.exception())}")
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Descarta o valor de uma chave (ou de todas) sem perder as estatísticas"""
+        if key is None:
+            entries = list(self._entries.values())
+        else:
+            entries = [self._entries[key]] if key in self._entries else []
+        for entry in entries:
+            entry.has_value = False
+            entry.value = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "computing": len(self._tasks),
+            "keys": {key: entry.stats() for key, entry in self._entries.items()},
+        }
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_ENABLED)
@@ -0,0 +1,298 @@
+"""
+Retenção por coortes para ZenPress
+Coortes semanais (semana do cadastro) × semana N de atividade, e histograma de
+sessões por hora do dia, calculados de forma incremental com NumPy/pandas
+
+Cada execução processa apenas os cadastros e sessões inseridos desde a última
+marca d'água (``_id`` crescente) e acumula:
+
+- ``retention_activity``: um documento por par (usuário, semana ativa), para
+  contar usuários distintos sem reler o histórico
+- ``retention_cohorts``: {_id: semana da coorte, size, active: {"N": usuários}}
+- ``retention_state``: marcas d'água e histograma por hora (UTC)
+
+Os ``_id`` são gerados pelos clientes (cada processo da API), então um
+documento pode chegar com ``_id`` menor que uma marca já processada. Cada lote
+só considera ``_id`` criados há mais de ``RETENTION_SAFETY_LAG_SECONDS``, tempo
+para as inserções em andamento chegarem ao banco.
+
+O relatório é mantido em memória e servido pelo dashboard sem consultas.
+
+Uso:
+    python retention.py rebuild    # apaga o estado e reprocessa tudo
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from database import database
+
+logger = logging.getLogger(__name__)
+
+RETENTION_REFRESH_SECONDS = float(os.environ.get("RETENTION_REFRESH_SECONDS", "300"))
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", "5000"))
+RETENTION_COHORT_WEEKS = int(os.environ.get("RETENTION_COHORT_WEEKS", "12"))
+# Atraso mínimo (pelo timestamp do _id) antes de um documento entrar na marca d'água
+RETENTION_SAFETY_LAG_SECONDS = float(os.environ.get("RETENTION_SAFETY_LAG_SECONDS", "120"))
+STATE_ID = "state"
+# Apenas um worker processa eventos por vez; os demais só leem os agregados.
+# O lease é renovado a cada lote, então basta cobrir o tempo de um lote
+LEASE_SECONDS = max(RETENTION_REFRESH_SECONDS, 60)
+
+# Semanas começam na segunda-feira; 1970-01-05 é a primeira segunda após a época
+EPOCH_MONDAY = date(1970, 1, 5)
+
+
+def week_indices(moments: pd.Series) -> np.ndarray:
+    """Número da semana (desde 1970-01-05) de cada datetime UTC"""
+    days = moments.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]").astype(np.int64)
+    return (days - 4) // 7
+
+
+def week_start(week: int) -> date:
+    return EPOCH_MONDAY + timedelta(weeks=int(week))
+
+
+def _id_range(watermark: Optional[ObjectId]) -> Dict[str, ObjectId]:
+    """Faixa de ``_id`` do próximo lote: após a marca e antes do atraso de segurança"""
+    bounds = {"$lt": ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=RETENTION_SAFETY_LAG_SECONDS))}
+    if watermark is not None:
+        bounds["$gt"] = watermark
+    return bounds
+
+
+async def _process_users(db: AsyncIOMotorDatabase, state: Dict[str, Any], batch_size: int) -> int:
+    """Soma novos cadastros ao tamanho de cada coorte"""
+    query = {"created_at": {"$type": "date"}, "_id": _id_range(state.get("users_watermark"))}
+    users = await db.users.find(query, {"_id": 1, "created_at": 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+    if not users:
+        return 0
+
+    frame = pd.DataFrame(users)
+    sizes = pd.Series(week_indices(frame["created_at"])).value_counts()
+    await db.retention_cohorts.bulk_write([
+        UpdateOne({"_id": int(week)}, {"$inc": {"size": int(count)}}, upsert=True)
+        for week, count in sizes.items()
+    ], ordered=False)
+    await db.retention_state.update_one(
+        {"_id": STATE_ID}, {"$set": {"users_watermark": users[-1]["_id"]}}, upsert=True
+    )
+    state["users_watermark"] = users[-1]["_id"]
+    return len(users)
+
+
+async def _process_sessions(db: AsyncIOMotorDatabase, state: Dict[str, Any], batch_size: int) -> int:
+    """Marca (usuário, semana) ativos e atualiza a matriz e o histograma por hora"""
+    query = {"date": {"$type": "date"}, "_id": _id_range(state.get("sessions_watermark"))}
+    sessions = await db.sessions.find(
+        query, {"_id": 1, "user_id": 1, "date": 1}
+    ).sort("_id", 1).limit(batch_size).to_list(batch_size)
+    if not sessions:
+        return 0
+
+    frame = pd.DataFrame(sessions)
+    frame["week"] = week_indices(frame["date"])
+    hours = np.bincount(frame["date"].dt.hour.to_numpy(), minlength=24)
+
+    # Coorte de cada usuário do lote
+    user_ids = frame["user_id"].dropna().unique().tolist()
+    users = await db.users.find(
+        {"id": {"$in": user_ids}, "created_at": {"$type": "date"}}, {"_id": 0, "id": 1, "created_at": 1}
+    ).to_list(len(user_ids))
+    pairs = frame[["user_id", "week"]].drop_duplicates()
+    if users:
+        cohorts = pd.DataFrame(users)
+        cohorts["cohort"] = week_indices(cohorts["created_at"])
+        pairs = pairs.merge(cohorts[["id", "cohort"]], left_on="user_id", right_on="id")
+        pairs["offset"] = pairs["week"] - pairs["cohort"]
+        pairs = pairs[pairs["offset"] >= 0].reset_index(drop=True)
+    else:
+        pairs = pairs.iloc[0:0]
+
+    if len(pairs):
+        # Só pares inéditos contam: o upsert diz quais foram inseridos agora
+        pairs["key"] = pairs["user_id"].astype(str) + ":" + pairs["week"].astype(str)
+        result = await db.retention_activity.bulk_write([
+            UpdateOne({"_id": key}, {"$setOnInsert": {"cohort": int(cohort)}}, upsert=True)
+            for key, cohort in pairs[["key", "cohort"]].itertuples(index=False)
+        ], ordered=False)
+        new_pairs = pairs[pairs["key"].isin(list(result.upserted_ids.values()))]
+        if len(new_pairs):
+            active = new_pairs.groupby(["cohort", "offset"]).size()
+            updates: Dict[int, Dict[str, int]] = {}
+            for (cohort, offset), count in active.items():
+                updates.setdefault(int(cohort), {})[f"active.{int(offset)}"] = int(count)
+            await db.retention_cohorts.bulk_write([
+                UpdateOne({"_id": cohort}, {"$inc": increments}, upsert=True)
+                for cohort, increments in updates.items()
+            ], ordered=False)
+
+    await db.retention_state.update_one(
+        {"_id": STATE_ID},
+        {
+            "$inc": {f"hours.{hour}": int(count) for hour, count in enumerate(hours) if count},
+            "$set": {"sessions_watermark": sessions[-1]["_id"]},
+        },
+        upsert=True,
+    )
+    state["sessions_watermark"] = sessions[-1]["_id"]
+    return len(sessions)
+
+
+def build_report(
+    cohorts: List[Dict[str, Any]],
+    hours: Dict[str, int],
+    current_week: int,
+    weeks: int = RETENTION_COHORT_WEEKS,
+) -> Dict[str, Any]:
+    """Matriz de retenção (% da coorte ativa na semana N) e histograma por hora"""
+    histogram = np.zeros(24, dtype=np.int64)
+    for hour, count in (hours or {}).items():
+        histogram[int(hour)] = count
+
+    recent = [c for c in cohorts if current_week - weeks < c["_id"] <= current_week and c.get("size")]
+    rows = []
+    user_retention = 0.0
+    if recent:
+        sizes = pd.Series({c["_id"]: c["size"] for c in recent}).sort_index()
+        active = pd.DataFrame(
+            {c["_id"]: {int(n): v for n, v in (c.get("active") or {}).items()} for c in recent}
+        ).T.reindex(index=sizes.index, columns=range(weeks)).fillna(0)
+        rates = active.div(sizes, axis=0) * 100
+
+        for cohort, size in sizes.items():
+            elapsed = current_week - cohort  # semanas N já iniciadas
+            rows.append({
+                "week_start": week_start(cohort).isoformat(),
+                "size": int(size),
+                "retention": [round(float(v), 1) for v in rates.loc[cohort, :elapsed].to_numpy()],
+            })
+
+        # Retenção na semana 1, apenas coortes cuja semana 1 já terminou
+        complete = sizes.index[sizes.index + 1 < current_week]
+        if len(complete):
+            user_retention = float(active.loc[complete, 1].sum() / sizes.loc[complete].sum() * 100)
+
+    return {
+        "cohorts": rows,
+        "user_retention": round(user_retention, 1),
+        "hour_histogram": histogram.tolist(),
+        "peak_hour": int(histogram.argmax()) if histogram.any() else None,
+        "computed_at": datetime.utcnow().isoformat(),
+    }
+
+
+async def _acquire_lease(db: AsyncIOMotorDatabase, owner: str) -> bool:
+    now = datetime.utcnow()
+    try:
+        await db.retention_state.find_one_and_update(
+            {"_id": STATE_ID, "$or": [{"lease_until": {"$exists": False}}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"lease_until": now + timedelta(seconds=LEASE_SECONDS), "lease_owner": owner}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # Outro worker detém o lease (o filtro não casou e o upsert colidiu)
+        return False
+    return True
+
+
+async def _renew_lease(db: AsyncIOMotorDatabase, owner: str) -> bool:
+    """Estende o lease; False se outro worker o assumiu"""
+    result = await db.retention_state.update_one(
+        {"_id": STATE_ID, "lease_owner": owner},
+        {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)}},
+    )
+    return result.matched_count == 1
+
+
+async def _release_lease(db: AsyncIOMotorDatabase, owner: str) -> None:
+    await db.retention_state.update_one(
+        {"_id": STATE_ID, "lease_owner": owner}, {"$unset": {"lease_until": "", "lease_owner": ""}}
+    )
+
+
+class RetentionEngine:
+    """Processa os eventos novos e mantém o último relatório em memória"""
+
+    def __init__(self, batch_size: int = RETENTION_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.owner = str(uuid.uuid4())
+        self.report: Optional[Dict[str, Any]] = None
+        self._lock = asyncio.Lock()
+
+    async def _drain(self, db: AsyncIOMotorDatabase, process, state: Dict[str, Any]) -> bool:
+        """
+        Processa lotes até esgotar os eventos; False se o lease foi perdido
+        Os incrementos não são idempotentes: sem o lease, outro worker pode
+        estar aplicando os mesmos lotes
+        """
+        while True:
+            if not await _renew_lease(db, self.owner):
+                logger.warning("Lease de retenção perdido; processamento interrompido")
+                return False
+            if await process(db, state, self.batch_size) < self.batch_size:
+                return True
+
+    async def refresh(self, db: Optional[AsyncIOMotorDatabase] = None) -> Dict[str, Any]:
+        db = db if db is not None else database.get_db()
+        async with self._lock:
+            if await _acquire_lease(db, self.owner):
+                try:
+                    state = await db.retention_state.find_one({"_id": STATE_ID}) or {}
+                    if await self._drain(db, _process_users, state):
+                        await self._drain(db, _process_sessions, state)
+                finally:
+                    await _release_lease(db, self.owner)
+
+            state = await db.retention_state.find_one({"_id": STATE_ID}) or {}
+            current_week = int(week_indices(pd.Series([datetime.utcnow()]))[0])
+            cohorts = await db.retention_cohorts.find(
+                {"_id": {"$gt": current_week - RETENTION_COHORT_WEEKS}}
+            ).to_list(None)
+            self.report = build_report(cohorts, state.get("hours") or {}, current_week)
+            return self.report
+
+    async def get_report(self, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        # A tarefa periódica mantém o relatório; só calcula aqui na primeira vez
+        if self.report is None:
+            return await self.refresh(db)
+        return self.report
+
+
+retention_engine = RetentionEngine()
+
+
+async def rebuild(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    for collection in ("retention_state", "retention_cohorts", "retention_activity"):
+        await db[collection].delete_many({})
+    return await RetentionEngine().refresh(db)
+
+
+async def main(command: str) -> None:
+    db = database.get_db()
+    try:
+        if command == "rebuild":
+            report = await rebuild(db)
+            print(f"✅ Retenção recalculada: {len(report['cohorts'])} coortes, "
+                  f"retenção semana 1 = {report['user_retention']}%")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retenção por coortes")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+    asyncio.run(main(args.command))
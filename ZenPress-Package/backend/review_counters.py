@@ -0,0 +1,191 @@
+"""
+Contadores atômicos de avaliações para ZenPress
+Histograma global de 1 a 5 estrelas e resumos por técnica (histograma e ids
+das últimas avaliações em ``technique_review_summaries``), mantidos com $inc
+na criação/remoção
+
+Uso:
+    python review_counters.py backfill    # reconstrói os contadores a partir de ``reviews``
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne, ReturnDocument
+
+from database import database
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_COUNTER_ID = "global"
+RATINGS = (1, 2, 3, 4, 5)
+# Quantidade de avaliações recentes mantidas por técnica
+TECHNIQUE_LATEST_REVIEWS = 5
+
+
+def histogram_increments(rating: int, delta: int) -> Dict[str, int]:
+    return {f"histogram.{rating}": delta}
+
+
+async def record_review(db: AsyncIOMotorDatabase, review: Dict[str, Any], delta: int = 1) -> None:
+    """Aplica uma avaliação criada (delta=1) ou removida (delta=-1) aos contadores"""
+    now = datetime.utcnow()
+    await db.review_counters.update_one(
+        {"_id": GLOBAL_COUNTER_ID},
+        {
+            "$inc": histogram_increments(review["rating"], delta),
+            "$set": {"updated_at": now},
+        },
+        upsert=True,
+    )
+
+    if delta > 0:
+        # Mais recente primeiro, limitado às últimas K avaliações
+        await db.technique_review_summaries.update_one(
+            {"_id": review["technique_id"]},
+            {
+                "$inc": histogram_increments(review["rating"], delta),
+                "$push": {"latest": {"$each": [review["id"]], "$position": 0, "$slice": TECHNIQUE_LATEST_REVIEWS}},
+                "$set": {"updated_at": now},
+            },
+            upsert=True,
+        )
+        return
+
+    before = await db.technique_review_summaries.find_one_and_update(
+        {"_id": review["technique_id"]},
+        {
+            "$inc": histogram_increments(review["rating"], delta),
+            "$pull": {"latest": review["id"]},
+            "$set": {"updated_at": now},
+        },
+        projection={"latest": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if before and review["id"] in (before.get("latest") or []):
+        # A avaliação removida estava entre as últimas: completa a lista
+        latest = await latest_review_ids(db, review["technique_id"])
+        await db.technique_review_summaries.update_one(
+            {"_id": review["technique_id"]},
+            {"$set": {"latest": latest}},
+        )
+
+
+async def latest_review_ids(db: AsyncIOMotorDatabase, technique_id: str) -> List[str]:
+    cursor = db.reviews.find({"technique_id": technique_id}, {"_id": 0, "id": 1})
+    reviews = await cursor.sort("created_at", -1).limit(TECHNIQUE_LATEST_REVIEWS).to_list(TECHNIQUE_LATEST_REVIEWS)
+    return [review["id"] for review in reviews]
+
+
+def normalize_histogram(document: Dict[str, Any]) -> Dict[int, int]:
+    stored = (document or {}).get("histogram") or {}
+    return {rating: max(0, int(stored.get(str(rating), 0))) for rating in RATINGS}
+
+
+async def get_histogram(db: AsyncIOMotorDatabase) -> Dict[int, int]:
+    return normalize_histogram(await db.review_counters.find_one({"_id": GLOBAL_COUNTER_ID}))
+
+
+def stats_from_histogram(histogram: Dict[int, int]) -> Dict[str, Any]:
+    """Deriva os campos de ReviewStats a partir do histograma"""
+    total_reviews = sum(histogram.values())
+    positive_reviews = histogram[4] + histogram[5]  # 4-5 estrelas
+    neutral_reviews = histogram[3]                  # 3 estrelas
+    negative_reviews = histogram[1] + histogram[2]  # 1-2 estrelas
+
+    average_rating = sum(rating * count for rating, count in histogram.items()) / total_reviews if total_reviews else 0
+    positive_percentage = (positive_reviews / total_reviews) * 100 if total_reviews else 0
+    negative_percentage = (negative_reviews / total_reviews) * 100 if total_reviews else 0
+
+    return {
+        "total_reviews": total_reviews,
+        "positive_reviews": positive_reviews,
+        "neutral_reviews": neutral_reviews,
+        "negative_reviews": negative_reviews,
+        "average_rating": round(average_rating, 2),
+        "positive_percentage": round(positive_percentage, 1),
+        "negative_percentage": round(negative_percentage, 1),
+    }
+
+
+def rating_summary(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Resumo de uma técnica exposto no catálogo (campos de RatingSummary)"""
+    histogram = normalize_histogram(document)
+    total_reviews = sum(histogram.values())
+    average_rating = sum(rating * count for rating, count in histogram.items()) / total_reviews if total_reviews else 0
+    return {
+        "total_reviews": total_reviews,
+        "average_rating": round(average_rating, 2),
+        "histogram": {str(rating): count for rating, count in histogram.items()},
+    }
+
+
+async def get_rating_summaries(db: AsyncIOMotorDatabase) -> Dict[str, Dict[str, Any]]:
+    """Resumos de todas as técnicas (um documento pequeno por técnica)"""
+    summaries = {}
+    async for document in db.technique_review_summaries.find({}, {"histogram": 1}):
+        summaries[document["_id"]] = rating_summary(document)
+    return summaries
+
+
+async def get_technique_summary(db: AsyncIOMotorDatabase, technique_id: str) -> Dict[str, Any]:
+    return await db.technique_review_summaries.find_one({"_id": technique_id}) or {}
+
+
+async def backfill(db: AsyncIOMotorDatabase) -> Dict[int, int]:
+    """Reconstrói o histograma global e os resumos por técnica a partir de ``reviews``"""
+    histogram = {str(rating): 0 for rating in RATINGS}
+    techniques: Dict[str, Dict[str, int]] = {}
+    pipeline = [{"$group": {"_id": {"technique_id": "$technique_id", "rating": "$rating"}, "count": {"$sum": 1}}}]
+    async for group in db.reviews.aggregate(pipeline):
+        rating = str(group["_id"].get("rating"))
+        if rating not in histogram:
+            continue
+        histogram[rating] += group["count"]
+        technique_histogram = techniques.setdefault(group["_id"]["technique_id"], {})
+        technique_histogram[rating] = group["count"]
+
+    now = datetime.utcnow()
+    await db.review_counters.replace_one(
+        {"_id": GLOBAL_COUNTER_ID},
+        {"histogram": histogram, "updated_at": now},
+        upsert=True,
+    )
+
+    operations = [
+        ReplaceOne(
+            {"_id": technique_id},
+            {
+                "histogram": technique_histogram,
+                "latest": await latest_review_ids(db, technique_id),
+                "updated_at": now,
+            },
+            upsert=True,
+        )
+        for technique_id, technique_histogram in techniques.items()
+    ]
+    await db.technique_review_summaries.delete_many({"_id": {"$nin": list(techniques)}})
+    if operations:
+        await db.technique_review_summaries.bulk_write(operations, ordered=False)
+    return normalize_histogram({"histogram": histogram})
+
+
+async def main(command: str) -> None:
+    db = database.get_db()
+    try:
+        if command == "backfill":
+            histogram = await backfill(db)
+            print(f"✅ Histograma reconstruído: {histogram}")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Contadores atômicos de avaliações")
+    parser.add_argument("command", choices=["backfill"])
+    args = parser.parse_args()
+    asyncio.run(main(args.command))
@@ -4,15 +4,27 @@ Contador de avaliações positivas/negativas estilo Google Play
 """
 
 from fastapi import APIRouter, HTTPException, Depends, status
-from motor.motor_asyncio import AsyncIOMotorClient
+from pagination import PageParams, paginate
+from exports import date_range, export_response
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 import uuid
+import asyncio
 from pydantic import BaseModel
 import logging
 
 from models import UserResponse
-from auth import get_current_user, get_premium_user
+from database import get_database
+from catalog import catalog
+from rollups import record_event
+from response_cache import REVIEW_STATS_POLICY, response_cache
+from retention import retention_engine
+from review_counters import (
+    get_histogram, get_technique_summary, normalize_histogram, rating_summary, record_review,
+    stats_from_histogram
+)
+from auth import get_admin_user, get_current_user, get_premium_user
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -63,17 +75,20 @@ class DeveloperAnalytics(BaseModel):
     recent_feedback: List[ReviewResponse]
     trends: Dict[str, Any]
 
+# Campos necessários para ReviewResponse (evita trafegar o documento inteiro)
+REVIEW_RESPONSE_PROJECTION = {field: 1 for field in ReviewResponse.model_fields}
+REVIEW_RESPONSE_PROJECTION["_id"] = 0
+
 @reviews_router.post("/create", response_model=ReviewResponse)
 async def create_review(
     review_data: ReviewCreate,
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Criar uma avaliação após uma sessão de técnica
     """
     try:
-        from server import db
-        
         # Validar rating
         if not 1 <= review_data.rating <= 5:
             raise HTTPException(
@@ -82,7 +97,7 @@ async def create_review(
             )
         
         # Buscar informações da técnica
-        technique = await db.techniques.find_one({"id": review_data.technique_id})
+        technique = (await catalog.get_snapshot(db)).get(review_data.technique_id)
         if not technique:
             raise HTTPException(
                 status_code=404,
@@ -97,7 +112,7 @@ async def create_review(
             "id": review_id,
             "user_id": current_user.id,
             "technique_id": review_data.technique_id,
-            "technique_name": technique.get("name", ""),
+            "technique_name": technique.name,
             "rating": review_data.rating,
             "comment": review_data.comment or "",
             "session_duration": review_data.session_duration,
@@ -107,6 +122,10 @@ async def create_review(
         
         # Salvar no banco
         await db.reviews.insert_one(review_record)
+        await asyncio.gather(
+            record_review(db, review_record),
+            record_event(db, "reviews", review_record["created_at"], {"rating": review_data.rating})
+        )
         
         logger.info(f"Avaliação criada: {review_id} - {review_data.rating} estrelas por usuário {current_user.id}")
         
@@ -119,49 +138,19 @@ async def create_review(
             detail="Erro interno do servidor"
         )
 
+async def compute_review_stats(db: AsyncIOMotorDatabase) -> ReviewStats:
+    # Um único documento com o histograma de 1-5 estrelas
+    histogram = await get_histogram(db)
+    return ReviewStats(**stats_from_histogram(histogram))
+
 @reviews_router.get("/stats", response_model=ReviewStats)
-async def get_review_stats():
+async def get_review_stats(db: AsyncIOMotorDatabase = Depends(get_database)):
     """
     Obter estatísticas gerais de avaliações (público)
     """
     try:
-        from server import db
-        
-        # Buscar todas as avaliações
-        reviews = await db.reviews.find({}).to_list(10000)
-        
-        if not reviews:
-            return ReviewStats(
-                total_reviews=0,
-                positive_reviews=0,
-                neutral_reviews=0,
-                negative_reviews=0,
-                average_rating=0.0,
-                positive_percentage=0.0,
-                negative_percentage=0.0
-            )
-        
-        # Calcular estatísticas
-        total_reviews = len(reviews)
-        ratings = [r["rating"] for r in reviews]
-        
-        positive_reviews = len([r for r in ratings if r >= 4])  # 4-5 estrelas
-        neutral_reviews = len([r for r in ratings if r == 3])   # 3 estrelas
-        negative_reviews = len([r for r in ratings if r <= 2])  # 1-2 estrelas
-        
-        average_rating = sum(ratings) / len(ratings) if ratings else 0
-        positive_percentage = (positive_reviews / total_reviews) * 100 if total_reviews > 0 else 0
-        negative_percentage = (negative_reviews / total_reviews) * 100 if total_reviews > 0 else 0
-        
-        return ReviewStats(
-            total_reviews=total_reviews,
-            positive_reviews=positive_reviews,
-            neutral_reviews=neutral_reviews,
-            negative_reviews=negative_reviews,
-            average_rating=round(average_rating, 2),
-            positive_percentage=round(positive_percentage, 1),
-            negative_percentage=round(negative_percentage, 1)
-        )
+        # Igual para todos os usuários: servido do cache de respostas
+        return await response_cache.get("reviews:stats", lambda: compute_review_stats(db), REVIEW_STATS_POLICY)
         
     except Exception as e:
         logger.error(f"Erro ao buscar estatísticas: {str(e)}")
@@ -171,53 +160,45 @@ async def get_review_stats():
         )
 
 @reviews_router.get("/technique/{technique_id}", response_model=TechniqueReviewStats)
-async def get_technique_reviews(technique_id: str):
+async def get_technique_reviews(
+    technique_id: str,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
     """
     Obter avaliações de uma técnica específica
     """
     try:
-        from server import db
-        
         # Buscar técnica
-        technique = await db.techniques.find_one({"id": technique_id})
+        technique = (await catalog.get_snapshot(db)).get(technique_id)
         if not technique:
             raise HTTPException(
                 status_code=404,
                 detail="Técnica não encontrada"
             )
         
-        # Buscar avaliações da técnica
-        reviews = await db.reviews.find({"technique_id": technique_id}).to_list(1000)
-        
-        if not reviews:
-            return TechniqueReviewStats(
-                technique_id=technique_id,
-                technique_name=technique.get("name", ""),
-                total_reviews=0,
-                average_rating=0.0,
-                positive_reviews=0,
-                negative_reviews=0,
-                latest_reviews=[]
-            )
-        
-        # Calcular estatísticas
-        ratings = [r["rating"] for r in reviews]
-        positive_reviews = len([r for r in ratings if r >= 4])
-        negative_reviews = len([r for r in ratings if r <= 2])
-        average_rating = sum(ratings) / len(ratings) if ratings else 0
-        
-        # Últimas 5 avaliações
-        latest_reviews = sorted(reviews, key=lambda x: x["created_at"], reverse=True)[:5]
-        latest_reviews_response = [ReviewResponse(**review) for review in latest_reviews]
+        # Resumo materializado + últimas avaliações pelos ids guardados
+        summary = await get_technique_summary(db, technique_id)
+        histogram = normalize_histogram(summary)
+        ratings = rating_summary(summary)
+        
+        latest_ids = summary.get("latest") or []
+        latest_reviews = []
+        if latest_ids:
+            found = await db.reviews.find(
+                {"id": {"$in": latest_ids}},
+                REVIEW_RESPONSE_PROJECTION
+            ).to_list(len(latest_ids))
+            by_id = {review["id"]: review for review in found}
+            latest_reviews = [ReviewResponse(**by_id[review_id]) for review_id in latest_ids if review_id in by_id]
         
         return TechniqueReviewStats(
             technique_id=technique_id,
-            technique_name=technique.get("name", ""),
-            total_reviews=len(reviews),
-            average_rating=round(average_rating, 2),
-            positive_reviews=positive_reviews,
-            negative_reviews=negative_reviews,
-            latest_reviews=latest_reviews_response
+            technique_name=technique.name,
+            total_reviews=ratings["total_reviews"],
+            average_rating=ratings["average_rating"],
+            positive_reviews=histogram[4] + histogram[5],
+            negative_reviews=histogram[1] + histogram[2],
+            latest_reviews=latest_reviews
         )
         
     except Exception as e:
@@ -227,92 +208,156 @@ async def get_technique_reviews(technique_id: str):
             detail="Erro interno do servidor"
         )
 
+class DeveloperAnalyticsAccumulator:
+    """
+    Acumula o dashboard em uma única passada sobre as avaliações do período
+    As avaliações devem chegar ordenadas por created_at decrescente, de modo que
+    o feedback recente e as últimas avaliações por técnica são as primeiras vistas
+    """
+
+    RECENT_FEEDBACK = 10
+    LATEST_PER_TECHNIQUE = 3
+
+    def __init__(self, start_date: datetime, days: int):
+        self.start_date = start_date
+        self.first_day = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.days = days
+        # Por dia: [total, positivas, negativas, soma das notas]
+        self.daily = [[0, 0, 0, 0] for _ in range(max(days, 0))]
+        # Por técnica: [total, positivas, negativas, soma das notas, últimas avaliações]
+        self.techniques: Dict[str, list] = {}
+        self.rating_counts: Dict[int, int] = {}
+        self.recent: List[Dict[str, Any]] = []
+
+    def add(self, review: Dict[str, Any]) -> None:
+        rating = review["rating"]
+        positive = rating >= 4
+        negative = rating <= 2
+
+        day = (review["created_at"] - self.first_day).days
+        if 0 <= day < self.days:
+            bucket = self.daily[day]
+            bucket[0] += 1
+            bucket[1] += positive
+            bucket[2] += negative
+            bucket[3] += rating
+
+        technique = self.techniques.get(review["technique_id"])
+        if technique is None:
+            technique = self.techniques[review["technique_id"]] = [0, 0, 0, 0, []]
+        technique[0] += 1
+        technique[1] += positive
+        technique[2] += negative
+        technique[3] += rating
+        if len(technique[4]) < self.LATEST_PER_TECHNIQUE:
+            technique[4].append(review)
+
+        self.rating_counts[rating] = self.rating_counts.get(rating, 0) + 1
+        if len(self.recent) < self.RECENT_FEEDBACK:
+            self.recent.append(review)
+
+    def daily_reviews(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "date": (self.start_date + timedelta(days=i)).strftime("%Y-%m-%d"),
+                "total": total,
+                "positive": positive,
+                "negative": negative,
+                "average": round(rating_sum / total, 2) if total else 0
+            }
+            for i, (total, positive, negative, rating_sum) in enumerate(self.daily)
+        ]
+
+    def technique_rankings(self, techniques: List[Any]) -> List[TechniqueReviewStats]:
+        rankings = []
+        for technique in techniques:
+            counters = self.techniques.get(technique.id)
+            if not counters:
+                continue
+            total, positive, negative, rating_sum, latest = counters
+            rankings.append(TechniqueReviewStats(
+                technique_id=technique.id,
+                technique_name=technique.name,
+                total_reviews=total,
+                average_rating=round(rating_sum / total, 2),
+                positive_reviews=positive,
+                negative_reviews=negative,
+                latest_reviews=[ReviewResponse(**review) for review in latest]
+            ))
+        # Ordenar por avaliação média
+        rankings.sort(key=lambda x: x.average_rating, reverse=True)
+        return rankings
+
+    def recent_feedback(self) -> List[ReviewResponse]:
+        return [ReviewResponse(**review) for review in self.recent]
+
+    def most_common_rating(self) -> int:
+        if not self.rating_counts:
+            return 0
+        return max(self.rating_counts.items(), key=lambda x: x[1])[0]
+
+@reviews_router.get("/admin/export")
+async def export_reviews(
+    format: str = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: UserResponse = Depends(get_admin_user),  # Apenas admin (ADMIN_EMAILS)
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """
+    Exporta todas as avaliações (NDJSON ou CSV) em streaming, sem carregar a coleção em memória
+    """
+    return export_response(
+        db.reviews,
+        date_range("created_at", since, until),
+        list(ReviewResponse.model_fields),
+        format,
+        "reviews"
+    )
+
 @reviews_router.get("/analytics", response_model=DeveloperAnalytics)
 async def get_developer_analytics(
     days: int = 30,
-    current_user: UserResponse = Depends(get_premium_user)  # Apenas admin/premium
+    current_user: UserResponse = Depends(get_premium_user),  # Apenas admin/premium
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Dashboard de analytics para desenvolvedores (estilo Google Play Console)
     """
     try:
-        from server import db
-        
         # Data de início
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        # Buscar avaliações do período
-        reviews = await db.reviews.find({
-            "created_at": {"$gte": start_date}
-        }).to_list(10000)
-        
-        # Estatísticas gerais
-        overall_stats = await get_review_stats()
-        
-        # Avaliações por dia
-        daily_reviews = []
-        for i in range(days):
-            day_date = start_date + timedelta(days=i)
-            day_start = day_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
-            
-            day_reviews = [r for r in reviews if day_start <= r["created_at"] < day_end]
-            positive_day = len([r for r in day_reviews if r["rating"] >= 4])
-            negative_day = len([r for r in day_reviews if r["rating"] <= 2])
-            
-            daily_reviews.append({
-                "date": day_date.strftime("%Y-%m-%d"),
-                "total": len(day_reviews),
-                "positive": positive_day,
-                "negative": negative_day,
-                "average": round(sum(r["rating"] for r in day_reviews) / len(day_reviews), 2) if day_reviews else 0
-            })
+        # Uma única passada sobre as avaliações do período (mais recentes primeiro)
+        accumulator = DeveloperAnalyticsAccumulator(start_date, days)
+        cursor = db.reviews.find(
+            {"created_at": {"$gte": start_date}},
+            REVIEW_RESPONSE_PROJECTION
+        ).sort("created_at", -1).batch_size(1000)
+        async for review in cursor:
+            accumulator.add(review)
         
-        # Ranking de técnicas
-        techniques = await db.techniques.find({}).to_list(100)
-        technique_rankings = []
+        # Estatísticas gerais (histograma global)
+        overall_stats = await get_review_stats(db)
         
-        for technique in techniques:
-            tech_reviews = [r for r in reviews if r["technique_id"] == technique["id"]]
-            if tech_reviews:
-                ratings = [r["rating"] for r in tech_reviews]
-                avg_rating = sum(ratings) / len(ratings)
-                positive = len([r for r in ratings if r >= 4])
-                negative = len([r for r in ratings if r <= 2])
-                
-                latest_reviews = sorted(tech_reviews, key=lambda x: x["created_at"], reverse=True)[:3]
-                latest_reviews_response = [ReviewResponse(**review) for review in latest_reviews]
-                
-                technique_rankings.append(TechniqueReviewStats(
-                    technique_id=technique["id"],
-                    technique_name=technique["name"],
-                    total_reviews=len(tech_reviews),
-                    average_rating=round(avg_rating, 2),
-                    positive_reviews=positive,
-                    negative_reviews=negative,
-                    latest_reviews=latest_reviews_response
-                ))
-        
-        # Ordenar por avaliação média
-        technique_rankings.sort(key=lambda x: x.average_rating, reverse=True)
+        techniques = (await catalog.get_snapshot(db)).techniques
         
-        # Feedback recente
-        recent_reviews = sorted(reviews, key=lambda x: x["created_at"], reverse=True)[:10]
-        recent_feedback = [ReviewResponse(**review) for review in recent_reviews]
+        # Coortes e histograma por hora, recalculados periodicamente
+        retention = await retention_engine.get_report(db)
         
         # Tendências
         trends = {
             "improvement_rate": 0,  # Calculado comparando com período anterior
-            "most_common_rating": max(set([r["rating"] for r in reviews]), key=[r["rating"] for r in reviews].count) if reviews else 0,
-            "peak_hour": 14,  # Hora com mais avaliações (placeholder)
-            "user_retention": 85.5  # Placeholder para taxa de retenção
+            "most_common_rating": accumulator.most_common_rating(),
+            "peak_hour": retention["peak_hour"],  # Hora (UTC) com mais sessões
+            "user_retention": retention["user_retention"]  # % da coorte ativa na semana seguinte ao cadastro
         }
         
         return DeveloperAnalytics(
             overall_stats=overall_stats,
-            daily_reviews=daily_reviews,
-            technique_rankings=technique_rankings,
-            recent_feedback=recent_feedback,
+            daily_reviews=accumulator.daily_reviews(),
+            technique_rankings=accumulator.technique_rankings(techniques),
+            recent_feedback=accumulator.recent_feedback(),
             trends=trends
         )
         
@@ -323,25 +368,45 @@ async def get_developer_analytics(
             detail="Erro interno do servidor"
         )
 
+@reviews_router.get("/retention")
+async def get_retention(
+    current_user: UserResponse = Depends(get_admin_user),  # Apenas admin (ADMIN_EMAILS)
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """
+    Matriz de retenção por coortes semanais e histograma de sessões por hora
+    """
+    try:
+        return await retention_engine.get_report(db)
+    except Exception as e:
+        logger.error(f"Erro ao buscar retenção: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Erro interno do servidor"
+        )
+
 @reviews_router.get("/my-reviews")
 async def get_user_reviews(
-    current_user: UserResponse = Depends(get_current_user)
+    page: PageParams = Depends(),
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
-    Buscar avaliações do usuário atual
+    Buscar avaliações do usuário atual (paginadas; próxima página em next_cursor)
     """
     try:
-        from server import db
-        
-        reviews = await db.reviews.find({
-            "user_id": current_user.id
-        }).sort("created_at", -1).to_list(100)
+        reviews, next_cursor = await paginate(
+            db.reviews, {"user_id": current_user.id}, [("created_at", -1)], page, REVIEW_RESPONSE_PROJECTION
+        )
         
         return {
             "reviews": [ReviewResponse(**review) for review in reviews],
-            "total": len(reviews)
+            "total": len(reviews),
+            "next_cursor": next_cursor
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar avaliações do usuário: {str(e)}")
         raise HTTPException(
@@ -352,14 +417,13 @@ async def get_user_reviews(
 @reviews_router.delete("/{review_id}")
 async def delete_review(
     review_id: str,
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """
     Deletar uma avaliação (apenas o próprio usuário ou admin)
     """
     try:
-        from server import db
-        
         # Buscar avaliação
         review = await db.reviews.find_one({"id": review_id})
         if not review:
@@ -376,7 +440,12 @@ async def delete_review(
             )
         
         # Deletar
-        await db.reviews.delete_one({"id": review_id})
+        result = await db.reviews.delete_one({"id": review_id})
+        if result.deleted_count:
+            await asyncio.gather(
+                record_review(db, review, delta=-1),
+                record_event(db, "reviews", review["created_at"], {"rating": review["rating"]}, sign=-1)
+            )
         
         return {"message": "Avaliação deletada com sucesso"}
         
@@ -0,0 +1,229 @@
+"""
+Rollups de séries temporais para ZenPress
+Contadores por hora e por dia de avaliações, sessões, cadastros e pagamentos,
+atualizados a cada escrita, para que dashboards custem O(buckets) e não O(eventos)
+
+Cada documento em ``rollups`` é {metric, granularity, bucket, count, sums}, onde
+``sums`` guarda a soma de valores do evento (nota, duração, valor pago).
+
+Uso:
+    python rollups.py rebuild                         # reconstrói todas as métricas
+    python rollups.py rebuild --metric sessions --batch-size 2000
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from database import database
+
+logger = logging.getLogger(__name__)
+
+REBUILD_BATCH_SIZE = 1000
+
+Event = Tuple[datetime, Dict[str, float]]
+
+
+def _hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _day(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _bucket_updates(metric: str, events: Iterable[Event], sign: int = 1) -> List[UpdateOne]:
+    """Soma os eventos por bucket (hora e dia) e gera um upsert $inc por bucket"""
+    buckets: Dict[Tuple[str, datetime], Dict[str, float]] = {}
+    for moment, values in events:
+        for granularity, bucket in (("hour", _hour(moment)), ("day", _day(moment))):
+            increments = buckets.setdefault((granularity, bucket), {})
+            increments["count"] = increments.get("count", 0) + sign
+            for name, value in values.items():
+                field = f"sums.{name}"
+                increments[field] = increments.get(field, 0) + sign * value
+
+    return [
+        UpdateOne(
+            {"metric": metric, "granularity": granularity, "bucket": bucket},
+            {"$inc": increments},
+            upsert=True,
+        )
+        for (granularity, bucket), increments in buckets.items()
+    ]
+
+
+async def record_events(db: AsyncIOMotorDatabase, metric: str, events: Iterable[Event], sign: int = 1) -> None:
+    """Aplica eventos novos (sign=1) ou removidos (sign=-1) aos rollups"""
+    operations = _bucket_updates(metric, events, sign)
+    if operations:
+        await db.rollups.bulk_write(operations, ordered=False)
+
+
+async def record_event(
+    db: AsyncIOMotorDatabase,
+    metric: str,
+    moment: datetime,
+    values: Optional[Dict[str, float]] = None,
+    sign: int = 1,
+) -> None:
+    await record_events(db, metric, [(moment, values or {})], sign)
+
+
+def plan_ranges(start: datetime, end: datetime) -> List[Tuple[str, datetime, datetime]]:
+    """
+    Divide [start, end) na granularidade mais grossa que o cobre: dias inteiros
+    no meio e horas nas bordas (start/end são arredondados para a hora)
+    """
+    start = _hour(start)
+    end = _hour(end) + timedelta(hours=1) if end != _hour(end) else end
+    if start >= end:
+        return []
+
+    first_day = _day(start) if start == _day(start) else _day(start) + timedelta(days=1)
+    last_day = _day(end)
+    if first_day >= last_day:
+        return [("hour", start, end)]
+
+    ranges = []
+    if start < first_day:
+        ranges.append(("hour", start, first_day))
+    ranges.append(("day", first_day, last_day))
+    if last_day < end:
+        ranges.append(("hour", last_day, end))
+    return ranges
+
+
+async def totals(db: AsyncIOMotorDatabase, metric: str, start: datetime, end: datetime) -> Dict[str, float]:
+    """Contagem e somas de um intervalo lendo o menor número possível de buckets"""
+    ranges = plan_ranges(start, end)
+    if not ranges:
+        return {"count": 0}
+
+    result: Dict[str, float] = {"count": 0}
+    query = {"metric": metric, "$or": [
+        {"granularity": granularity, "bucket": {"$gte": range_start, "$lt": range_end}}
+        for granularity, range_start, range_end in ranges
+    ]}
+    async for bucket in db.rollups.find(query, {"_id": 0, "count": 1, "sums": 1}):
+        result["count"] += bucket.get("count", 0)
+        for name, value in (bucket.get("sums") or {}).items():
+            result[name] = result.get(name, 0) + value
+    return result
+
+
+def _period_start(moment: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return _hour(moment)
+    day = _day(moment)
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())  # semanas começam na segunda-feira
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(moment: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return moment + timedelta(hours=1)
+    if granularity == "week":
+        return moment + timedelta(days=7)
+    if granularity == "month":
+        return (moment + timedelta(days=32)).replace(day=1)
+    return moment + timedelta(days=1)
+
+
+async def series(
+    db: AsyncIOMotorDatabase,
+    metric: str,
+    start: datetime,
+    end: datetime,
+    granularity: str = "day",
+) -> List[Dict[str, Any]]:
+    """
+    Série contínua (períodos sem eventos valem zero) em hour/day/week/month
+    Semanas e meses são agregados a partir dos buckets diários
+    """
+    source = "hour" if granularity == "hour" else "day"
+    first = _period_start(start, granularity)
+
+    periods: Dict[datetime, Dict[str, float]] = {}
+    cursor = db.rollups.find(
+        {"metric": metric, "granularity": source, "bucket": {"$gte": _period_start(first, source), "$lt": end}},
+        {"_id": 0, "bucket": 1, "count": 1, "sums": 1},
+    )
+    async for bucket in cursor:
+        period = periods.setdefault(_period_start(bucket["bucket"], granularity), {"count": 0})
+        period["count"] += bucket.get("count", 0)
+        for name, value in (bucket.get("sums") or {}).items():
+            period[name] = period.get(name, 0) + value
+
+    result = []
+    moment = first
+    while moment < end:
+        result.append({"period": moment, **periods.get(moment, {"count": 0})})
+        moment = _next_period(moment, granularity)
+    return result
+
+
+# Fontes brutas de cada métrica: (coleção, filtro, campo de data, {soma: campo})
+SOURCES: Dict[str, Tuple[str, Dict[str, Any], str, Dict[str, str]]] = {
+    "reviews": ("reviews", {}, "created_at", {"rating": "rating"}),
+    "sessions": ("sessions", {}, "date", {"duration": "duration"}),
+    "registrations": ("users", {}, "created_at", {}),
+    "stripe_payments": ("payment_transactions", {"payment_status": "paid"}, "updated_at", {"amount": "amount"}),
+    "crypto_payments": ("crypto_payments", {"status": "verified"}, "verified_at", {"amount": "amount_brl"}),
+}
+
+
+async def rebuild(db: AsyncIOMotorDatabase, metric: str, batch_size: int = REBUILD_BATCH_SIZE) -> int:
+    """
+    Reconstrói os rollups de uma métrica percorrendo a coleção bruta em lotes
+    limitados (memória proporcional ao lote, não à coleção)
+    Deve rodar com pouco tráfego: eventos gravados durante a reconstrução podem
+    ser contados duas vezes
+    """
+    collection, query, date_field, sum_fields = SOURCES[metric]
+    projection = {"_id": 0, date_field: 1, **{field: 1 for field in sum_fields.values()}}
+
+    await db.rollups.delete_many({"metric": metric})
+
+    processed = 0
+    batch: List[Event] = []
+    cursor = db[collection].find({**query, date_field: {"$type": "date"}}, projection).batch_size(batch_size)
+    async for document in cursor:
+        values = {name: document.get(field) or 0 for name, field in sum_fields.items()}
+        batch.append((document[date_field], values))
+        if len(batch) >= batch_size:
+            await record_events(db, metric, batch)
+            processed += len(batch)
+            batch = []
+    if batch:
+        await record_events(db, metric, batch)
+        processed += len(batch)
+    return processed
+
+
+async def main(command: str, metrics: List[str], batch_size: int) -> None:
+    db = database.get_db()
+    try:
+        if command == "rebuild":
+            for metric in metrics:
+                processed = await rebuild(db, metric, batch_size)
+                print(f"✅ Rollups de {metric} reconstruídos a partir de {processed} eventos")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rollups de séries temporais")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--metric", choices=sorted(SOURCES), action="append")
+    parser.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE)
+    args = parser.parse_args()
+    asyncio.run(main(args.command, args.metric or sorted(SOURCES), args.batch_size))
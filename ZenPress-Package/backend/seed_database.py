@@ -1,12 +1,10 @@
 import asyncio
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import database
+from catalog import bump_catalog_version
 
 # Conectar ao MongoDB
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-db_name = os.environ.get('DB_NAME', 'test_database')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
+db = database.get_db()
 
 # Técnicas com imagens atualizadas
 SEED_TECHNIQUES = [
@@ -150,6 +148,10 @@ async def seed_database():
         if SEED_TECHNIQUES:
             result = await db.techniques.insert_many(SEED_TECHNIQUES)
             print(f"📝 Inseridas {len(result.inserted_ids)} técnicas")
+        
+        # Avisar os workers da API para recarregarem o catálogo
+        version = await bump_catalog_version(db)
+        print(f"🔁 Versão do catálogo: {version}")
             
         # Verificar Yamamoto A especificamente
         yamamoto_a = await db.techniques.find_one({"name": "Ponto Yamamoto A (YNSA)"})
@@ -1,21 +1,39 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, status
 from fastapi.security import HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from contextlib import asynccontextmanager
 import os
+import asyncio
 import logging
 from pathlib import Path
 from typing import List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 # Load environment variables
 load_dotenv()
 
-# Import models and auth
+# Import database provider, models and auth
+from database import database, get_database
+from indexes import MONGO_REQUIRE_UNIQUE_INDEXES, ensure_indexes, index_health
+from background import PeriodicTask, background_tasks
+from catalog import CATALOG_POLL_SECONDS, bump_catalog_version, catalog
+from user_stats import get_user_stats_document, record_sessions, summarize
+from complaint_stats import record_complaints, record_technique_usage, top_complaints
+from retention import RETENTION_REFRESH_SECONDS, retention_engine
+from crypto_expiry import CRYPTO_EXPIRY_SWEEP_SECONDS, crypto_expiry_sweeper
+from chain_verification import CHAIN_VERIFY_SECONDS, chain_verifier
+from activation_outbox import activation_task, activation_worker
+from qr_codes import qr_render_pool
+from rollups import record_event, record_events
+from response_cache import COMPLAINT_STATS_POLICY, response_cache
+from pagination import NEXT_CURSOR_HEADER, PageParams, paginate, set_next_cursor
+from http_cache import CATALOG_CACHE_CONTROL, PRIVATE_CATALOG_CACHE_CONTROL, conditional_response
 from models import User, Technique, Favorite
 from auth import get_current_user, get_password_hash, authenticate_user, create_access_token
-from payments import payments_router
+from payments import payments_router, stripe_checkout
 from models import *
 from auth import (
     get_password_hash, 
@@ -23,7 +41,11 @@ from auth import (
     create_access_token, 
     get_current_user,
     get_current_user_optional,
-    get_premium_user
+    get_admin_user,
+    get_password_hash_async,
+    invalidate_principal,
+    principal_cache,
+    password_hashing_pool
 )
 
 # Import payments router  
@@ -31,20 +53,59 @@ from payment_models import *
 from payments import payments_router
 
 # Import crypto payments router
-from crypto_payments import crypto_router
+from crypto_payments import crypto_router, precompute_static_qr_codes
 
 # Import reviews analytics router
 from reviews_analytics import reviews_router
 from spotify_auth import router as spotify_router
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-db_name = os.environ.get('DB_NAME', 'test_database')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
+# Import community analytics router
+from analytics import COMMUNITY_COUNTS_REFRESH_SECONDS, refresh_community_counts, router as analytics_router
+
+async def refresh_catalog():
+    await catalog.refresh(database.get_db())
+
+background_tasks.register(PeriodicTask("catalog_refresh", CATALOG_POLL_SECONDS, refresh_catalog))
+background_tasks.register(PeriodicTask("community_counts", COMMUNITY_COUNTS_REFRESH_SECONDS, refresh_community_counts))
+background_tasks.register(PeriodicTask("retention", RETENTION_REFRESH_SECONDS, retention_engine.refresh))
+background_tasks.register(PeriodicTask("crypto_expiry", CRYPTO_EXPIRY_SWEEP_SECONDS, crypto_expiry_sweeper.sweep))
+background_tasks.register(activation_task)
+if chain_verifier.indexer is not None:
+    background_tasks.register(PeriodicTask("chain_verification", CHAIN_VERIFY_SECONDS, chain_verifier.run))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Single MongoDB pool shared by every router
+    db = database.connect()
+    if os.environ.get("MONGO_ENSURE_INDEXES", "true").lower() != "false":
+        try:
+            await ensure_indexes(db)
+        except PyMongoError as e:
+            logging.getLogger(__name__).error(f"Index bootstrap failed: {str(e)}")
+    # Favorites, synced sessions and activations rely on unique indexes alone to reject duplicates
+    try:
+        missing = await index_health.check(db)
+    except PyMongoError as e:
+        missing = []
+        logging.getLogger(__name__).error(f"Unique index check failed: {str(e)}")
+    if missing and MONGO_REQUIRE_UNIQUE_INDEXES:
+        database.close()
+        raise RuntimeError(f"Missing unique indexes: {', '.join(missing)}")
+    # A QR/Pillow failure only costs the warm cache; codes still render on demand
+    try:
+        precompute_static_qr_codes()
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Static QR code precompute failed: {str(e)}")
+    background_tasks.start_all()
+    yield
+    await background_tasks.stop_all()
+    database.close()
+    password_hashing_pool.shutdown()
+    qr_render_pool.shutdown()
+    await stripe_checkout.close()
 
 # Create the main app without a prefix
-app = FastAPI(title="ZenPress API", version="1.0.0")
+app = FastAPI(title="ZenPress API", version="1.0.0", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -52,10 +113,21 @@ api_router = APIRouter(prefix="/api")
 SEED_TECHNIQUES = []
 SEED_TECHNIQUES = []
 
+async def record_session_aggregates(db: AsyncIOMotorDatabase, user: UserResponse, sessions: List[dict]):
+    """Update every aggregate derived from newly inserted sessions"""
+    if not sessions:
+        return
+    await asyncio.gather(
+        record_sessions(db, user.id, sessions, user.timezone),
+        record_complaints(db, sessions),
+        record_technique_usage(db, sessions),
+        record_events(db, "sessions", [(s["date"], {"duration": s["duration"]}) for s in sessions])
+    )
+
 # Authentication endpoints
 @api_router.post("/auth/register", response_model=Token)
-async def register(user_data: UserCreate):
-    # Check if user already exists
+async def register(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
+    # Check if user already exists (the unique index still guards races)
     existing_user = await db.users.find_one({"email": user_data.email})
     if existing_user:
         raise HTTPException(
@@ -64,14 +136,22 @@ async def register(user_data: UserCreate):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     user = User(
         name=user_data.name,
         email=user_data.email,
-        password_hash=hashed_password
+        password_hash=hashed_password,
+        timezone=user_data.timezone
     )
     
-    await db.users.insert_one(user.dict())
+    try:
+        await db.users.insert_one(user.dict())
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+    await record_event(db, "registrations", user.created_at)
     
     # Create access token
     access_token = create_access_token(data={"sub": user.id})
@@ -82,8 +162,8 @@ async def register(user_data: UserCreate):
     )
 
 @api_router.post("/auth/login", response_model=Token)
-async def login(user_data: UserLogin):
-    user = await authenticate_user(user_data.email, user_data.password)
+async def login(user_data: UserLogin, db: AsyncIOMotorDatabase = Depends(get_database)):
+    user = await authenticate_user(db, user_data.email, user_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -104,134 +184,212 @@ async def get_current_user_info(current_user: UserResponse = Depends(get_current
     return current_user
 
 @api_router.get("/users/stats", response_model=UserStats)
-async def get_user_stats(current_user: UserResponse = Depends(get_current_user)):
-    # Get user sessions
-    sessions = await db.sessions.find({"user_id": current_user.id}).to_list(1000)
+async def get_user_stats(
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    # Single read of the per-user aggregate maintained by create_session
+    stats = summarize(await get_user_stats_document(db, current_user.id), current_user.timezone)
     
-    if not sessions:
+    if not stats["total_sessions"]:
         return UserStats(
-            total_sessions=0,
-            avg_rating=0.0,
-            most_used_complaint="",
-            total_time_practiced=0,
-            streak_days=0,
+            **stats,
             favorite_techniques=[]
         )
     
-    # Calculate stats
-    total_sessions = len(sessions)
-    avg_rating = sum(s.get("rating", 0) for s in sessions if s.get("rating")) / len([s for s in sessions if s.get("rating")]) if any(s.get("rating") for s in sessions) else 0
-    
-    # Most used complaint
-    complaints = {}
-    for session in sessions:
-        complaint = session.get("complaint", "")
-        complaints[complaint] = complaints.get(complaint, 0) + 1
-    
-    most_used_complaint = max(complaints.items(), key=lambda x: x[1])[0] if complaints else ""
-    total_time_practiced = sum(s.get("duration", 0) for s in sessions)
-    
     # Get favorites
     favorites = await db.favorites.find({"user_id": current_user.id}).to_list(100)
     favorite_techniques = [f["technique_id"] for f in favorites]
     
     return UserStats(
-        total_sessions=total_sessions,
-        avg_rating=round(avg_rating, 1),
-        most_used_complaint=most_used_complaint,
-        total_time_practiced=total_time_practiced,
-        streak_days=0,  # TODO: Calculate streak
+        **stats,
         favorite_techniques=favorite_techniques
     )
 
 # Technique endpoints
 @api_router.get("/techniques", response_model=List[Technique])
 async def get_techniques(
+    request: Request,
     category: Optional[str] = None, 
-    current_user: Optional[UserResponse] = Depends(get_current_user_optional)
+    current_user: Optional[UserResponse] = Depends(get_current_user_optional),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    query = {}
-    if category:
-        query["category"] = category
+    snapshot = await catalog.get_snapshot(db)
     
     # If user is not logged in or not premium, only show non-premium content
-    if not current_user or not current_user.is_premium:
-        query["is_premium"] = False
-    
-    techniques = await db.techniques.find(query).to_list(100)
-    return [Technique(**technique) for technique in techniques]
+    include_premium = bool(current_user and current_user.is_premium)
+    
+    # The body differs by premium status, so caches must key on Authorization
+    return conditional_response(
+        request,
+        snapshot.encoded(category, include_premium),
+        PRIVATE_CATALOG_CACHE_CONTROL if current_user else CATALOG_CACHE_CONTROL,
+        vary="Authorization"
+    )
 
 @api_router.get("/techniques/{technique_id}", response_model=Technique)
-async def get_technique(technique_id: str, current_user: Optional[UserResponse] = Depends(get_current_user_optional)):
-    technique = await db.techniques.find_one({"id": technique_id})
+async def get_technique(
+    technique_id: str,
+    current_user: Optional[UserResponse] = Depends(get_current_user_optional),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    technique = (await catalog.get_snapshot(db)).get(technique_id)
     if not technique:
         raise HTTPException(status_code=404, detail="Technique not found")
     
     # Check premium access
-    if technique.get("is_premium", False):
+    if technique.is_premium:
         if not current_user or not current_user.is_premium:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Premium subscription required"
             )
     
-    return Technique(**technique)
+    return technique
 
 # Session endpoints
 @api_router.post("/sessions", response_model=Session)
 async def create_session(
     session_data: SessionCreate, 
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     # Get technique info
-    technique = await db.techniques.find_one({"id": session_data.technique_id})
+    technique = (await catalog.get_snapshot(db)).get(session_data.technique_id)
     if not technique:
         raise HTTPException(status_code=404, detail="Technique not found")
     
     session = Session(
         user_id=current_user.id,
         technique_id=session_data.technique_id,
-        technique_name=technique["name"],
+        technique_name=technique.name,
         complaint=session_data.complaint,
         duration=session_data.duration,
         rating=session_data.rating
     )
     
     await db.sessions.insert_one(session.dict())
+    await record_session_aggregates(db, current_user, [session.dict()])
     return session
 
+@api_router.post("/sessions/sync", response_model=SessionSyncResponse)
+async def sync_sessions(
+    sync_data: SessionSyncRequest,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Ingest a backlog of sessions recorded offline, idempotent per client_id"""
+    snapshot = await catalog.get_snapshot(db)
+    now = datetime.utcnow()
+    results = {}
+    pending = []
+    
+    # Validate everything against the in-memory catalog in one pass
+    for item in sync_data.sessions:
+        if item.client_id in results:
+            continue
+        technique = snapshot.get(item.technique_id)
+        if not technique:
+            results[item.client_id] = SessionSyncResult(
+                client_id=item.client_id, status="invalid", error="Technique not found"
+            )
+            continue
+        recorded_at = item.date or now
+        if recorded_at.tzinfo:
+            recorded_at = recorded_at.astimezone(timezone.utc).replace(tzinfo=None)
+        if recorded_at > now + timedelta(minutes=5):
+            results[item.client_id] = SessionSyncResult(
+                client_id=item.client_id, status="invalid", error="Session date is in the future"
+            )
+            continue
+        
+        session = Session(
+            user_id=current_user.id,
+            technique_id=item.technique_id,
+            technique_name=technique.name,
+            complaint=item.complaint,
+            duration=item.duration,
+            rating=item.rating,
+            date=recorded_at,
+            client_id=item.client_id
+        )
+        pending.append(session.dict())
+        results[item.client_id] = SessionSyncResult(
+            client_id=item.client_id, status="created", session_id=session.id
+        )
+    
+    # Single unordered write; the (user_id, client_id) index rejects replays
+    failed = {}
+    if pending:
+        try:
+            await db.sessions.insert_many(pending, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed[pending[error["index"]]["client_id"]] = error
+    
+    duplicate_ids = [cid for cid, error in failed.items() if error.get("code") == 11000]
+    if duplicate_ids:
+        existing = await db.sessions.find(
+            {"user_id": current_user.id, "client_id": {"$in": duplicate_ids}},
+            {"_id": 0, "id": 1, "client_id": 1}
+        ).to_list(len(duplicate_ids))
+        existing_ids = {doc["client_id"]: doc["id"] for doc in existing}
+        for client_id in duplicate_ids:
+            results[client_id] = SessionSyncResult(
+                client_id=client_id, status="duplicate", session_id=existing_ids.get(client_id)
+            )
+    for client_id, error in failed.items():
+        if error.get("code") != 11000:
+            results[client_id] = SessionSyncResult(
+                client_id=client_id, status="error", error=error.get("errmsg", "Write failed")
+            )
+    
+    inserted = [s for s in pending if s["client_id"] not in failed]
+    await record_session_aggregates(db, current_user, inserted)
+    
+    ordered_results = list(results.values())
+    return SessionSyncResponse(
+        created=len(inserted),
+        duplicates=len(duplicate_ids),
+        invalid=sum(1 for r in ordered_results if r.status == "invalid"),
+        results=ordered_results
+    )
+
 @api_router.get("/sessions", response_model=List[Session])
-async def get_user_sessions(current_user: UserResponse = Depends(get_current_user)):
-    sessions = await db.sessions.find({"user_id": current_user.id}).sort("date", -1).to_list(100)
+async def get_user_sessions(
+    response: Response,
+    page: PageParams = Depends(),
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    sessions, next_cursor = await paginate(db.sessions, {"user_id": current_user.id}, [("date", -1)], page)
+    set_next_cursor(response, next_cursor)
     return [Session(**session) for session in sessions]
 
 # Favorites endpoints
 @api_router.post("/favorites", response_model=Favorite)
 async def add_favorite(
     favorite_data: FavoriteCreate, 
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    # Check if already favorited
-    existing = await db.favorites.find_one({
-        "user_id": current_user.id,
-        "technique_id": favorite_data.technique_id
-    })
-    
-    if existing:
-        raise HTTPException(status_code=400, detail="Already in favorites")
-    
     favorite = Favorite(
         user_id=current_user.id,
         technique_id=favorite_data.technique_id
     )
     
-    await db.favorites.insert_one(favorite.dict())
+    # The unique (user_id, technique_id) index rejects duplicates
+    try:
+        await db.favorites.insert_one(favorite.dict())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Already in favorites")
     return favorite
 
 @api_router.delete("/favorites/{technique_id}")
 async def remove_favorite(
     technique_id: str, 
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     result = await db.favorites.delete_one({
         "user_id": current_user.id,
@@ -244,21 +402,30 @@ async def remove_favorite(
     return {"message": "Favorite removed"}
 
 @api_router.get("/favorites", response_model=List[Technique])
-async def get_user_favorites(current_user: UserResponse = Depends(get_current_user)):
-    favorites = await db.favorites.find({"user_id": current_user.id}).to_list(100)
+async def get_user_favorites(
+    response: Response,
+    page: PageParams = Depends(),
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    favorites, next_cursor = await paginate(
+        db.favorites, {"user_id": current_user.id}, [("created_at", -1)], page, {"technique_id": 1}
+    )
+    set_next_cursor(response, next_cursor)
     technique_ids = [f["technique_id"] for f in favorites]
     
     if not technique_ids:
         return []
     
-    techniques = await db.techniques.find({"id": {"$in": technique_ids}}).to_list(100)
-    return [Technique(**technique) for technique in techniques]
+    snapshot = await catalog.get_snapshot(db)
+    return [snapshot.by_id[tid] for tid in technique_ids if tid in snapshot.by_id]
 
 # Premium subscription endpoints
 @api_router.post("/subscription/create", response_model=Subscription)
 async def create_subscription(
     subscription_data: SubscriptionCreate,
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     # Calculate expiration date
     if subscription_data.plan == "monthly":
@@ -285,33 +452,33 @@ async def create_subscription(
         {"id": current_user.id},
         {"$set": {"is_premium": True, "subscription_expires": expires_at}}
     )
+    await invalidate_principal(db, current_user.id)
     
     return subscription
 
+# Catalog administration
+@api_router.post("/admin/catalog/refresh")
+async def refresh_technique_catalog(
+    current_user: UserResponse = Depends(get_admin_user),  # Apenas admin (ADMIN_EMAILS)
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Bump the catalog version so every worker reloads the techniques"""
+    version = await bump_catalog_version(db)
+    snapshot = await catalog.refresh(db)
+    return {"version": version, "techniques": len(snapshot.techniques)}
+
 # Statistics endpoints
+async def compute_complaint_stats(db: AsyncIOMotorDatabase) -> List[ComplaintStats]:
+    return [ComplaintStats(**stat) for stat in await top_complaints(db, limit=10)]
+
 @api_router.get("/stats/complaints", response_model=List[ComplaintStats])
-async def get_complaint_stats():
-    # Aggregate complaint statistics from all sessions
-    pipeline = [
-        {"$group": {"_id": "$complaint", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 10}
-    ]
-    
-    results = await db.sessions.aggregate(pipeline).to_list(10)
-    
-    # Mock trending data for now
-    trending_complaints = ["Dor de cabeça tensional", "Ansiedade e stress", "Insônia", "Enxaqueca"]
-    
-    stats = []
-    for result in results:
-        stats.append(ComplaintStats(
-            complaint=result["_id"],
-            count=result["count"],
-            trending=result["_id"] in trending_complaints
-        ))
-    
-    return stats
+async def get_complaint_stats(db: AsyncIOMotorDatabase = Depends(get_database)):
+    # Served from the counters maintained on session insert, shared by every caller
+    return await response_cache.get(
+        "stats:complaints",
+        lambda: compute_complaint_stats(db),
+        COMPLAINT_STATS_POLICY
+    )
 
 # Seed data endpoint has been removed - use seed_database.py instead
 
@@ -320,6 +487,24 @@ async def get_complaint_stats():
 async def root():
     return {"message": "ZenPress API - Sistema de Acupressão e Craniopuntura"}
 
+# Runtime metrics endpoint
+@api_router.get("/metrics")
+async def get_metrics(current_user: UserResponse = Depends(get_admin_user)):
+    return {
+        "principal_cache": principal_cache.stats(),
+        "password_hashing": password_hashing_pool.stats(),
+        "qr_rendering": qr_render_pool.stats(),
+        "stripe": stripe_checkout.stats(),
+        "product_activation": activation_worker.stats(),
+        "crypto_expiry": crypto_expiry_sweeper.stats(),
+        "chain_verification": chain_verifier.stats(),
+        "mongo_pool": database.pool_stats(),
+        "indexes": index_health.stats(),
+        "catalog": catalog.stats(),
+        "background_tasks": background_tasks.stats(),
+        "response_cache": response_cache.stats()
+    }
+
 # Launch strategy endpoint
 @api_router.get("/launch-strategy")
 async def get_launch_strategy():
@@ -403,6 +588,7 @@ app.include_router(payments_router)
 app.include_router(crypto_router, prefix="/api")
 app.include_router(reviews_router, prefix="/api")
 app.include_router(spotify_router, prefix="/api")
+app.include_router(analytics_router, prefix="/api")
 
 app.add_middleware(
     CORSMiddleware,
@@ -410,6 +596,7 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Configure logging
@@ -418,7 +605,3 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+Sequências de prática (streaks) baseadas em bitmap de dias ativos
+Cada usuário tem um bit por dia (no seu fuso horário) agrupado em palavras de
+32 bits, guardadas em ``user_stats.activity`` como {"<índice da palavra>": int}
+"""
+
+import logging
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from bson.int64 import Int64
+
+logger = logging.getLogger(__name__)
+
+WORD_BITS = 32
+EPOCH = date(1970, 1, 1)
+
+
+def resolve_timezone(name: Optional[str]) -> ZoneInfo:
+    try:
+        return ZoneInfo(name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Fuso horário inválido: {name}, usando UTC")
+        return ZoneInfo("UTC")
+
+
+def day_index(moment: datetime, tz: ZoneInfo) -> int:
+    """Número do dia local (dias desde 1970-01-01) de um datetime UTC"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment.astimezone(tz).date() - EPOCH).days
+
+
+def activity_masks(days: Iterable[int]) -> Dict[str, int]:
+    """Agrupa dias ativos em máscaras por palavra, prontas para $bit"""
+    masks: Dict[str, int] = {}
+    for day in days:
+        word = str(day // WORD_BITS)
+        masks[word] = masks.get(word, 0) | (1 << (day % WORD_BITS))
+    return masks
+
+
+def bit_updates(masks: Dict[str, int]) -> Dict[str, dict]:
+    return {f"activity.{word}": {"or": Int64(mask)} for word, mask in masks.items()}
+
+
+def _bitmap(activity: Dict[str, int]):
+    """Monta um inteiro único com todas as palavras; retorna (bitmap, dia base)"""
+    if not activity:
+        return 0, 0
+    words = {int(word): int(mask) for word, mask in activity.items()}
+    base = min(words)
+    bitmap = 0
+    for word, mask in words.items():
+        bitmap |= mask << ((word - base) * WORD_BITS)
+    return bitmap, base * WORD_BITS
+
+
+def current_streak(activity: Optional[Dict[str, int]], today: int) -> int:
+    """
+    Dias consecutivos com prática terminando hoje (ou ontem, já que o dia de
+    hoje ainda não acabou)
+    """
+    bitmap, base = _bitmap(activity or {})
+    position = today - base
+    if position < 0 or not bitmap:
+        return 0
+
+    if not (bitmap >> position) & 1:
+        position -= 1
+        if position < 0 or not (bitmap >> position) & 1:
+            return 0
+
+    window = bitmap & ((1 << (position + 1)) - 1)
+    gaps = ~window & ((1 << (position + 1)) - 1)
+    if not gaps:
+        return position + 1
+    return position - (gaps.bit_length() - 1)
+
+
+def longest_streak(activity: Optional[Dict[str, int]]) -> int:
+    """Maior sequência de bits 1 consecutivos (uma iteração por sequência)"""
+    bitmap, _ = _bitmap(activity or {})
+    best = 0
+    while bitmap:
+        start = (bitmap & -bitmap).bit_length() - 1
+        shifted = bitmap >> start
+        run = (shifted ^ (shifted + 1)).bit_length() - 1
+        best = max(best, run)
+        bitmap = (shifted >> run) << (start + run)
+    return best
@@ -0,0 +1,169 @@
+"""
+Local Stripe fakes for ZenPress
+- FakeStripeServer: in-memory Checkout Sessions API, plugged into the gateway
+  through httpx.MockTransport (STRIPE_FAKE=true)
+- FakeStripeEmitter: builds checkout events shaped like Stripe's and signs them
+  with the webhook secret, so the webhook endpoint can be exercised without a
+  Stripe account
+
+Usage:
+    python stripe_fake.py cs_test_123                                   # checkout.session.completed (paid)
+    python stripe_fake.py cs_test_123 --type checkout.session.expired
+    python stripe_fake.py cs_test_123 --url http://localhost:8001/api/payments/v1/webhook/stripe --repeat 2
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl
+
+import httpx
+import requests
+
+from stripe_webhooks import CHECKOUT_EVENTS, STRIPE_WEBHOOK_SECRET, compute_signature
+
+DEFAULT_WEBHOOK_URL = "http://localhost:8001/api/payments/v1/webhook/stripe"
+
+
+class FakeStripeServer:
+    """
+    Checkout Sessions endpoints backed by a dict; honours Idempotency-Key like
+    Stripe (same key, same session). ``latency`` simulates a slow Stripe and
+    ``fail_next`` makes the next N calls answer 503
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.fail_next = 0
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.idempotency: Dict[str, str] = {}
+        self.calls = 0
+
+    def complete(self, session_id: str, payment_status: str = "paid") -> Dict[str, Any]:
+        """Simulate the customer finishing the hosted checkout"""
+        session = self.sessions[session_id]
+        session.update({"status": "complete", "payment_status": payment_status})
+        return session
+
+    def _create(self, request: httpx.Request) -> Dict[str, Any]:
+        key = request.headers.get("idempotency-key")
+        if key in self.idempotency:
+            return self.sessions[self.idempotency[key]]
+        fields = dict(parse_qsl(request.content.decode()))
+        session_id = f"cs_test_{uuid.uuid4().hex[:24]}"
+        session = {
+            "id": session_id,
+            "object": "checkout.session",
+            "url": f"https://checkout.stripe.test/c/pay/{session_id}",
+            "status": "open",
+            "payment_status": "unpaid",
+            "amount_total": int(fields.get("line_items[0][price_data][unit_amount]", 0)),
+            "currency": fields.get("line_items[0][price_data][currency]", "brl"),
+            "metadata": {
+                name[len("metadata["):-1]: value for name, value in fields.items() if name.startswith("metadata[")
+            },
+            "success_url": fields.get("success_url"),
+            "cancel_url": fields.get("cancel_url"),
+        }
+        self.sessions[session_id] = session
+        if key:
+            self.idempotency[key] = session_id
+        return session
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            return httpx.Response(503, json={"error": {"message": "Fake Stripe unavailable"}})
+
+        path = request.url.path
+        if request.method == "POST" and path == "/v1/checkout/sessions":
+            return httpx.Response(200, json=self._create(request))
+        if request.method == "GET" and path.startswith("/v1/checkout/sessions/"):
+            session = self.sessions.get(path.rsplit("/", 1)[-1])
+            if session is not None:
+                return httpx.Response(200, json=session)
+            return httpx.Response(404, json={"error": {"message": "No such checkout.session"}})
+        return httpx.Response(404, json={"error": {"message": f"Unrecognized request URL ({path})"}})
+
+
+class FakeStripeEmitter:
+    """Creates signed webhook deliveries for checkout sessions"""
+
+    def __init__(self, secret: str = STRIPE_WEBHOOK_SECRET):
+        self.secret = secret
+
+    def checkout_event(
+        self,
+        session_id: str,
+        event_type: str = "checkout.session.completed",
+        payment_status: str = "paid",
+        amount_total: int = 0,
+        metadata: Optional[Dict[str, str]] = None,
+        event_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        if event_type not in CHECKOUT_EVENTS:
+            raise ValueError(f"Unsupported event type: {event_type}")
+        status = CHECKOUT_EVENTS[event_type][1]
+        return {
+            "id": event_id or f"evt_{uuid.uuid4().hex[:24]}",
+            "object": "event",
+            "type": event_type,
+            "created": int(time.time()),
+            "livemode": False,
+            "data": {
+                "object": {
+                    "id": session_id,
+                    "object": "checkout.session",
+                    "status": status,
+                    "payment_status": payment_status,
+                    "amount_total": amount_total,
+                    "currency": "brl",
+                    "metadata": metadata or {},
+                }
+            },
+        }
+
+    def sign(self, event: Dict[str, Any], timestamp: Optional[int] = None, secret: Optional[str] = None):
+        """(payload, headers) ready to POST; pass another secret/timestamp to forge bad deliveries"""
+        payload = json.dumps(event, separators=(",", ":")).encode()
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        signature = compute_signature(payload, secret if secret is not None else self.secret, timestamp)
+        headers = {
+            "Content-Type": "application/json",
+            "Stripe-Signature": f"t={timestamp},v1={signature}",
+        }
+        return payload, headers
+
+    def send(self, url: str, event: Dict[str, Any]) -> requests.Response:
+        payload, headers = self.sign(event)
+        return requests.post(url, data=payload, headers=headers, timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Send a fake signed Stripe checkout event")
+    parser.add_argument("session_id")
+    parser.add_argument("--type", default="checkout.session.completed", choices=sorted(CHECKOUT_EVENTS))
+    parser.add_argument("--payment-status", default="paid")
+    parser.add_argument("--url", default=DEFAULT_WEBHOOK_URL)
+    parser.add_argument("--secret", default=STRIPE_WEBHOOK_SECRET)
+    parser.add_argument("--repeat", type=int, default=1, help="deliver the same event N times")
+    args = parser.parse_args()
+
+    if not args.secret:
+        parser.error("STRIPE_WEBHOOK_SECRET is not set (or pass --secret)")
+
+    emitter = FakeStripeEmitter(args.secret)
+    event = emitter.checkout_event(args.session_id, args.type, args.payment_status)
+    for _ in range(args.repeat):
+        response = emitter.send(args.url, event)
+        print(f"{event['id']} {event['type']}: {response.status_code} {response.text}")
+
+
+if __name__ == "__main__":
+    main()
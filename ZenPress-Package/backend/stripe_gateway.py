@@ -0,0 +1,213 @@
+"""
+Async Stripe Checkout gateway for ZenPress
+Talks to the Stripe REST API over a pooled httpx.AsyncClient, so a slow Stripe
+response only holds its own request instead of the event loop
+
+- Per-call timeouts (connect/read) and a bounded connection pool
+- Retries with exponential backoff and full jitter on network errors, 429 and
+  5xx, only for idempotent calls: GETs and POSTs carrying an Idempotency-Key
+- Session creation always sends an Idempotency-Key, so a retried create never
+  opens a second checkout session
+- STRIPE_FAKE=true routes every call to an in-memory fake Stripe server
+  (stripe_fake.FakeStripeServer) through httpx.MockTransport
+
+ZenPress-Package/backend/stripe_gateway.py is the authoritative copy. The
+legacy backend/ tree is built on its own (its Dockerfile copies only that
+directory), so it ships a byte-for-byte copy of this file: edit the package
+copy, then copy it over. tests/test_stripe_gateway.py fails if they differ.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import httpx
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+STRIPE_API_BASE = os.environ.get("STRIPE_API_BASE", "https://api.stripe.com")
+STRIPE_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("STRIPE_CONNECT_TIMEOUT_SECONDS", "3"))
+STRIPE_READ_TIMEOUT_SECONDS = float(os.environ.get("STRIPE_READ_TIMEOUT_SECONDS", "10"))
+STRIPE_MAX_RETRIES = int(os.environ.get("STRIPE_MAX_RETRIES", "2"))
+STRIPE_RETRY_BASE_SECONDS = float(os.environ.get("STRIPE_RETRY_BASE_SECONDS", "0.25"))
+STRIPE_MAX_CONNECTIONS = int(os.environ.get("STRIPE_MAX_CONNECTIONS", "20"))
+STRIPE_FAKE = os.environ.get("STRIPE_FAKE", "false").lower() == "true"
+
+# 409 is an Idempotency-Key conflict: retrying with the same key cannot succeed
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CheckoutSessionRequest(BaseModel):
+    amount: float
+    currency: str = "brl"
+    success_url: str
+    cancel_url: str
+    metadata: Optional[Dict[str, str]] = None
+    product_name: str = "ZenPress"
+
+
+class CheckoutSessionResponse(BaseModel):
+    url: str
+    session_id: str
+
+
+class CheckoutStatusResponse(BaseModel):
+    status: str
+    payment_status: str
+    amount_total: int = 0
+    currency: str = "brl"
+    metadata: Dict[str, str] = {}
+
+
+class StripeGatewayError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def encode_checkout_session(request: CheckoutSessionRequest) -> List[Tuple[str, str]]:
+    """Form fields for POST /v1/checkout/sessions (amounts in cents)"""
+    fields = [
+        ("mode", "payment"),
+        ("success_url", request.success_url),
+        ("cancel_url", request.cancel_url),
+        ("line_items[0][quantity]", "1"),
+        ("line_items[0][price_data][currency]", request.currency),
+        ("line_items[0][price_data][unit_amount]", str(int(round(request.amount * 100)))),
+        ("line_items[0][price_data][product_data][name]", request.product_name),
+    ]
+    fields.extend((f"metadata[{key}]", value) for key, value in (request.metadata or {}).items())
+    return fields
+
+
+def error_message(response: httpx.Response) -> str:
+    try:
+        return (response.json().get("error") or {}).get("message") or response.text
+    except ValueError:
+        return response.text
+
+
+class StripeCheckout:
+    """Checkout Sessions client; create one per process and close it on shutdown"""
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = STRIPE_API_BASE,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        max_retries: int = STRIPE_MAX_RETRIES,
+    ):
+        self.max_retries = max(0, max_retries)
+        self.fake = isinstance(transport, httpx.MockTransport)
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            auth=(api_key, ""),
+            timeout=httpx.Timeout(STRIPE_READ_TIMEOUT_SECONDS, connect=STRIPE_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=STRIPE_MAX_CONNECTIONS,
+                max_keepalive_connections=STRIPE_MAX_CONNECTIONS,
+            ),
+            transport=transport,
+        )
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        data: Optional[List[Tuple[str, str]]] = None,
+        idempotency_key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        retryable = method == "GET" or idempotency_key is not None
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+        content = None
+        if data is not None:
+            # Stripe takes form-encoded bodies with bracketed keys for nested fields
+            content = urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        attempt = 0
+        while True:
+            self.requests += 1
+            started = time.perf_counter()
+            try:
+                response = await self._client.request(method, path, content=content, headers=headers)
+                error: Optional[str] = None
+            except httpx.TransportError as e:
+                response = None
+                error = f"{type(e).__name__}: {str(e)}"
+            finally:
+                self.total_seconds += time.perf_counter() - started
+
+            if response is not None and response.status_code < 400:
+                return response.json()
+
+            should_retry = response is None or (
+                response.status_code in RETRYABLE_STATUS_CODES
+                and response.headers.get("stripe-should-retry") != "false"
+            )
+            if not (retryable and should_retry and attempt < self.max_retries):
+                self.failures += 1
+                if response is None:
+                    raise StripeGatewayError(f"Stripe unreachable: {error}")
+                raise StripeGatewayError(
+                    f"Stripe error {response.status_code}: {error_message(response)}", response.status_code
+                )
+
+            # Full jitter keeps retrying workers from hitting Stripe in lockstep
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(random.uniform(0, STRIPE_RETRY_BASE_SECONDS * 2 ** attempt))
+
+    async def create_checkout_session(
+        self, request: CheckoutSessionRequest, idempotency_key: Optional[str] = None
+    ) -> CheckoutSessionResponse:
+        session = await self._request(
+            "POST",
+            "/v1/checkout/sessions",
+            data=encode_checkout_session(request),
+            idempotency_key=idempotency_key or str(uuid.uuid4()),
+        )
+        return CheckoutSessionResponse(url=session["url"], session_id=session["id"])
+
+    async def get_checkout_status(self, session_id: str) -> CheckoutStatusResponse:
+        session = await self._request("GET", f"/v1/checkout/sessions/{session_id}")
+        return CheckoutStatusResponse(
+            status=session.get("status") or "open",
+            payment_status=session.get("payment_status") or "unpaid",
+            amount_total=session.get("amount_total") or 0,
+            currency=session.get("currency") or "brl",
+            metadata=session.get("metadata") or {},
+        )
+
+    def stats(self) -> dict:
+        requests = self.requests or 1
+        return {
+            "fake": self.fake,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "avg_request_ms": round(self.total_seconds / requests * 1000, 2),
+        }
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def create_stripe_checkout(api_key: Optional[str]) -> StripeCheckout:
+    if STRIPE_FAKE:
+        from stripe_fake import FakeStripeServer
+
+        logger.warning("STRIPE_FAKE is enabled: checkout sessions are served by an in-memory fake")
+        return StripeCheckout(api_key or "sk_test_fake", transport=httpx.MockTransport(FakeStripeServer().handle))
+    if not api_key:
+        raise ValueError("STRIPE_API_KEY environment variable is required")
+    return StripeCheckout(api_key)
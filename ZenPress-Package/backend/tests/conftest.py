@@ -0,0 +1,22 @@
+"""
+Configuração dos testes do backend
+Os módulos do backend são importados pelo nome (``from database import ...``),
+então o diretório do backend entra no sys.path. O Stripe roda em modo fake e o
+MongoDB é substituído por um banco em memória (mongomock-motor)
+"""
+
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("STRIPE_FAKE", "true")
+os.environ.setdefault("STRIPE_WEBHOOK_SECRET", "whsec_test_secret")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()["zenpress_test"]
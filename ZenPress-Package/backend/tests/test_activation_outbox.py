@@ -0,0 +1,123 @@
+"""
+Outbox de ativação: lease com expiração e retomada, dead-letter após
+ACTIVATION_MAX_ATTEMPTS e ativações idempotentes por payment_transaction_id
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import activation_outbox
+from activation_outbox import ActivationWorker, activate_product, new_activation_job
+from payment_models import PaymentTransaction
+
+
+@pytest.fixture(autouse=True)
+def few_attempts(monkeypatch):
+    monkeypatch.setattr(activation_outbox, "ACTIVATION_MAX_ATTEMPTS", 2)
+
+
+def paid_transaction(db, session_id: str = "cs_1", product_type: str = "course", product_id: str = "course_stress") -> dict:
+    now = datetime.utcnow()
+    transaction = PaymentTransaction(
+        user_id="user-1",
+        session_id=session_id,
+        amount=10,
+        product_type=product_type,
+        product_id=product_id,
+        payment_status="paid",
+    ).model_dump()
+    transaction.update({"paid_at": now, "activation": new_activation_job(now)})
+    asyncio.run(db.payment_transactions.insert_one(transaction))
+    return transaction
+
+
+def activation(db, session_id: str = "cs_1") -> dict:
+    return asyncio.run(db.payment_transactions.find_one({"session_id": session_id}))["activation"]
+
+
+def expire_lease(db, session_id: str = "cs_1") -> None:
+    asyncio.run(db.payment_transactions.update_one(
+        {"session_id": session_id},
+        {"$set": {"activation.lease_until": datetime.utcnow() - timedelta(seconds=1)}},
+    ))
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(db):
+    paid_transaction(db)
+    hung, healthy = ActivationWorker(), ActivationWorker()
+
+    claimed = asyncio.run(hung.claim(db))
+    assert asyncio.run(healthy.claim(db)) is None  # lease ainda válido
+
+    expire_lease(db)
+    reclaimed = asyncio.run(healthy.claim(db))
+    assert reclaimed["activation"]["lease_owner"] == healthy.owner
+    assert reclaimed["activation"]["attempts"] == 2
+
+    # O worker travado termina depois: sem o lease, não marca o job
+    asyncio.run(hung.process(db, claimed))
+    assert activation(db)["state"] == "running"
+
+    asyncio.run(healthy.process(db, reclaimed))
+    job = activation(db)
+    assert job["state"] == "done"
+    assert "lease_owner" not in job
+    assert asyncio.run(db.course_enrollments.count_documents({})) == 1
+
+
+def test_errors_are_retried_then_dead_lettered(db):
+    paid_transaction(db, product_type="unknown")
+    worker = ActivationWorker()
+
+    assert asyncio.run(worker.run(db)) == 1
+    job = activation(db)
+    assert job["state"] == "pending"
+    assert job["next_attempt_at"] > datetime.utcnow()
+    assert "Unknown product type" in job["last_error"]
+    assert asyncio.run(worker.run(db)) == 0  # aguardando o backoff
+
+    asyncio.run(db.payment_transactions.update_one(
+        {"session_id": "cs_1"}, {"$set": {"activation.next_attempt_at": datetime.utcnow()}}
+    ))
+    asyncio.run(worker.run(db))
+
+    assert activation(db)["state"] == "failed"
+    assert (worker.retried, worker.failed) == (1, 1)
+    assert asyncio.run(worker.claim(db)) is None
+
+
+def test_lease_expiring_on_the_last_attempt_is_dead_lettered(db):
+    paid_transaction(db)
+    for _ in range(2):
+        asyncio.run(ActivationWorker().claim(db))
+        expire_lease(db)
+
+    worker = ActivationWorker()
+    assert asyncio.run(worker.run(db)) == 0
+
+    job = activation(db)
+    assert job["state"] == "failed"
+    assert job["last_error"] == "Lease expired on the last attempt"
+    assert worker.failed == 1
+
+
+@pytest.mark.parametrize("product_type, product_id, collection", [
+    ("course", "course_stress", "course_enrollments"),
+    ("corporate", "corporate_starter", "corporate_plans"),
+    ("analytics", "analytics_basic", "analytics_subscriptions"),
+])
+def test_activation_upserts_by_transaction_id(db, product_type, product_id, collection):
+    transaction = paid_transaction(db, product_type=product_type, product_id=product_id)
+    transaction["metadata"] = {"company_name": "ACME"}
+
+    async def activate_twice():
+        await activate_product(db, transaction)
+        await activate_product(db, transaction)
+        return await db[collection].find({}, {"_id": 0}).to_list(None)
+
+    documents = asyncio.run(activate_twice())
+
+    assert len(documents) == 1
+    assert documents[0]["payment_transaction_id"] == transaction["id"]
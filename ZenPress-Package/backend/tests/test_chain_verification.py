@@ -0,0 +1,179 @@
+"""
+Verificação on-chain em lote contra o LocalChainIndexer: pagamentos verificados,
+rejeitados, aguardando confirmações, hashes repetidos e o bulk_write que não
+sobrescreve decisões manuais
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from chain_verification import (
+    CHAIN_MIN_CONFIRMATIONS,
+    CHAIN_NOT_FOUND_DEADLINE_SECONDS,
+    ChainIndexer,
+    ChainVerifier,
+    LocalChainIndexer,
+    evaluate,
+)
+from crypto_payments import WALLET_ADDRESSES
+
+BTC_WALLET = WALLET_ADDRESSES["BTC"]
+MONTHLY_USD = 5.99
+
+
+def crypto_payment(transaction_id: str, tx_hash: str, confirmed_minutes_ago: float = 10, **fields) -> dict:
+    now = datetime.utcnow()
+    return {
+        "transaction_id": transaction_id,
+        "user_id": f"user-{transaction_id}",
+        "subscription_type": "premium_monthly",
+        "crypto_currency": "BTC",
+        "amount_brl": 29.9,
+        "status": "user_confirmed",
+        "tx_hash": tx_hash,
+        "created_at": now - timedelta(minutes=confirmed_minutes_ago + 5),
+        "user_confirmed_at": now - timedelta(minutes=confirmed_minutes_ago),
+        **fields,
+    }
+
+
+def run_batch(db, indexer: ChainIndexer, payments) -> ChainVerifier:
+    verifier = ChainVerifier(indexer)
+
+    async def scenario():
+        await db.crypto_payments.insert_many(payments)
+        await db.users.insert_many([
+            {"id": payment["user_id"], "email": f"{payment['user_id']}@example.com", "is_premium": False}
+            for payment in payments
+        ])
+        await verifier.run_batch(db)
+
+    asyncio.run(scenario())
+    return verifier
+
+
+def status_of(db, transaction_id: str) -> dict:
+    return asyncio.run(db.crypto_payments.find_one({"transaction_id": transaction_id}))
+
+
+def test_indexer_interface_is_abstract():
+    with pytest.raises(TypeError):
+        ChainIndexer()
+
+
+def test_batch_verifies_rejects_and_waits(db):
+    indexer = LocalChainIndexer()
+    indexer.add_transaction("BTC", "tx-ok", BTC_WALLET, MONTHLY_USD)
+    indexer.add_transaction("BTC", "tx-elsewhere", "bc1qsomeoneelse", MONTHLY_USD)
+    indexer.add_transaction("BTC", "tx-short", BTC_WALLET, 1.0)
+    indexer.add_transaction("BTC", "tx-old", BTC_WALLET, MONTHLY_USD, block_time=datetime.utcnow() - timedelta(days=30))
+    indexer.add_transaction("BTC", "tx-young", BTC_WALLET, MONTHLY_USD, confirmations=CHAIN_MIN_CONFIRMATIONS - 1)
+
+    verifier = run_batch(db, indexer, [
+        crypto_payment("ok", "tx-ok"),
+        crypto_payment("elsewhere", "tx-elsewhere"),
+        crypto_payment("short", "tx-short"),
+        crypto_payment("old", "tx-old"),
+        crypto_payment("young", "tx-young"),
+        crypto_payment("missing", "tx-missing"),
+    ])
+
+    statuses = {tid: status_of(db, tid)["status"] for tid in ["ok", "elsewhere", "short", "old", "young", "missing"]}
+    assert statuses == {
+        "ok": "verified",
+        "elsewhere": "failed",
+        "short": "failed",
+        "old": "failed",
+        "young": "user_confirmed",
+        "missing": "user_confirmed",
+    }
+    assert status_of(db, "young")["chain_checked_at"] is not None
+    assert asyncio.run(db.users.find_one({"id": "user-ok"}))["is_premium"] is True
+    assert asyncio.run(db.users.find_one({"id": "user-young"}))["is_premium"] is False
+    assert asyncio.run(db.principal_invalidations.count_documents({"user_id": "user-ok"})) == 1
+    assert (verifier.checked, verifier.verified, verifier.failed) == (6, 1, 3)
+    assert indexer.lookups == 6
+
+
+def test_missing_transaction_fails_after_deadline(db):
+    overdue = CHAIN_NOT_FOUND_DEADLINE_SECONDS / 60 + 1
+
+    run_batch(db, LocalChainIndexer(), [
+        crypto_payment("recent", "tx-recent"),
+        crypto_payment("overdue", "tx-overdue", confirmed_minutes_ago=overdue),
+    ])
+
+    assert status_of(db, "recent")["status"] == "user_confirmed"
+    overdue_payment = status_of(db, "overdue")
+    assert overdue_payment["status"] == "failed"
+    assert overdue_payment["chain_status"] == "Transação não encontrada dentro do prazo"
+
+
+def test_duplicate_hash_goes_to_the_first_confirmation(db):
+    indexer = LocalChainIndexer()
+    indexer.add_transaction("BTC", "tx-shared", BTC_WALLET, MONTHLY_USD)
+
+    verifier = run_batch(db, indexer, [
+        crypto_payment("second", "tx-shared", confirmed_minutes_ago=5),
+        crypto_payment("first", "tx-shared", confirmed_minutes_ago=20),
+    ])
+
+    assert status_of(db, "first")["status"] == "verified"
+    assert status_of(db, "second")["status"] == "failed"
+    assert status_of(db, "second")["chain_status"] == "Hash de transação já utilizado por outro pagamento"
+    assert verifier.verified == 1
+
+
+def test_hash_of_a_verified_payment_is_rejected():
+    payment = crypto_payment("new", "tx-used")
+    transaction = LocalChainIndexer().add_transaction("BTC", "tx-used", BTC_WALLET, MONTHLY_USD)
+
+    assert evaluate(payment, transaction, claimed=True)[0] == "failed"
+    assert evaluate(payment, transaction)[0] == "verified"
+
+
+class RacingIndexer(LocalChainIndexer):
+    """Um admin rejeita o pagamento enquanto o indexador responde"""
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+
+    async def get_transaction(self, crypto_currency, tx_hash):
+        if tx_hash == "tx-raced":
+            await self.db.crypto_payments.update_one(
+                {"transaction_id": "raced"}, {"$set": {"status": "failed", "admin_notes": "manual"}}
+            )
+        return await super().get_transaction(crypto_currency, tx_hash)
+
+
+class BrokenIndexer(LocalChainIndexer):
+    async def get_transaction(self, crypto_currency, tx_hash):
+        raise ConnectionError("indexador fora do ar")
+
+
+def test_bulk_write_keeps_concurrent_manual_decision(db):
+    indexer = RacingIndexer(db)
+    indexer.add_transaction("BTC", "tx-raced", BTC_WALLET, MONTHLY_USD)
+    indexer.add_transaction("BTC", "tx-other", BTC_WALLET, MONTHLY_USD)
+
+    verifier = run_batch(db, indexer, [crypto_payment("raced", "tx-raced"), crypto_payment("other", "tx-other")])
+
+    raced = status_of(db, "raced")
+    assert raced["status"] == "failed" and "chain_checked_at" not in raced
+    assert asyncio.run(db.users.find_one({"id": "user-raced"}))["is_premium"] is False
+    assert status_of(db, "other")["status"] == "verified"
+    assert verifier.verified == 1
+
+
+def test_indexer_errors_leave_payments_waiting(db):
+    verifier = run_batch(db, BrokenIndexer(), [
+        crypto_payment("overdue", "tx-overdue", confirmed_minutes_ago=CHAIN_NOT_FOUND_DEADLINE_SECONDS / 60 + 1),
+    ])
+
+    payment = status_of(db, "overdue")
+    assert payment["status"] == "user_confirmed"
+    assert payment["chain_status"].startswith("Erro no indexador")
+    assert verifier.lookup_errors == 1
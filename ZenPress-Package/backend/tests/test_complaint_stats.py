@@ -0,0 +1,89 @@
+"""
+Estatísticas materializadas de queixas: flag de tendência, top-N e backfill
+que reconstrói os contadores no lugar
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from complaint_stats import (
+    TRENDING_MIN_COUNT,
+    backfill,
+    is_trending,
+    record_complaints,
+    record_technique_usage,
+    top_complaints,
+)
+
+
+def sessions_at(complaint: str, moment: datetime, count: int) -> list:
+    return [{"complaint": complaint, "technique_id": f"tech-{complaint}", "date": moment} for _ in range(count)]
+
+
+def history() -> list:
+    now = datetime.utcnow()
+    baseline = now - timedelta(days=3)
+    return (
+        sessions_at("ansiedade", now, 6) + sessions_at("ansiedade", baseline, 7)   # 6 hoje contra 1/dia
+        + sessions_at("insônia", now, 6) + sessions_at("insônia", baseline, 70)    # 6 hoje contra 10/dia
+        + sessions_at("dor", now, 3)                                               # abaixo do mínimo
+    )
+
+
+def test_is_trending():
+    assert not is_trending(TRENDING_MIN_COUNT - 1, 0)
+    assert is_trending(TRENDING_MIN_COUNT, 0)
+    assert is_trending(6, 7)
+    assert not is_trending(6, 70)
+
+
+def test_top_complaints_reads_the_counters(db):
+    async def scenario():
+        await record_complaints(db, history())
+        return await top_complaints(db), await top_complaints(db, limit=1)
+
+    top, first = asyncio.run(scenario())
+
+    assert top == [
+        {"complaint": "insônia", "count": 76, "trending": False},
+        {"complaint": "ansiedade", "count": 13, "trending": True},
+        {"complaint": "dor", "count": 3, "trending": False},
+    ]
+    assert first == top[:1]
+
+
+def test_top_complaints_without_data(db):
+    assert asyncio.run(top_complaints(db)) == []
+
+
+def test_backfill_rebuilds_in_place(db):
+    sessions = history()
+    future = datetime.utcnow() + timedelta(minutes=5)
+
+    async def scenario():
+        # Contadores incrementais de referência, com um bucket e um total corrompidos
+        await record_complaints(db, sessions)
+        await record_technique_usage(db, sessions)
+        expected_top = await top_complaints(db)
+        day_bucket = await db.complaint_buckets.find_one({"granularity": "day", "complaint": "insônia"})
+        await db.complaint_buckets.update_many({"complaint": "insônia"}, {"$inc": {"count": 100}})
+        await db.complaint_totals.insert_one({"_id": "removida", "count": 9, "updated_at": datetime(2020, 1, 1)})
+        # Criado por uma sessão gravada durante o backfill
+        await db.complaint_totals.insert_one({"_id": "nova", "count": 1, "updated_at": future})
+
+        await db.sessions.insert_many(sessions)
+        rebuilt = await backfill(db)
+        return expected_top, day_bucket, rebuilt
+
+    expected_top, day_bucket, rebuilt = asyncio.run(scenario())
+
+    assert rebuilt == 3
+    top = asyncio.run(top_complaints(db))
+    assert [t for t in top if t["complaint"] != "nova"] == expected_top
+    totals = {t["_id"]: t["count"] for t in asyncio.run(db.complaint_totals.find().to_list(None))}
+    assert totals == {"insônia": 76, "ansiedade": 13, "dor": 3, "nova": 1}
+    # O bucket foi sobrescrito no lugar, não apagado e reinserido
+    rebuilt_bucket = asyncio.run(db.complaint_buckets.find_one({"_id": day_bucket["_id"]}))
+    assert rebuilt_bucket["count"] == day_bucket["count"]
+    techniques = {t["_id"]: t["count"] for t in asyncio.run(db.technique_totals.find().to_list(None))}
+    assert techniques == {"tech-insônia": 76, "tech-ansiedade": 13, "tech-dor": 3}
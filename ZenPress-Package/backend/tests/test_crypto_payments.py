@@ -0,0 +1,44 @@
+"""
+Verificação administrativa de pagamentos crypto: apenas ADMIN_EMAILS, 404 preservado
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import auth
+from auth import get_current_user
+from crypto_payments import crypto_router
+from database import get_database
+from models import UserResponse
+
+VERIFY_URL = "/api/crypto/admin/verify-payment/{}"
+
+
+@pytest.fixture
+def app(db, monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_EMAILS", frozenset({"admin@zenpress.org"}))
+    app = FastAPI()
+    app.include_router(crypto_router, prefix="/api")
+    app.dependency_overrides[get_database] = lambda: db
+    return app
+
+
+def as_user(email: str) -> UserResponse:
+    return UserResponse(id=email, name="Ana", email=email, is_premium=True)
+
+
+def test_premium_user_cannot_verify_payments(app):
+    app.dependency_overrides[get_current_user] = lambda: as_user("premium@example.com")
+
+    response = TestClient(app).post(VERIFY_URL.format("tx-1"), json={"status": "verified"})
+
+    assert response.status_code == 403
+
+
+def test_unknown_payment_is_404(app):
+    app.dependency_overrides[get_current_user] = lambda: as_user("admin@zenpress.org")
+
+    response = TestClient(app).post(VERIFY_URL.format("missing"), json={"status": "verified"})
+
+    assert response.status_code == 404
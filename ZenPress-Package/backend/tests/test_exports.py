@@ -0,0 +1,58 @@
+"""
+Exportações administrativas: acesso restrito a ADMIN_EMAILS e CSV sem fórmulas
+"""
+
+import asyncio
+import csv
+import io
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import auth
+from auth import get_current_user
+from database import get_database
+from models import UserResponse
+from reviews_analytics import reviews_router
+
+EXPORT_URL = "/api/reviews/admin/export"
+
+
+def as_user(email: str, is_premium: bool = True) -> UserResponse:
+    return UserResponse(id=email, name="Ana", email=email, is_premium=is_premium)
+
+
+@pytest.fixture
+def app(db, monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_EMAILS", frozenset({"admin@zenpress.org"}))
+    app = FastAPI()
+    app.include_router(reviews_router, prefix="/api")
+    app.dependency_overrides[get_database] = lambda: db
+    return app
+
+
+def test_premium_user_cannot_export(app):
+    app.dependency_overrides[get_current_user] = lambda: as_user("premium@example.com")
+
+    response = TestClient(app).get(EXPORT_URL)
+
+    assert response.status_code == 403
+
+
+def test_csv_cells_cannot_start_formulas(app, db):
+    app.dependency_overrides[get_current_user] = lambda: as_user("Admin@zenpress.org", is_premium=False)
+    comments = ['=HYPERLINK("http://evil.test","x")', "+1+1", "-2", "@SUM(A1)", "ótimo - ajudou"]
+    asyncio.run(db.reviews.insert_many([
+        {"id": str(i), "user_id": "u", "technique_id": "t", "rating": 5, "comment": comment}
+        for i, comment in enumerate(comments)
+    ]))
+
+    response = TestClient(app).get(EXPORT_URL, params={"format": "csv"})
+
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert sorted(row["comment"] for row in rows) == sorted(
+        ["'" + comment for comment in comments[:4]] + [comments[4]]
+    )
+    assert {row["rating"] for row in rows} == {"5"}
@@ -0,0 +1,114 @@
+"""
+Paginação por cursor: cursores malformados viram 400 e as páginas cobrem a
+coleção inteira, sem repetir itens com o mesmo valor de ordenação
+"""
+
+import asyncio
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from auth import get_current_user
+from database import get_database
+from models import UserResponse
+from pagination import PageParams, decode_cursor, encode_cursor, paginate
+from payment_models import PaymentTransaction
+from payments import payments_router
+
+
+def raw_cursor(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip("=")
+
+
+BROKEN_CURSORS = [
+    "%%%",                                          # não é base64
+    raw_cursor("not json"),
+    raw_cursor('[{"$oid": "zz"}, 1]'),              # InvalidId
+    raw_cursor('[{"$date": "x"}, 1]'),              # IndexError
+    raw_cursor('[{"$date": {}}, 1]'),
+    raw_cursor('{"created_at": 1}'),                # não é lista
+    raw_cursor('[1]'),                              # tamanho errado
+    raw_cursor('[{"$where": "sleep(1000)"}, 1]'),   # documento no filtro
+    raw_cursor('[[1, 2], 1]'),
+]
+
+
+@pytest.mark.parametrize("cursor", BROKEN_CURSORS)
+def test_decode_cursor_rejects_broken_cursors(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, 2)
+    assert error.value.status_code == 400
+
+
+def test_cursor_round_trip_keeps_bson_types():
+    moment = datetime(2024, 5, 1, 12, 30, 15, 123000)
+    object_id = ObjectId()
+
+    assert decode_cursor(encode_cursor([moment, object_id]), 2) == [moment, object_id]
+
+
+@pytest.fixture
+def client(db):
+    app = FastAPI()
+    app.include_router(payments_router)
+    app.dependency_overrides[get_database] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: UserResponse(
+        id="user-1", name="Ana", email="ana@example.com", is_premium=False
+    )
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("cursor", BROKEN_CURSORS)
+def test_endpoint_answers_400_for_broken_cursors(client, cursor):
+    response = client.get("/api/payments/v1/transactions", params={"cursor": cursor})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cursor inválido"
+
+
+def test_pages_cover_ties_without_repeats(client, db):
+    created_at = datetime(2024, 5, 1)
+    # Metade das transações com o mesmo created_at: o _id desempata
+    transactions = [
+        PaymentTransaction(
+            user_id="user-1",
+            session_id=f"cs_{i}",
+            amount=10,
+            product_type="course",
+            product_id="course_basic",
+            created_at=created_at if i % 2 else created_at + timedelta(minutes=i),
+        ).model_dump()
+        for i in range(7)
+    ]
+    asyncio.run(db.payment_transactions.insert_many(transactions))
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/payments/v1/transactions", params=params)
+        assert response.status_code == 200
+        seen.extend(item["session_id"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert sorted(seen) == sorted(t["session_id"] for t in transactions)
+    assert len(seen) == len(set(seen))
+
+
+def test_paginate_last_page_has_no_cursor(db):
+    asyncio.run(db.favorites.insert_many(
+        [{"user_id": "user-1", "technique_id": str(i), "created_at": datetime(2024, 1, 1 + i)} for i in range(2)]
+    ))
+
+    documents, next_cursor = asyncio.run(paginate(
+        db.favorites, {"user_id": "user-1"}, [("created_at", -1)], PageParams(cursor=None, limit=2)
+    ))
+
+    assert [d["technique_id"] for d in documents] == ["1", "0"]
+    assert next_cursor is None
@@ -0,0 +1,64 @@
+"""
+Cache de principals: invalidações publicadas por um processo chegam aos outros
+"""
+
+import asyncio
+
+import auth
+from auth import PrincipalCache, invalidate_principal, load_principal
+
+
+def test_invalidation_reaches_other_processes(db, monkeypatch):
+    api_worker = PrincipalCache(maxsize=10, ttl=60, sync_interval=0)
+    activation_worker = PrincipalCache(maxsize=10, ttl=60, sync_interval=0)
+
+    async def scenario():
+        await db.users.insert_one({"id": "user-1", "name": "Ana", "email": "ana@example.com", "is_premium": False})
+        monkeypatch.setattr(auth, "principal_cache", api_worker)
+        before = await load_principal(db, "user-1")
+        cached = await load_principal(db, "user-1")
+
+        await db.users.update_one({"id": "user-1"}, {"$set": {"is_premium": True}})
+        monkeypatch.setattr(auth, "principal_cache", activation_worker)
+        await invalidate_principal(db, "user-1")
+
+        monkeypatch.setattr(auth, "principal_cache", api_worker)
+        after = await load_principal(db, "user-1")
+        return before, cached, after
+
+    before, cached, after = asyncio.run(scenario())
+
+    assert before.is_premium is False and cached is before
+    assert after.is_premium is True
+    assert api_worker.remote_invalidations == 1
+    assert api_worker.hits == 1
+
+
+def test_sync_is_rate_limited_and_skips_seen_entries(db):
+    cache = PrincipalCache(maxsize=10, ttl=60, sync_interval=60)
+
+    async def scenario():
+        await cache.sync(db)
+        await db.principal_invalidations.insert_one({"user_id": "user-1"})
+        await cache.sync(db)  # ainda dentro do intervalo: não consulta
+        skipped = cache.remote_invalidations
+        cache.sync_interval = 0
+        await cache.sync(db)
+        await cache.sync(db)  # a janela de sobreposição relê a entrada, sem reaplicar
+        return skipped
+
+    skipped = asyncio.run(scenario())
+
+    assert skipped == 0
+    assert cache.remote_invalidations == 1
+    assert cache.syncs == 3
+
+
+def test_load_racing_an_invalidation_is_not_cached():
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    generation = cache.generation
+    cache.invalidate("user-1")
+
+    cache.set("user-1", object(), generation)
+
+    assert cache.get("user-1") is None
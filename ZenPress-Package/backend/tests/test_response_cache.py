@@ -0,0 +1,113 @@
+"""
+Cache de respostas: single-flight, stale-while-revalidate e falhas do recálculo
+"""
+
+import asyncio
+
+import pytest
+
+from response_cache import CachePolicy, ResponseCache
+
+POLICY = CachePolicy(ttl=60, stale=600)
+
+
+class Loader:
+    """Recálculo controlado pelo teste: conta chamadas e só termina quando liberado"""
+
+    def __init__(self, *values):
+        self.values = list(values)
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        value = self.values.pop(0)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+def expire(cache: ResponseCache, key: str) -> None:
+    """Passa o valor para a janela stale sem esperar o TTL"""
+    cache._entries[key].fresh_until = 0.0
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = ResponseCache()
+
+    async def scenario():
+        loader = Loader("value")
+        requests = [asyncio.create_task(cache.get("stats", loader, POLICY)) for _ in range(10)]
+        await asyncio.sleep(0)
+        loader.release.set()
+        return loader, await asyncio.gather(*requests)
+
+    loader, values = asyncio.run(scenario())
+
+    assert loader.calls == 1
+    assert values == ["value"] * 10
+    stats = cache.stats()["keys"]["stats"]
+    assert (stats["misses"], stats["coalesced"], stats["computations"]) == (1, 9, 1)
+
+
+def test_stale_value_is_served_while_refreshing():
+    cache = ResponseCache()
+
+    async def scenario():
+        first = Loader("old")
+        first.release.set()
+        await cache.get("stats", first, POLICY)
+        expire(cache, "stats")
+
+        refresh = Loader("new")
+        served = [await cache.get("stats", refresh, POLICY) for _ in range(3)]
+        await asyncio.sleep(0)
+        pending_calls = refresh.calls
+        refresh.release.set()
+        await asyncio.sleep(0.01)
+        return served, pending_calls, refresh, await cache.get("stats", refresh, POLICY)
+
+    served, pending_calls, refresh, after = asyncio.run(scenario())
+
+    assert served == ["old"] * 3
+    assert pending_calls == 1
+    assert after == "new"
+    assert refresh.calls == 1
+    assert cache.stats()["keys"]["stats"]["stale_hits"] == 3
+
+
+def test_failed_computation_does_not_poison_the_entry():
+    cache = ResponseCache()
+
+    async def scenario():
+        loader = Loader(RuntimeError("mongo down"), "recovered")
+        loader.release.set()
+        with pytest.raises(RuntimeError):
+            await cache.get("stats", loader, POLICY)
+        return await cache.get("stats", loader, POLICY)
+
+    assert asyncio.run(scenario()) == "recovered"
+    stats = cache.stats()["keys"]["stats"]
+    assert (stats["errors"], stats["misses"], stats["computations"]) == (1, 2, 1)
+
+
+def test_failed_background_refresh_keeps_stale_value_and_retries():
+    cache = ResponseCache()
+
+    async def scenario():
+        loader = Loader("old", RuntimeError("mongo down"), "new")
+        loader.release.set()
+        await cache.get("stats", loader, POLICY)
+        expire(cache, "stats")
+
+        during_failure = await cache.get("stats", loader, POLICY)
+        await asyncio.sleep(0.01)
+        after_failure = await cache.get("stats", loader, POLICY)  # ainda stale: tenta de novo
+        await asyncio.sleep(0.01)
+        return during_failure, after_failure, await cache.get("stats", loader, POLICY)
+
+    during_failure, after_failure, recovered = asyncio.run(scenario())
+
+    assert (during_failure, after_failure, recovered) == ("old", "old", "new")
+    assert cache.stats()["keys"]["stats"]["errors"] == 1
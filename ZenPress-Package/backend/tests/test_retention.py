@@ -0,0 +1,129 @@
+"""
+Retenção por coortes: processamento incremental por marca d'água e lease de um
+único worker; o relatório é restrito a ADMIN_EMAILS
+"""
+
+import asyncio
+from datetime import datetime, time, timedelta
+
+import pandas as pd
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import auth
+import retention
+from auth import get_current_user
+from database import get_database
+from models import UserResponse
+from retention import RetentionEngine, _acquire_lease, _renew_lease, week_indices, week_start
+from reviews_analytics import reviews_router
+
+
+@pytest.fixture(autouse=True)
+def no_safety_lag(monkeypatch):
+    # Os documentos do teste acabaram de ser inseridos
+    monkeypatch.setattr(retention, "RETENTION_SAFETY_LAG_SECONDS", -60)
+
+
+def cohort_monday(weeks_ago: int) -> datetime:
+    current_week = int(week_indices(pd.Series([datetime.utcnow()]))[0])
+    return datetime.combine(week_start(current_week - weeks_ago), time(9))
+
+
+def user(user_id: str, created_at: datetime) -> dict:
+    return {"id": user_id, "email": f"{user_id}@example.com", "created_at": created_at}
+
+
+def session(user_id: str, moment: datetime) -> dict:
+    return {"user_id": user_id, "date": moment}
+
+
+def test_refresh_processes_only_new_events(db):
+    monday = cohort_monday(3)
+    engine = RetentionEngine(batch_size=2)
+
+    async def scenario():
+        await db.users.insert_many([user("ana", monday), user("bia", monday + timedelta(days=1))])
+        await db.sessions.insert_many([
+            session("ana", monday),
+            session("ana", monday + timedelta(hours=2)),      # mesma semana: um usuário ativo só
+            session("bia", monday + timedelta(days=8)),
+        ])
+        first = await engine.refresh(db)
+
+        await db.users.insert_one(user("caio", monday + timedelta(days=2)))
+        await db.sessions.insert_many([
+            session("ana", monday + timedelta(days=7, hours=1)),
+            session("bia", monday + timedelta(days=9)),        # par (bia, semana 1) já contado
+            session("caio", monday + timedelta(days=14)),
+        ])
+        second = await engine.refresh(db)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    [row] = first["cohorts"]
+    assert row["week_start"] == monday.date().isoformat()
+    assert row["size"] == 2
+    assert row["retention"][:2] == [50.0, 50.0]
+    assert first["hour_histogram"][9] == 2
+
+    [row] = second["cohorts"]
+    assert row["size"] == 3
+    assert row["retention"][:3] == [33.3, 66.7, 33.3]
+    assert second["user_retention"] == 66.7
+    assert sum(second["hour_histogram"]) == 6
+
+    state = asyncio.run(db.retention_state.find_one({"_id": retention.STATE_ID}))
+    assert "lease_owner" not in state
+    assert asyncio.run(db.retention_activity.count_documents({})) == 4
+
+
+def test_lease_rejects_a_second_runner(db):
+    monday = cohort_monday(2)
+    asyncio.run(db.users.insert_one(user("ana", monday)))
+
+    async def scenario():
+        assert await _acquire_lease(db, "worker-a")
+        blocked = await _acquire_lease(db, "worker-b")
+        renewed = await _renew_lease(db, "worker-b")
+        # Enquanto worker-a detém o lease, outro engine só lê os agregados
+        report = await RetentionEngine().refresh(db)
+        return blocked, renewed, report
+
+    blocked, renewed, report = asyncio.run(scenario())
+
+    assert blocked is False
+    assert renewed is False
+    assert report["cohorts"] == []
+    state = asyncio.run(db.retention_state.find_one({"_id": retention.STATE_ID}))
+    assert state["lease_owner"] == "worker-a"
+    assert "users_watermark" not in state
+
+
+def test_expired_lease_can_be_taken_over(db):
+    async def scenario():
+        await _acquire_lease(db, "worker-a")
+        await db.retention_state.update_one(
+            {"_id": retention.STATE_ID}, {"$set": {"lease_until": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        taken = await _acquire_lease(db, "worker-b")
+        return taken, await _renew_lease(db, "worker-a")
+
+    taken, stale_owner_renewed = asyncio.run(scenario())
+
+    assert taken is True
+    assert stale_owner_renewed is False
+
+
+def test_report_endpoint_is_admin_only(db, monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_EMAILS", frozenset({"admin@zenpress.org"}))
+    app = FastAPI()
+    app.include_router(reviews_router, prefix="/api")
+    app.dependency_overrides[get_database] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: UserResponse(
+        id="premium", name="Ana", email="premium@example.com", is_premium=True
+    )
+
+    assert TestClient(app).get("/api/reviews/retention").status_code == 403
@@ -0,0 +1,101 @@
+"""
+Sincronização offline de sessões: reenviar o mesmo client_id não duplica e
+lotes mistos separam sessões novas, repetidas e inválidas
+"""
+
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import server
+from auth import get_current_user
+from catalog import TechniqueCatalog
+from database import get_database
+from models import Technique, UserResponse
+
+SYNC_URL = "/api/sessions/sync"
+
+
+@pytest.fixture
+def aggregated(monkeypatch):
+    """Sessões repassadas aos agregados (contadores, streaks, rollups)"""
+    sessions = []
+
+    async def record(db, user, inserted):
+        sessions.extend(inserted)
+
+    monkeypatch.setattr(server, "record_session_aggregates", record)
+    return sessions
+
+
+@pytest.fixture
+def client(db, monkeypatch, aggregated):
+    technique = Technique(
+        id="tech-1", name="Yintang", category="mtc", condition="ansiedade", description="",
+        instructions=[], image="", pressure="leve", warnings=[],
+    )
+
+    async def prepare():
+        await db.techniques.insert_one(technique.model_dump())
+        await db.sessions.create_index([("user_id", 1), ("client_id", 1)], unique=True)
+
+    asyncio.run(prepare())
+    monkeypatch.setattr(server, "catalog", TechniqueCatalog(max_staleness=60))
+    app = FastAPI()
+    app.include_router(server.api_router)
+    app.dependency_overrides[get_database] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: UserResponse(
+        id="user-1", name="Ana", email="ana@example.com", is_premium=False
+    )
+    return TestClient(app)
+
+
+def offline_session(client_id: str, technique_id: str = "tech-1") -> dict:
+    return {"client_id": client_id, "technique_id": technique_id, "complaint": "ansiedade", "duration": 60}
+
+
+def sync(client, *sessions):
+    response = client.post(SYNC_URL, json={"sessions": list(sessions)})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_resending_a_client_id_does_not_duplicate(client, db, aggregated):
+    first = sync(client, offline_session("device-1"))
+    second = sync(client, offline_session("device-1"))
+
+    assert (first["created"], second["created"], second["duplicates"]) == (1, 0, 1)
+    [result] = second["results"]
+    assert result["status"] == "duplicate"
+    assert result["session_id"] == first["results"][0]["session_id"]
+    assert asyncio.run(db.sessions.count_documents({"user_id": "user-1"})) == 1
+    assert [session["client_id"] for session in aggregated] == ["device-1"]
+
+
+def test_mixed_batch_inserts_only_new_sessions(client, db, aggregated):
+    sync(client, offline_session("device-1"), offline_session("device-2"))
+
+    body = sync(
+        client,
+        offline_session("device-2"),
+        offline_session("device-3"),
+        offline_session("device-3"),          # repetido no mesmo lote
+        offline_session("device-4", "missing"),
+        offline_session("device-5"),
+    )
+
+    statuses = {result["client_id"]: result["status"] for result in body["results"]}
+    assert statuses == {
+        "device-2": "duplicate",
+        "device-3": "created",
+        "device-4": "invalid",
+        "device-5": "created",
+    }
+    assert (body["created"], body["duplicates"], body["invalid"]) == (2, 1, 1)
+    client_ids = asyncio.run(db.sessions.distinct("client_id", {"user_id": "user-1"}))
+    assert sorted(client_ids) == ["device-1", "device-2", "device-3", "device-5"]
+    assert asyncio.run(db.sessions.count_documents({})) == 4
+    # Só as sessões inseridas chegam aos contadores e streaks
+    assert sorted(session["client_id"] for session in aggregated) == sorted(client_ids)
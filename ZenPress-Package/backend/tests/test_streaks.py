@@ -0,0 +1,133 @@
+"""
+Streaks sobre o bitmap de dias ativos: dias sem prática, virada de mês e de
+ano (inclusive entre palavras de 32 bits), bitmap vazio e backfill_activity
+"""
+
+import asyncio
+from datetime import date, datetime
+
+import pytest
+from bson.int64 import Int64
+
+from streaks import (
+    EPOCH,
+    WORD_BITS,
+    activity_masks,
+    bit_updates,
+    current_streak,
+    day_index,
+    longest_streak,
+    resolve_timezone,
+)
+from user_stats import backfill_activity, summarize
+
+UTC = resolve_timezone("UTC")
+
+
+def day(moment: date) -> int:
+    return (moment - EPOCH).days
+
+
+def activity(*days: date) -> dict:
+    return activity_masks(day(d) for d in days)
+
+
+@pytest.mark.parametrize("stored", [None, {}])
+def test_empty_bitmap_has_no_streak(stored):
+    assert current_streak(stored, day(date(2024, 3, 1))) == 0
+    assert longest_streak(stored) == 0
+
+
+def test_gap_day_breaks_the_streak():
+    days = activity(date(2024, 3, 1), date(2024, 3, 2), date(2024, 3, 4), date(2024, 3, 5))
+
+    assert current_streak(days, day(date(2024, 3, 5))) == 2
+    # Hoje ainda não acabou: a sequência até ontem continua valendo
+    assert current_streak(days, day(date(2024, 3, 6))) == 2
+    assert current_streak(days, day(date(2024, 3, 7))) == 0
+    assert current_streak(days, day(date(2024, 3, 3))) == 2
+    assert longest_streak(days) == 2
+
+
+def test_month_rollover():
+    days = activity(date(2024, 2, 27), date(2024, 2, 28), date(2024, 2, 29), date(2024, 3, 1))
+
+    assert current_streak(days, day(date(2024, 3, 1))) == 4
+    assert longest_streak(days) == 4
+
+
+def test_year_rollover():
+    masks = activity(date(2023, 12, 30), date(2023, 12, 31), date(2024, 1, 1), date(2024, 1, 2))
+
+    assert current_streak(masks, day(date(2024, 1, 2))) == 4
+    assert current_streak(masks, day(date(2024, 1, 3))) == 4
+    assert longest_streak(masks) == 4
+
+
+def test_streak_across_32_bit_words():
+    boundary = (day(date(2024, 1, 1)) // WORD_BITS + 1) * WORD_BITS
+    masks = activity_masks(range(boundary - 3, boundary + 2))
+
+    assert sorted(masks) == [str(boundary // WORD_BITS - 1), str(boundary // WORD_BITS)]
+    assert current_streak(masks, boundary + 1) == 5
+    assert current_streak(masks, boundary) == 4
+    assert longest_streak(masks) == 5
+
+
+def test_streak_before_the_first_word():
+    masks = activity(date(2024, 3, 1))
+
+    assert current_streak(masks, day(date(2023, 1, 1))) == 0
+
+
+def test_longest_streak_picks_the_longest_run():
+    masks = activity(
+        date(2023, 12, 1), date(2023, 12, 2), date(2023, 12, 3),
+        date(2024, 1, 10), date(2024, 1, 11), date(2024, 1, 12), date(2024, 1, 13),
+        date(2024, 2, 1),
+    )
+
+    assert longest_streak(masks) == 4
+    assert current_streak(masks, day(date(2024, 2, 1))) == 1
+
+
+def test_day_index_uses_the_user_timezone():
+    late_evening_in_sao_paulo = datetime(2024, 1, 1, 2, 30)  # UTC
+
+    assert day_index(late_evening_in_sao_paulo, UTC) == day(date(2024, 1, 1))
+    assert day_index(late_evening_in_sao_paulo, resolve_timezone("America/Sao_Paulo")) == day(date(2023, 12, 31))
+    assert resolve_timezone("Not/AZone") == UTC
+
+
+def test_bit_updates_use_int64_masks():
+    masks = activity_masks([WORD_BITS - 1, WORD_BITS])
+
+    updates = bit_updates(masks)
+
+    assert updates == {"activity.0": {"or": Int64(1 << (WORD_BITS - 1))}, "activity.1": {"or": Int64(1)}}
+    assert all(isinstance(update["or"], Int64) for update in updates.values())
+
+
+def test_backfill_activity_rebuilds_bitmaps_per_user(db):
+    sessions = [
+        ("ana", datetime(2023, 12, 31, 12)),
+        ("ana", datetime(2024, 1, 1, 9)),
+        ("ana", datetime(2024, 1, 1, 20)),       # mesmo dia: um bit só
+        ("bia", datetime(2024, 1, 1, 2, 30)),    # 31/12 em São Paulo
+        ("bia", datetime(2024, 1, 2, 12)),
+    ]
+
+    async def scenario():
+        await db.users.insert_many([{"id": "ana", "timezone": "UTC"}, {"id": "bia", "timezone": "America/Sao_Paulo"}])
+        await db.user_stats.insert_many([{"_id": "ana", "total_sessions": 3}, {"_id": "bia", "total_sessions": 2}])
+        await db.sessions.insert_many([{"user_id": user_id, "date": moment} for user_id, moment in sessions])
+        await backfill_activity(db, batch_size=1)
+        return {doc["_id"]: doc async for doc in db.user_stats.find()}
+
+    stats = asyncio.run(scenario())
+
+    assert stats["ana"]["activity"] == activity(date(2023, 12, 31), date(2024, 1, 1))
+    assert stats["bia"]["activity"] == activity(date(2023, 12, 31), date(2024, 1, 2))
+    assert longest_streak(stats["ana"]["activity"]) == 2
+    assert longest_streak(stats["bia"]["activity"]) == 1
+    assert summarize(stats["ana"])["longest_streak_days"] == 2
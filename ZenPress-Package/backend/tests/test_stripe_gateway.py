@@ -0,0 +1,149 @@
+"""
+Stripe gateway retries and idempotency against stripe_fake.FakeStripeServer
+"""
+
+import asyncio
+import os
+
+import httpx
+import pytest
+
+import stripe_gateway
+from stripe_fake import FakeStripeServer
+from stripe_gateway import CheckoutSessionRequest, StripeCheckout, StripeGatewayError
+
+LEGACY_GATEWAY = os.path.join(
+    os.path.dirname(stripe_gateway.__file__), os.pardir, os.pardir, "backend", "stripe_gateway.py"
+)
+
+SESSION_REQUEST = CheckoutSessionRequest(
+    amount=29.9,
+    success_url="https://zenpress.test/payment/success",
+    cancel_url="https://zenpress.test/payment/cancel",
+    metadata={"user_id": "user-1"},
+)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(stripe_gateway, "STRIPE_RETRY_BASE_SECONDS", 0)
+
+
+def gateway_for(handler, max_retries: int = 2) -> StripeCheckout:
+    return StripeCheckout("sk_test_fake", transport=httpx.MockTransport(handler), max_retries=max_retries)
+
+
+def run(gateway: StripeCheckout, call):
+    async def scenario():
+        try:
+            return await call(gateway)
+        finally:
+            await gateway.close()
+    return asyncio.run(scenario())
+
+
+def test_create_retries_transient_errors():
+    server = FakeStripeServer()
+    server.fail_next = 2
+    gateway = gateway_for(server.handle)
+
+    session = run(gateway, lambda g: g.create_checkout_session(SESSION_REQUEST))
+
+    assert session.session_id in server.sessions
+    assert server.calls == 3
+    assert gateway.retries == 2
+    assert gateway.failures == 0
+    assert server.sessions[session.session_id]["amount_total"] == 2990
+
+
+def test_create_gives_up_after_max_retries():
+    server = FakeStripeServer()
+    server.fail_next = 3
+    gateway = gateway_for(server.handle)
+
+    with pytest.raises(StripeGatewayError) as error:
+        run(gateway, lambda g: g.create_checkout_session(SESSION_REQUEST))
+
+    assert error.value.status_code == 503
+    assert server.calls == 3
+    assert gateway.failures == 1
+    assert server.sessions == {}
+
+
+def test_retry_after_lost_response_reuses_the_session():
+    server = FakeStripeServer()
+    keys = []
+
+    async def lose_first_response(request: httpx.Request) -> httpx.Response:
+        keys.append(request.headers.get("idempotency-key"))
+        response = await server.handle(request)
+        if len(keys) == 1:
+            # Stripe created the session but the answer never arrived
+            return httpx.Response(502)
+        return response
+
+    session = run(gateway_for(lose_first_response), lambda g: g.create_checkout_session(SESSION_REQUEST))
+
+    assert len(keys) == 2
+    assert keys[0] and keys[0] == keys[1]
+    assert list(server.sessions) == [session.session_id]
+
+
+def test_same_idempotency_key_returns_same_session():
+    server = FakeStripeServer()
+
+    async def create_twice(gateway: StripeCheckout):
+        first = await gateway.create_checkout_session(SESSION_REQUEST, idempotency_key="order-1")
+        second = await gateway.create_checkout_session(SESSION_REQUEST, idempotency_key="order-1")
+        third = await gateway.create_checkout_session(SESSION_REQUEST)
+        return first, second, third
+
+    first, second, third = run(gateway_for(server.handle), create_twice)
+
+    assert first.session_id == second.session_id
+    assert third.session_id != first.session_id
+    assert len(server.sessions) == 2
+
+
+def test_status_is_retried_and_not_found_is_not():
+    server = FakeStripeServer()
+
+    async def scenario(gateway: StripeCheckout):
+        session = await gateway.create_checkout_session(SESSION_REQUEST)
+        server.complete(session.session_id)
+        server.fail_next = 1
+        status = await gateway.get_checkout_status(session.session_id)
+        calls = server.calls
+        with pytest.raises(StripeGatewayError) as error:
+            await gateway.get_checkout_status("cs_test_missing")
+        return status, calls, error.value
+
+    status, calls, error = run(gateway_for(server.handle), scenario)
+
+    assert (status.status, status.payment_status) == ("complete", "paid")
+    assert calls == 3
+    assert error.status_code == 404
+    assert server.calls == 4
+
+
+def test_idempotency_conflict_is_not_retried():
+    calls = []
+
+    async def conflict(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(409, json={"error": {"type": "idempotency_error"}})
+
+    gateway = gateway_for(conflict)
+    with pytest.raises(StripeGatewayError) as error:
+        run(gateway, lambda g: g.create_checkout_session(SESSION_REQUEST, idempotency_key="order-1"))
+
+    assert error.value.status_code == 409
+    assert len(calls) == 1
+    assert gateway.retries == 0
+
+
+def test_legacy_backend_copy_matches():
+    if not os.path.exists(LEGACY_GATEWAY):
+        pytest.skip("legacy backend/ tree not present")
+    with open(stripe_gateway.__file__, "rb") as package_copy, open(LEGACY_GATEWAY, "rb") as legacy_copy:
+        assert legacy_copy.read() == package_copy.read(), "copy ZenPress-Package/backend/stripe_gateway.py to backend/"
@@ -0,0 +1,133 @@
+"""
+Stripe webhook endpoint: signature checks, duplicate deliveries and final
+payment states, driven by the signed events of stripe_fake.FakeStripeEmitter
+"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from database import get_database
+from payment_models import PaymentTransaction
+from payments import payments_router
+from stripe_fake import FakeStripeEmitter
+from stripe_webhooks import STRIPE_WEBHOOK_SECRET
+
+WEBHOOK_URL = "/api/payments/v1/webhook/stripe"
+
+
+@pytest.fixture
+def client(db):
+    app = FastAPI()
+    app.include_router(payments_router)
+    app.dependency_overrides[get_database] = lambda: db
+    return TestClient(app)
+
+
+@pytest.fixture
+def emitter():
+    return FakeStripeEmitter(STRIPE_WEBHOOK_SECRET)
+
+
+def create_transaction(db, session_id: str, payment_status: str = "pending") -> None:
+    transaction = PaymentTransaction(
+        user_id="user-1",
+        session_id=session_id,
+        amount=29.9,
+        product_type="premium_subscription",
+        product_id="premium_monthly",
+        payment_status=payment_status,
+    )
+    asyncio.run(db.payment_transactions.insert_one(transaction.model_dump()))
+
+
+def stored(db, session_id: str) -> dict:
+    return asyncio.run(db.payment_transactions.find_one({"session_id": session_id}))
+
+
+def deliver(client, emitter, event, **sign_options):
+    payload, headers = emitter.sign(event, **sign_options)
+    return client.post(WEBHOOK_URL, content=payload, headers=headers)
+
+
+def test_rejects_wrong_secret(client, db, emitter):
+    create_transaction(db, "cs_test_1")
+    event = emitter.checkout_event("cs_test_1")
+
+    response = deliver(client, emitter, event, secret="whsec_forged")
+
+    assert response.status_code == 400
+    assert stored(db, "cs_test_1")["payment_status"] == "pending"
+
+
+def test_rejects_stale_timestamp(client, db, emitter):
+    create_transaction(db, "cs_test_1")
+    event = emitter.checkout_event("cs_test_1")
+
+    response = deliver(client, emitter, event, timestamp=int(time.time()) - 3600)
+
+    assert response.status_code == 400
+    assert stored(db, "cs_test_1")["payment_status"] == "pending"
+
+
+def test_rejects_missing_signature(client, db, emitter):
+    payload, _ = emitter.sign(emitter.checkout_event("cs_test_1"))
+
+    response = client.post(WEBHOOK_URL, content=payload, headers={"Content-Type": "application/json"})
+
+    assert response.status_code == 400
+
+
+def test_duplicate_delivery_is_applied_once(client, db, emitter):
+    create_transaction(db, "cs_test_1")
+    event = emitter.checkout_event("cs_test_1")
+
+    first = deliver(client, emitter, event)
+    second = deliver(client, emitter, event)
+
+    assert first.json() == {"received": True}
+    assert second.json() == {"received": True, "duplicate": True}
+    transaction = stored(db, "cs_test_1")
+    assert transaction["payment_status"] == "paid"
+    assert transaction["activation"]["state"] == "pending"
+    assert asyncio.run(db.stripe_events.count_documents({})) == 1
+
+
+@pytest.mark.parametrize("event_type, payment_status", [
+    ("checkout.session.completed", "unpaid"),
+    ("checkout.session.async_payment_failed", "failed"),
+    ("checkout.session.expired", "unpaid"),
+])
+def test_paid_is_never_downgraded(client, db, emitter, event_type, payment_status):
+    create_transaction(db, "cs_test_1")
+    deliver(client, emitter, emitter.checkout_event("cs_test_1"))
+    paid_at = stored(db, "cs_test_1")["paid_at"]
+
+    response = deliver(client, emitter, emitter.checkout_event("cs_test_1", event_type, payment_status))
+
+    assert response.status_code == 200
+    transaction = stored(db, "cs_test_1")
+    assert transaction["payment_status"] == "paid"
+    assert transaction["paid_at"] == paid_at
+
+
+@pytest.mark.parametrize("final_status", ["failed", "expired"])
+def test_late_unpaid_completion_keeps_final_state(client, db, emitter, final_status):
+    create_transaction(db, "cs_test_1", payment_status=final_status)
+
+    deliver(client, emitter, emitter.checkout_event("cs_test_1", payment_status="unpaid"))
+
+    assert stored(db, "cs_test_1")["payment_status"] == final_status
+
+
+def test_late_success_after_failure_is_paid(client, db, emitter):
+    create_transaction(db, "cs_test_1", payment_status="failed")
+
+    deliver(client, emitter, emitter.checkout_event("cs_test_1", "checkout.session.async_payment_succeeded"))
+
+    transaction = stored(db, "cs_test_1")
+    assert transaction["payment_status"] == "paid"
+    assert transaction["activation"]["state"] == "pending"
@@ -0,0 +1,226 @@
+"""
+Agregados de estatísticas por usuário para ZenPress
+Um documento por usuário em ``user_stats``, atualizado atomicamente a cada sessão
+
+Uso:
+    python user_stats.py backfill    # reconstrói os agregados a partir de ``sessions``
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne, UpdateOne
+
+from database import database
+from streaks import activity_masks, bit_updates, current_streak, day_index, longest_streak, resolve_timezone
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 500
+COMPLAINT_KEY_PREFIX = "c:"
+
+
+def complaint_key(complaint: str) -> str:
+    """Converte a queixa em um nome de campo seguro para o MongoDB ('.' e '$')"""
+    escaped = complaint.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+    return COMPLAINT_KEY_PREFIX + escaped
+
+
+def complaint_name(key: str) -> str:
+    escaped = key[len(COMPLAINT_KEY_PREFIX):]
+    return escaped.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+
+def session_increments(sessions: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """Soma as contribuições de um lote de sessões em um único documento $inc"""
+    increments: Dict[str, int] = {}
+
+    def add(field: str, value: int) -> None:
+        increments[field] = increments.get(field, 0) + value
+
+    for session in sessions:
+        add("total_sessions", 1)
+        add("total_duration", session.get("duration") or 0)
+        if session.get("rating"):
+            add("rating_sum", session["rating"])
+            add("rating_count", 1)
+        add(f"complaints.{complaint_key(session.get('complaint') or '')}", 1)
+    return increments
+
+
+async def record_sessions(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    sessions: List[Dict[str, Any]],
+    timezone_name: str = "UTC",
+) -> None:
+    """
+    Aplica as sessões recém-criadas ao agregado do usuário (uma única escrita)
+    Contadores via $inc e dias ativos via $bit no bitmap de atividade
+    """
+    if not sessions:
+        return
+    tz = resolve_timezone(timezone_name)
+    masks = activity_masks(day_index(session["date"], tz) for session in sessions)
+    await db.user_stats.update_one(
+        {"_id": user_id},
+        {
+            "$inc": session_increments(sessions),
+            "$bit": bit_updates(masks),
+            "$max": {"last_session_at": max(session["date"] for session in sessions)},
+            "$set": {"updated_at": datetime.utcnow()},
+        },
+        upsert=True,
+    )
+
+
+async def get_user_stats_document(db: AsyncIOMotorDatabase, user_id: str) -> Optional[Dict[str, Any]]:
+    return await db.user_stats.find_one({"_id": user_id})
+
+
+def summarize(document: Optional[Dict[str, Any]], timezone_name: str = "UTC") -> Dict[str, Any]:
+    """Converte o agregado nos campos expostos por /users/stats"""
+    if not document or not document.get("total_sessions"):
+        return {
+            "total_sessions": 0,
+            "avg_rating": 0.0,
+            "most_used_complaint": "",
+            "total_time_practiced": 0,
+            "streak_days": 0,
+            "longest_streak_days": 0,
+        }
+
+    rating_count = document.get("rating_count", 0)
+    avg_rating = document.get("rating_sum", 0) / rating_count if rating_count else 0.0
+
+    complaints = document.get("complaints") or {}
+    most_used_complaint = complaint_name(max(complaints.items(), key=lambda x: x[1])[0]) if complaints else ""
+
+    activity = document.get("activity") or {}
+    today = day_index(datetime.utcnow(), resolve_timezone(timezone_name))
+
+    return {
+        "total_sessions": document["total_sessions"],
+        "avg_rating": round(avg_rating, 1),
+        "most_used_complaint": most_used_complaint,
+        "total_time_practiced": document.get("total_duration", 0),
+        "streak_days": current_streak(activity, today),
+        "longest_streak_days": longest_streak(activity),
+    }
+
+
+async def backfill(db: AsyncIOMotorDatabase, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    Reconstrói ``user_stats`` a partir da coleção ``sessions``
+    Deve rodar com pouco tráfego: sessões gravadas durante a reconstrução de um
+    usuário podem ser sobrescritas pelo valor recalculado
+    """
+    pipeline = [
+        {"$group": {
+            "_id": {"user_id": "$user_id", "complaint": "$complaint"},
+            "count": {"$sum": 1},
+            "duration": {"$sum": {"$ifNull": ["$duration", 0]}},
+            "rating_sum": {"$sum": {"$cond": [{"$gt": ["$rating", 0]}, "$rating", 0]}},
+            "rating_count": {"$sum": {"$cond": [{"$gt": ["$rating", 0]}, 1, 0]}},
+            "last_session_at": {"$max": "$date"},
+        }},
+        {"$sort": {"_id.user_id": 1}},
+    ]
+
+    rebuilt = 0
+    operations: List[ReplaceOne] = []
+    current: Optional[Dict[str, Any]] = None
+
+    async def flush() -> None:
+        if operations:
+            await db.user_stats.bulk_write(operations, ordered=False)
+            operations.clear()
+
+    def finish(document: Optional[Dict[str, Any]]) -> None:
+        nonlocal rebuilt
+        if document is not None:
+            operations.append(ReplaceOne({"_id": document["_id"]}, document, upsert=True))
+            rebuilt += 1
+
+    async for group in db.sessions.aggregate(pipeline, allowDiskUse=True):
+        user_id = group["_id"]["user_id"]
+        if current is None or current["_id"] != user_id:
+            finish(current)
+            if len(operations) >= batch_size:
+                await flush()
+            current = {
+                "_id": user_id,
+                "total_sessions": 0,
+                "total_duration": 0,
+                "rating_sum": 0,
+                "rating_count": 0,
+                "complaints": {},
+                "last_session_at": None,
+                "updated_at": datetime.utcnow(),
+            }
+        current["total_sessions"] += group["count"]
+        current["total_duration"] += group["duration"]
+        current["rating_sum"] += group["rating_sum"]
+        current["rating_count"] += group["rating_count"]
+        if group["last_session_at"]:
+            current["last_session_at"] = max(filter(None, (current["last_session_at"], group["last_session_at"])))
+        key = complaint_key(group["_id"].get("complaint") or "")
+        current["complaints"][key] = current["complaints"].get(key, 0) + group["count"]
+
+    finish(current)
+    await flush()
+    await backfill_activity(db, batch_size)
+    return rebuilt
+
+
+async def backfill_activity(db: AsyncIOMotorDatabase, batch_size: int = BACKFILL_BATCH_SIZE) -> None:
+    """Reconstrói o bitmap de dias ativos percorrendo as sessões por usuário"""
+    timezones = {}
+    async for user in db.users.find({"timezone": {"$nin": [None, "UTC"]}}, {"id": 1, "timezone": 1}):
+        timezones[user["id"]] = user["timezone"]
+
+    operations: List[UpdateOne] = []
+    user_id: Optional[str] = None
+    days: set = set()
+
+    def finish() -> None:
+        if user_id is not None:
+            masks = activity_masks(days)
+            operations.append(UpdateOne({"_id": user_id}, {"$set": {"activity": masks}}))
+
+    cursor = db.sessions.find({}, {"_id": 0, "user_id": 1, "date": 1}).sort("user_id", 1).batch_size(batch_size)
+    async for session in cursor:
+        if session["user_id"] != user_id:
+            finish()
+            if len(operations) >= batch_size:
+                await db.user_stats.bulk_write(operations, ordered=False)
+                operations.clear()
+            user_id = session["user_id"]
+            tz = resolve_timezone(timezones.get(user_id))
+            days = set()
+        days.add(day_index(session["date"], tz))
+
+    finish()
+    if operations:
+        await db.user_stats.bulk_write(operations, ordered=False)
+
+
+async def main(command: str) -> None:
+    db = database.get_db()
+    try:
+        if command == "backfill":
+            rebuilt = await backfill(db)
+            print(f"✅ Agregados reconstruídos para {rebuilt} usuários")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agregados de estatísticas por usuário")
+    parser.add_argument("command", choices=["backfill"])
+    args = parser.parse_args()
+    asyncio.run(main(args.command))
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends, status
-from stripe_mock import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
+from stripe_gateway import CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest, create_stripe_checkout
 from payment_models import *
 from auth import get_current_user
 from models import UserResponse
@@ -13,15 +13,16 @@ db_name = os.environ.get('DB_NAME', 'test_database')
 client = AsyncIOMotorClient(mongo_url)
 db = client[db_name]
 
-# Initialize Stripe
+# Initialize Stripe (pooled async client)
 stripe_api_key = os.environ.get("STRIPE_API_KEY")
-if not stripe_api_key:
-    raise ValueError("STRIPE_API_KEY environment variable is required")
+stripe_checkout = create_stripe_checkout(stripe_api_key)
 
-stripe_checkout = StripeCheckout(api_key=stripe_api_key)
-
-# Create router
-payments_router = APIRouter(prefix="/api/payments/v1", tags=["payments"])
+# Create router; the app that mounts it closes the Stripe client on shutdown
+payments_router = APIRouter(
+    prefix="/api/payments/v1",
+    tags=["payments"],
+    on_shutdown=[stripe_checkout.close]
+)
 
 @payments_router.post("/checkout/session", response_model=CheckoutSessionResponse)
 async def create_checkout_session(
@@ -0,0 +1,76 @@
+"""
+Local Stripe fake for ZenPress
+FakeStripeServer: in-memory Checkout Sessions API, plugged into the gateway
+through httpx.MockTransport (STRIPE_FAKE=true)
+"""
+
+import asyncio
+import uuid
+from typing import Any, Dict
+from urllib.parse import parse_qsl
+
+import httpx
+
+
+class FakeStripeServer:
+    """
+    Checkout Sessions endpoints backed by a dict; honours Idempotency-Key like
+    Stripe (same key, same session). ``latency`` simulates a slow Stripe and
+    ``fail_next`` makes the next N calls answer 503
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.fail_next = 0
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.idempotency: Dict[str, str] = {}
+        self.calls = 0
+
+    def complete(self, session_id: str, payment_status: str = "paid") -> Dict[str, Any]:
+        """Simulate the customer finishing the hosted checkout"""
+        session = self.sessions[session_id]
+        session.update({"status": "complete", "payment_status": payment_status})
+        return session
+
+    def _create(self, request: httpx.Request) -> Dict[str, Any]:
+        key = request.headers.get("idempotency-key")
+        if key in self.idempotency:
+            return self.sessions[self.idempotency[key]]
+        fields = dict(parse_qsl(request.content.decode()))
+        session_id = f"cs_test_{uuid.uuid4().hex[:24]}"
+        session = {
+            "id": session_id,
+            "object": "checkout.session",
+            "url": f"https://checkout.stripe.test/c/pay/{session_id}",
+            "status": "open",
+            "payment_status": "unpaid",
+            "amount_total": int(fields.get("line_items[0][price_data][unit_amount]", 0)),
+            "currency": fields.get("line_items[0][price_data][currency]", "brl"),
+            "metadata": {
+                name[len("metadata["):-1]: value for name, value in fields.items() if name.startswith("metadata[")
+            },
+            "success_url": fields.get("success_url"),
+            "cancel_url": fields.get("cancel_url"),
+        }
+        self.sessions[session_id] = session
+        if key:
+            self.idempotency[key] = session_id
+        return session
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            return httpx.Response(503, json={"error": {"message": "Fake Stripe unavailable"}})
+
+        path = request.url.path
+        if request.method == "POST" and path == "/v1/checkout/sessions":
+            return httpx.Response(200, json=self._create(request))
+        if request.method == "GET" and path.startswith("/v1/checkout/sessions/"):
+            session = self.sessions.get(path.rsplit("/", 1)[-1])
+            if session is not None:
+                return httpx.Response(200, json=session)
+            return httpx.Response(404, json={"error": {"message": "No such checkout.session"}})
+        return httpx.Response(404, json={"error": {"message": f"Unrecognized request URL ({path})"}})